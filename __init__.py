@@ -1,32 +1,39 @@
 """Callisto memory database module for Jupiter AI."""
-from .db import db
+from .db import db, RetryPolicy
 from .models import (
     User, Platform, UserPlatform,
     KnowledgeCategory, UserKnowledge,
     Conversation, Message, ExtractionJob
 )
 from .api import api
+from .metrics import metrics
+from .records import UserRecord, ConversationRecord, MessageRecord, ContextMessageRecord, KnowledgeRecord
 from .security import sanitize_input, validate_uuid, secure_delete
 from .knowledge import KnowledgeManager
 from .categories import CategoryManager
 from .conversations import ConversationManager
+from .async_db import AsyncDatabase
+from .async_api import AsyncCallistoAPI
+from .sharding import ShardRouter
 
 __all__ = [
-    'db', 'initialize', 'api',
+    'db', 'initialize', 'api', 'metrics', 'RetryPolicy',
     'User', 'Platform', 'UserPlatform',
     'KnowledgeCategory', 'UserKnowledge',
     'Conversation', 'Message', 'ExtractionJob',
+    'UserRecord', 'ConversationRecord', 'MessageRecord', 'ContextMessageRecord', 'KnowledgeRecord',
     'sanitize_input', 'validate_uuid', 'secure_delete',
     'KnowledgeManager', 'CategoryManager',
-    'ConversationManager'
+    'ConversationManager',
+    'AsyncDatabase', 'AsyncCallistoAPI', 'ShardRouter'
 ]
 
-def initialize(db_path=None):
+def initialize(db_path=None, profile=None):
     """Initialize Callisto database."""
-    if db_path:
-        global db
-        from .db import Database
-        db = Database(db_path)
+    if db_path or profile:
+        # Reopen the shared instance so every module sees the new database
+        from .db import DEFAULT_PROFILE
+        db.configure(db_path, profile or DEFAULT_PROFILE)
     
     # Create tables
     db.init_db()
@@ -35,6 +42,6 @@ def initialize(db_path=None):
     db.init_default_data()
     
     # Add default categories
-    CategoryManager.create_default_categories()
+    CategoryManager(db).create_default_categories()
     
     return db
\ No newline at end of file
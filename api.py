@@ -1,13 +1,20 @@
 """Core API for interacting with the Callisto memory database."""
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 import json
-from typing import Dict, List, Optional, Any, Union
+import uuid
+from typing import Dict, Iterator, List, Optional, Any, Sequence, Union
 
-from .db import db
+from sqlalchemy import case, event, false, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .db import Database, db
 from .models import (
     User, Platform, UserPlatform, 
     KnowledgeCategory, UserKnowledge,
-    Conversation, Message, ExtractionJob
+    Conversation, Message, ExtractionJob, Embedding
 )
 from .interfaces import CallistoAPIInterface
 from .validation import (
@@ -17,36 +24,259 @@ from .validation import (
 from .security import sanitize_input, validate_uuid, secure_delete
 from .knowledge import KnowledgeManager
 from .categories import CategoryManager
-from .conversations import ConversationManager
+from .conversations import CONVERSATION_COLUMNS, ConversationManager, Cursor
+from .counters import message_preview
+from .embeddings import KINDS, SemanticIndex
+from . import embeddings, identity_cache, profile_cache, reference_cache
+from .tokens import count_tokens
+from .group_commit import GroupCommitWriter
+from .write_buffer import WriteBehindBuffer
+from .metrics import metrics
+from .records import ConversationRecord, ContextMessageRecord, KnowledgeRecord, MessageRecord, UserRecord
 
+@metrics.instrument(exclude=("transaction", "enable_group_commit", "disable_group_commit",
+                             "enable_write_buffer", "disable_write_buffer", "configure_semantic_search",
+                             "iter_conversation_history", "configure_identity_cache", "identity_cache_stats",
+                             "configure_knowledge_cache"))
 class CallistoAPI(CallistoAPIInterface):
     """Main API for Jupiter to interact with Callisto memory system."""
     
+    def __init__(self, database: Optional[Database] = None):
+        """Create an API over a database or ShardRouter (the shared db by default)."""
+        self.db = database if database is not None else db
+        self.knowledge = KnowledgeManager(self.db)
+        self.categories = CategoryManager(self.db)
+        self.conversations = ConversationManager(self.db)
+        
+        # Background writers, one per database file, created on first use
+        self._group_commit_options = None
+        self._message_writers: Dict[Database, GroupCommitWriter] = {}
+        self._write_buffer_options = None
+        self._write_buffers: Dict[Database, WriteBehindBuffer] = {}
+    
+    # GROUP COMMIT
+    
+    def enable_group_commit(self, max_batch: int = 256, max_delay: float = 0.005,
+                          max_queue: int = 10000) -> None:
+        """Route add_message through a background writer that batches commits.
+        
+        While enabled, add_message returns a Future that resolves once the
+        message is committed. Messages still in flight are not yet visible to
+        reads; call flush_messages() first when that matters.
+        """
+        if self._group_commit_options is None:
+            self._group_commit_options = {"max_batch": max_batch, "max_delay": max_delay, "max_queue": max_queue}
+    
+    def disable_group_commit(self) -> None:
+        """Commit any queued messages and go back to one transaction per call."""
+        self._group_commit_options = None
+        for writer in self._message_writers.values():
+            writer.close()
+        self._message_writers.clear()
+    
+    def flush_messages(self) -> None:
+        """Block until all queued messages have been committed."""
+        for writer in list(self._message_writers.values()):
+            writer.flush()
+    
+    def _message_writer(self, database: Database) -> Optional[GroupCommitWriter]:
+        """Return the group-commit writer for a database file, if group commit is on."""
+        if self._group_commit_options is None or database.active_session() is not None:
+            return None
+        writer = self._message_writers.get(database)
+        if writer is None:
+            writer = self._message_writers.setdefault(
+                database, GroupCommitWriter(database, self._add_message, **self._group_commit_options))
+        return writer
+    
+    # WRITE-BEHIND BUFFER
+    
+    def enable_write_buffer(self, max_entries: int = 10000, spill_path: Optional[str] = None,
+                          retry_interval: float = 0.5, max_wait: float = 0.5) -> None:
+        """Keep accepting writes while the database is locked or unreachable.
+        
+        add_message, store_conversation and store_knowledge then buffer any
+        write the database cannot take within ``max_wait`` seconds, or rejects
+        as unavailable, and replay it, in order, once the database recovers.
+        Reads through this API include buffered writes. Group commit, when
+        also enabled, still takes add_message. With a sharded database each
+        shard gets its own buffer, spilling to ``spill_path`` plus the shard
+        number.
+        """
+        if self._write_buffer_options is None:
+            self._write_buffer_options = {
+                "max_entries": max_entries, "spill_path": spill_path,
+                "retry_interval": retry_interval, "max_wait": max_wait,
+            }
+            # Pick up writes spilled before a restart
+            if spill_path:
+                for shard in self.db.shards:
+                    self._write_buffer(shard)
+    
+    def disable_write_buffer(self) -> None:
+        """Stop buffering; anything still queued is kept in the spill file, if any."""
+        self._write_buffer_options = None
+        for buffer in self._write_buffers.values():
+            buffer.flush(timeout=0)
+            buffer.close()
+        self._write_buffers.clear()
+    
+    def flush_write_buffer(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every buffered write has been replayed."""
+        return all([buffer.flush(timeout) for buffer in list(self._write_buffers.values())])
+    
+    def _write_buffer(self, database: Database) -> Optional[WriteBehindBuffer]:
+        """Return the write-behind buffer for a database file, if buffering is on."""
+        if self._write_buffer_options is None or database.active_session() is not None:
+            return None
+        buffer = self._write_buffers.get(database)
+        if buffer is None:
+            options = dict(self._write_buffer_options)
+            if options["spill_path"] and len(self.db.shards) > 1:
+                options["spill_path"] += f".{self.db.shards.index(database)}"
+            buffer = self._write_buffers.setdefault(database, WriteBehindBuffer(
+                database, {
+                    "add_message": self._add_message,
+                    "store_conversation": self._store_conversation,
+                    "store_knowledge": KnowledgeManager._store_knowledge,
+                },
+                **options
+            ))
+        return buffer
+    
+    def _pending_writes(self, kind: Optional[str] = None) -> List[tuple]:
+        """Return writes still waiting in any write-behind buffer."""
+        pending = []
+        for buffer in list(self._write_buffers.values()):
+            pending.extend(buffer.pending(kind))
+        return pending
+    
+    # UNIT OF WORK
+    
+    @contextmanager
+    def transaction(self, user_id: Optional[str] = None) -> Iterator["CallistoAPI"]:
+        """Run several API calls in one transaction.
+        
+        Usage::
+            
+            with api.transaction() as tx:
+                conversation_id = tx.start_conversation(user_id, "discord")
+                tx.add_message(conversation_id, "Hello", True)
+                tx.end_conversation(conversation_id)
+        
+        Every call made from this thread inside the block shares one session
+        and the block commits once on exit, or rolls back if anything raises.
+        A sharded database needs the user_id to pick the shard; calls for
+        other users, and category changes, are not part of the transaction.
+        """
+        with self.db.for_user(user_id).transaction():
+            yield self
+    
     # USER MANAGEMENT
     
-    def get_user(self, platform_name: str, platform_username: str) -> Optional[User]:
+    def get_user(self, platform_name: str, platform_username: str) -> Optional[UserRecord]:
         """Find a user by platform and username."""
         platform_name = sanitize_input(platform_name)
         platform_username = sanitize_input(platform_username)
+        return self._resolve_user(platform_name, platform_username=platform_username)
+    
+    def get_user_by_platform_id(self, platform_name: str, platform_specific_id: str) -> Optional[UserRecord]:
+        """Find a user by platform and the platform's own ID for them."""
+        platform_name = sanitize_input(platform_name)
+        platform_specific_id = sanitize_input(platform_specific_id)
+        return self._resolve_user(platform_name, platform_specific_id=platform_specific_id)
+    
+    def configure_identity_cache(self, max_entries: int = identity_cache.MAX_ENTRIES,
+                                 ttl: float = identity_cache.TTL,
+                                 negative_ttl: float = identity_cache.NEGATIVE_TTL) -> None:
+        """Size the cache behind get_user and get_user_by_platform_id (0 turns it off).
         
-        with db.session() as session:
-            # Find platform
-            platform = session.query(Platform).filter_by(platform_name=platform_name).first()
-            if not platform:
-                return None
-                
-            # Find user via platform
-            user_platform = (session.query(UserPlatform)
-                .filter_by(platform_id=platform.platform_id, platform_username=platform_username)
-                .first())
-            
-            if not user_platform:
-                return None
-                
-            return session.query(User).filter_by(user_id=user_platform.user_id).first()
+        Known users are cached for ttl seconds and unknown identities for
+        negative_ttl. Every write made through this process invalidates the
+        entries it affects at once; the TTLs bound how long changes made by
+        other processes, and ``last_seen``, can lag.
+        """
+        self.db.reference.identity_cache.configure(max_entries, ttl, negative_ttl)
+    
+    def identity_cache_stats(self) -> Dict[str, Any]:
+        """Return the size and hit rate of the identity cache."""
+        return self.db.reference.identity_cache.stats()
+    
+    def _resolve_user(self, platform_name: str, platform_username: Optional[str] = None,
+                      platform_specific_id: Optional[str] = None) -> Optional[UserRecord]:
+        """Find a user by one platform identity, through the identity cache."""
+        reference = self.db.reference
+        cache = reference.identity_cache
+        [key] = identity_cache.identity_keys(platform_name, platform_username, platform_specific_id)
+        # A unit of work may hold uncommitted identities, so it bypasses the cache
+        use_cache = all(shard.active_session() is None for shard in self.db.shards)
+        if use_cache:
+            user = cache.get(key)
+            if user is not identity_cache.MISSING:
+                return user
+            generation = cache.generation
+        
+        user = None
+        with reference.read_session() as session:
+            user_id = self._find_user_id(session, platform_name, platform_username, platform_specific_id)
+            shard = self.db.for_user(user_id) if user_id is not None else None
+            if shard is reference:
+                user = self._select_user(session, user_id)
+        
+        if shard is not None and shard is not reference:
+            # Users live in their shard; the platform mapping is global
+            with shard.read_session() as session:
+                user = self._select_user(session, user_id)
+        
+        if use_cache:
+            cache.put(key, user, generation)
+        return user
+    
+    @staticmethod
+    def _get_user(session: Session, platform_name: str, platform_username: str) -> Optional[UserRecord]:
+        """Find a user by platform and username within an existing session."""
+        user_id = CallistoAPI._find_user_id(session, platform_name, platform_username)
+        if user_id is None:
+            return None
+        return CallistoAPI._select_user(session, user_id)
+    
+    @staticmethod
+    def _get_user_by_platform_id(session: Session, platform_name: str,
+                                 platform_specific_id: str) -> Optional[UserRecord]:
+        """Find a user by platform and the platform's own ID within an existing session."""
+        user_id = CallistoAPI._find_user_id(session, platform_name, platform_specific_id=platform_specific_id)
+        if user_id is None:
+            return None
+        return CallistoAPI._select_user(session, user_id)
+    
+    @staticmethod
+    def _select_user(session: Session, user_id: str) -> Optional[UserRecord]:
+        """Read a user as a record."""
+        columns = [getattr(User, name) for name in UserRecord._fields]
+        row = session.execute(select(*columns).where(User.user_id == user_id)).first()
+        return UserRecord(*row) if row is not None else None
+    
+    @staticmethod
+    def _find_user_id(session: Session, platform_name: str, platform_username: Optional[str] = None,
+                      platform_specific_id: Optional[str] = None) -> Optional[str]:
+        """Return the ID of the user with a platform username (or platform-specific ID), if any."""
+        # Find platform
+        platform_id = reference_cache.platform_id(session, platform_name)
+        if platform_id is None:
+            return None
+        
+        # Find user via platform
+        query = session.query(UserPlatform).filter_by(platform_id=platform_id)
+        if platform_username is not None:
+            query = query.filter_by(platform_username=platform_username)
+        else:
+            query = query.filter_by(platform_specific_id=platform_specific_id)
+        user_platform = query.first()
+        
+        return user_platform.user_id if user_platform else None
     
     def create_user(self, name: str, platform_name: str, platform_username: str, 
-                   platform_specific_id: Optional[str] = None) -> User:
+                   platform_specific_id: Optional[str] = None) -> UserRecord:
         """Create a new user with platform association."""
         # Validate inputs
         UserCreateModel(
@@ -62,138 +292,249 @@ class CallistoAPI(CallistoAPIInterface):
         platform_username = sanitize_input(platform_username)
         platform_specific_id = sanitize_input(platform_specific_id) if platform_specific_id else None
         
-        with db.session() as session:
-            # Find or create platform
-            platform = session.query(Platform).filter_by(platform_name=platform_name).first()
-            if not platform:
-                platform = Platform(platform_name=platform_name)
-                session.add(platform)
-                session.flush()
-            
-            # Create user
-            user = User.create(name=name, metadata=metadata)
-            session.add(user)
-            session.flush()
-            
-            # Create platform association
-            now = int(datetime.now().timestamp())
-            user_platform = UserPlatform(
-                user_id=user.user_id,
-                platform_id=platform.platform_id,
-                platform_username=platform_username,
-                platform_specific_id=platform_specific_id,
-                last_active=now
-            )
-            session.add(user_platform)
-            
-            return user
+        # The ID picks the shard, so it is chosen before opening the session
+        user_id = str(uuid.uuid4())
+        with self.db.for_user(user_id).session() as session:
+            return self._create_user(session, name, platform_name, platform_username, platform_specific_id,
+                                     user_id=user_id)
+    
+    @staticmethod
+    def _create_user(session: Session, name: str, platform_name: str, platform_username: str,
+                    platform_specific_id: Optional[str] = None, user_id: Optional[str] = None) -> UserRecord:
+        """Create a new user within an existing session."""
+        # Find or create platform
+        platform_id = CallistoAPI._get_or_create_platform_id(session, platform_name)
+        
+        # Create user
+        user = User.create(name=name)
+        if user_id:
+            user.user_id = user_id
+        session.add(user)
+        session.flush()
+        
+        # Create platform association
+        CallistoAPI._add_user_platform(session, user.user_id, platform_id, platform_username, platform_specific_id)
+        # Forget the cached "unknown user" for this identity
+        identity_cache.forget(session, identity_cache.identity_keys(
+            platform_name, platform_username, platform_specific_id))
+        
+        return UserRecord.from_object(user)
     
     def update_user(self, user_id: str, name: str) -> None:
         """Update user information."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         name = sanitize_input(name)
         
-        with db.session() as session:
-            user = session.query(User).filter_by(user_id=user_id).first()
-            if user:
-                user.name = name
+        with self.db.for_user(user_id).session() as session:
+            self._update_user(session, user_id, name)
+    
+    @staticmethod
+    def _update_user(session: Session, user_id: str, name: str) -> None:
+        """Update user information within an existing session."""
+        user = session.query(User).filter_by(user_id=user_id).first()
+        if user:
+            user.name = name
+            identity_cache.forget(session, user_id=user_id)
     
     def delete_user(self, user_id: str) -> None:
         """Delete a user and all associated data."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
-        with db.session() as session:
-            # Securely delete personal knowledge
-            knowledge_items = (session.query(UserKnowledge)
-                .join(KnowledgeCategory)
-                .filter(UserKnowledge.user_id == user_id, KnowledgeCategory.is_personal == True)
-                .all())
-                
-            for item in knowledge_items:
-                item.value = secure_delete(item.value)
-                session.add(item)
-            
-            # Delete the user
-            user = session.query(User).filter_by(user_id=user_id).first()
-            if user:
-                session.delete(user)
+        
+        shard = self.db.for_user(user_id)
+        with shard.session() as session:
+            archived = ConversationManager._has_archived(session, user_id)
+            self._delete_user(session, user_id)
+        if archived or shard.archive is not None:
+            shard.open_archive().delete_user(user_id)
+    
+    @staticmethod
+    def _delete_user(session: Session, user_id: str) -> None:
+        """Delete a user and all associated data within an existing session."""
+        # Securely delete personal knowledge
+        knowledge_items = (session.query(UserKnowledge)
+            .join(KnowledgeCategory)
+            .filter(UserKnowledge.user_id == user_id, KnowledgeCategory.is_personal == True)
+            .all())
+        
+        for item in knowledge_items:
+            item.value = secure_delete(item.value)
+            session.add(item)
+        
+        session.query(Embedding).filter_by(user_id=user_id).delete(synchronize_session=False)
+        
+        # Delete the user
+        user = session.query(User).filter_by(user_id=user_id).first()
+        if user:
+            with reference_cache.writer(session) as writer:
+                if writer is not session:
+                    # Platform identities live in the global database; keep the cascade out of it
+                    writer.query(UserPlatform).filter_by(user_id=user_id).delete(synchronize_session=False)
+                    set_committed_value(user, "platforms", [])
+            session.delete(user)
+        identity_cache.forget(session, user_id=user_id)
+        profile_cache.forget(session, user_id)
     
     def link_platform(self, user_id: str, platform_name: str, platform_username: str,
                     platform_specific_id: Optional[str] = None) -> None:
         """Link a user to a platform."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         platform_name = sanitize_input(platform_name)
         platform_username = sanitize_input(platform_username)
         platform_specific_id = sanitize_input(platform_specific_id) if platform_specific_id else None
         
-        with db.session() as session:
-            # Find or create platform
-            platform = session.query(Platform).filter_by(platform_name=platform_name).first()
-            if not platform:
-                platform = Platform(platform_name=platform_name)
-                session.add(platform)
-                session.flush()
+        with self.db.for_user(user_id).session() as session:
+            self._link_platform(session, user_id, platform_name, platform_username, platform_specific_id)
+    
+    @staticmethod
+    def _link_platform(session: Session, user_id: str, platform_name: str, platform_username: str,
+                      platform_specific_id: Optional[str] = None) -> None:
+        """Link a user to a platform within an existing session."""
+        # Find or create platform
+        platform_id = CallistoAPI._get_or_create_platform_id(session, platform_name)
+        
+        # Check if user exists
+        user = session.query(User).filter_by(user_id=user_id).first()
+        if not user:
+            raise ValueError("User not found")
+        
+        # Check if platform link already exists
+        existing = (session.query(UserPlatform)
+            .filter_by(
+                user_id=user_id,
+                platform_id=platform_id,
+                platform_username=platform_username
+            )
+            .first())
+        
+        if not existing:
+            # Create platform association
+            CallistoAPI._add_user_platform(session, user_id, platform_id, platform_username, platform_specific_id)
+            identity_cache.forget(session, identity_cache.identity_keys(
+                platform_name, platform_username, platform_specific_id))
+    
+    @staticmethod
+    def _add_user_platform(session: Session, user_id: str, platform_id: int, platform_username: str,
+                           platform_specific_id: Optional[str] = None) -> None:
+        """Map a platform identity to a user within an existing session.
+        
+        A shard writes the mapping to the global database, where it commits
+        on its own (see reference_cache.writer); it is removed again if the
+        shard's transaction rolls back.
+        """
+        now = int(datetime.now().timestamp())
+        with reference_cache.writer(session) as writer:
+            writer.add(UserPlatform(
+                user_id=user_id,
+                platform_id=platform_id,
+                platform_username=platform_username,
+                platform_specific_id=platform_specific_id,
+                last_active=now
+            ))
+            writer.flush()
+        
+        if writer is not session:
+            reference = writer.info["database"]
             
-            # Check if user exists
-            user = session.query(User).filter_by(user_id=user_id).first()
-            if not user:
-                raise ValueError("User not found")
+            def undo(session):
+                try:
+                    with reference.session() as cleanup:
+                        (cleanup.query(UserPlatform)
+                            .filter_by(user_id=user_id, platform_id=platform_id, platform_username=platform_username)
+                            .delete(synchronize_session=False))
+                except Exception:
+                    # Report the shard's own error; a leftover identity resolves to no user
+                    pass
             
-            # Check if platform link already exists
-            existing = (session.query(UserPlatform)
-                .filter_by(
-                    user_id=user_id,
-                    platform_id=platform.platform_id,
-                    platform_username=platform_username
-                )
-                .first())
-                
-            if not existing:
-                # Create platform association
-                now = int(datetime.now().timestamp())
-                user_platform = UserPlatform(
-                    user_id=user_id,
-                    platform_id=platform.platform_id,
-                    platform_username=platform_username,
-                    platform_specific_id=platform_specific_id,
-                    last_active=now
-                )
-                session.add(user_platform)
+            event.listen(session, "after_rollback", undo, once=True)
+    
+    @staticmethod
+    def _get_or_create_platform_id(session: Session, platform_name: str) -> int:
+        """Return the ID of a platform by name, creating it if it doesn't exist."""
+        platform_id = reference_cache.platform_id(session, platform_name)
+        if platform_id is None:
+            with reference_cache.writer(session) as writer:
+                # Another writer may have created it since the lookup
+                platform_id = reference_cache.platform_id(writer, platform_name)
+                if platform_id is None:
+                    platform = Platform(platform_name=platform_name)
+                    writer.add(platform)
+                    writer.flush()
+                    reference_cache.invalidate(writer)
+                    platform_id = platform.platform_id
+        return platform_id
     
     # KNOWLEDGE MANAGEMENT
     
     def get_user_knowledge(self, user_id: str, category_name: Optional[str] = None, 
-                          include_personal: bool = True, since_timestamp: Optional[int] = None) -> Dict[str, Any]:
+                          include_personal: bool = True,
+                          since_timestamp: Optional[int] = None) -> Dict[str, KnowledgeRecord]:
         """Get all knowledge for a user, with optional filtering."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
         
         if category_name:
             category_name = sanitize_input(category_name)
-            
+        
         # Use knowledge manager for retrieval
         is_personal = None if include_personal else False
-        knowledge = KnowledgeManager.get_knowledge(user_id, category_name, is_personal)
+        knowledge = self.knowledge.get_knowledge(user_id, category_name, is_personal)
+        if self._write_buffers:
+            self._overlay_knowledge(knowledge, user_id, category_name, include_personal)
         
         # Filter by timestamp if provided
         if since_timestamp is not None:
             knowledge = {k: v for k, v in knowledge.items() 
                         if v.get("updated_at", 0) >= since_timestamp}
-            
+        
         return knowledge
     
-    def get_knowledge_by_source(self, user_id: str, source: str) -> Dict[str, Any]:
+    def configure_knowledge_cache(self, max_users: int = profile_cache.MAX_USERS,
+                                  ttl: float = profile_cache.TTL) -> None:
+        """Size the per-shard cache of decoded knowledge profiles (0 turns it off).
+        
+        Knowledge written through this process invalidates the cached
+        profiles it affects at once; ttl bounds how long changes made by
+        other processes can go unseen.
+        """
+        for shard in self.db.shards:
+            shard.profile_cache.configure(max_users, ttl)
+    
+    def _overlay_knowledge(self, knowledge: Dict[str, Any], user_id: str,
+                          category_name: Optional[str], include_personal: bool) -> None:
+        """Apply buffered store_knowledge writes for a user on top of stored knowledge."""
+        entries = [args for _, args in self._pending_writes("store_knowledge") if args[0] == user_id]
+        if not entries:
+            return
+        
+        personal = {c["category_name"] for c in self.categories.get_categories() if c["is_personal"]}
+        now = int(datetime.now().timestamp())
+        for _, category, value, confidence, source in entries:
+            category = sanitize_input(category)
+            if category_name and category != category_name:
+                continue
+            if not include_personal and category in personal:
+                continue
+            current = knowledge.get(category)
+            if current is not None and confidence < current["confidence"]:
+                continue
+            if isinstance(value, str):
+                value = sanitize_input(value)
+            elif isinstance(value, list):
+                value = [sanitize_input(item) if isinstance(item, str) else item for item in value]
+            knowledge[category] = KnowledgeRecord(value, confidence, source, category in personal, now)
+    
+    def get_knowledge_by_source(self, user_id: str, source: str) -> Dict[str, KnowledgeRecord]:
         """Get all knowledge from a specific source."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         source = sanitize_input(source)
-        return KnowledgeManager.get_knowledge_by_source(user_id, source)
+        return self.knowledge.get_knowledge_by_source(user_id, source)
     
     def store_knowledge(self, user_id: str, category_name: str, value: Any, 
                        confidence: float = 1.0, source: str = "user_stated") -> None:
@@ -209,38 +550,43 @@ class CallistoAPI(CallistoAPIInterface):
         
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
+        buffer = self._write_buffer(self.db.for_user(user_id))
+        if buffer is not None:
+            buffer.write("store_knowledge", user_id, category_name, value, confidence, source)
+            return
+        
         # Use knowledge manager for storage
-        KnowledgeManager.store_knowledge(user_id, category_name, value, confidence, source)
+        self.knowledge.store_knowledge(user_id, category_name, value, confidence, source)
     
     def batch_store_knowledge(self, user_id: str, knowledge_items: List[Dict[str, Any]]) -> None:
         """Store multiple knowledge items at once."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         # Use knowledge manager for batch storage
-        KnowledgeManager.batch_store_knowledge(user_id, knowledge_items)
+        self.knowledge.batch_store_knowledge(user_id, knowledge_items)
     
     def delete_knowledge(self, user_id: str, category_name: str) -> None:
         """Delete a piece of knowledge about a user."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         category_name = sanitize_input(category_name)
-        KnowledgeManager.delete_knowledge(user_id, category_name)
+        self.knowledge.delete_knowledge(user_id, category_name)
     
     def merge_knowledge(self, user_id: str, target_user_id: str) -> None:
         """Merge knowledge from target user into this user."""
         if not validate_uuid(user_id) or not validate_uuid(target_user_id):
             raise ValueError("Invalid user ID format")
-            
-        KnowledgeManager.merge_knowledge(user_id, target_user_id)
+        
+        self.knowledge.merge_knowledge(user_id, target_user_id)
     
     # CATEGORY MANAGEMENT
     
     def get_knowledge_categories(self, include_personal: bool = True) -> List[Dict[str, Any]]:
         """Get all knowledge categories."""
-        return CategoryManager.get_categories(include_personal)
+        return self.categories.get_categories(include_personal)
     
     def create_knowledge_category(self, category_name: str, data_type: str, 
                                 is_personal: bool = False) -> bool:
@@ -252,18 +598,18 @@ class CallistoAPI(CallistoAPIInterface):
             is_personal=is_personal
         )
         
-        return CategoryManager.create_category(category_name, data_type, is_personal)
+        return self.categories.create_category(category_name, data_type, is_personal)
     
     def update_knowledge_category(self, category_name: str, data_type: Optional[str] = None,
                                 is_personal: Optional[bool] = None) -> bool:
         """Update an existing knowledge category."""
         category_name = sanitize_input(category_name)
-        return CategoryManager.update_category(category_name, data_type, is_personal)
+        return self.categories.update_category(category_name, data_type, is_personal)
     
     def delete_knowledge_category(self, category_name: str) -> bool:
         """Delete a knowledge category."""
         category_name = sanitize_input(category_name)
-        return CategoryManager.delete_category(category_name)
+        return self.categories.delete_category(category_name)
     
     # CONVERSATION MANAGEMENT
     
@@ -272,65 +618,90 @@ class CallistoAPI(CallistoAPIInterface):
         """Store a complete conversation."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         platform_name = sanitize_input(platform_name)
         
+        shard = self.db.for_user(user_id)
+        if not (conversation_id and validate_uuid(conversation_id)):
+            conversation_id = self.db.new_conversation_id(user_id)
+        elif self.db.for_conversation(conversation_id) is not shard:
+            raise ValueError("Invalid conversation ID: it does not route to the user's shard")
+        
+        buffer = self._write_buffer(shard)
+        if buffer is not None:
+            # Fix the timestamps now in case the write is replayed later
+            now = int(datetime.now().timestamp())
+            messages = [dict(msg, timestamp=msg.get("timestamp", now)) for msg in messages]
+            result = buffer.write("store_conversation", user_id, platform_name, messages, conversation_id)
+            return result or conversation_id
+        
         # Create conversation
-        with db.session() as session:
-            # Find platform
-            platform = session.query(Platform).filter_by(platform_name=platform_name).first()
-            if not platform:
-                platform = Platform(platform_name=platform_name)
-                session.add(platform)
-                session.flush()
+        with shard.session() as session:
+            return self._store_conversation(session, user_id, platform_name, messages, conversation_id)
+    
+    @staticmethod
+    def _store_conversation(session: Session, user_id: str, platform_name: str, 
+                           messages: List[Dict[str, Any]], conversation_id: Optional[str] = None) -> str:
+        """Store a complete conversation within an existing session."""
+        # Find platform
+        platform_id = CallistoAPI._get_or_create_platform_id(session, platform_name)
+        
+        # Create conversation with provided ID or generate one
+        now = int(datetime.now().timestamp())
+        if conversation_id and validate_uuid(conversation_id):
+            # Check if conversation already exists
+            existing = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
+            if existing:
+                return existing.conversation_id
             
-            # Create conversation with provided ID or generate one
-            now = int(datetime.now().timestamp())
-            if conversation_id and validate_uuid(conversation_id):
-                # Check if conversation already exists
-                existing = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
-                if existing:
-                    return existing.conversation_id
-                    
-                conv = Conversation(
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    platform_id=platform.platform_id,
-                    started_at=now
-                )
-            else:
-                conv = Conversation.create(user_id, platform.platform_id)
-                
-            session.add(conv)
-            session.flush()
+            conv = Conversation(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                platform_id=platform_id,
+                started_at=now
+            )
+        else:
+            conv = Conversation.create(user_id, platform_id)
+        
+        session.add(conv)
+        session.flush()
+        
+        # Add messages
+        added = []
+        for msg in messages:
+            content = sanitize_input(msg.get("content", ""))
+            is_from_user = msg.get("is_from_user", True)
+            timestamp = msg.get("timestamp", now)
             
-            # Add messages
-            for msg in messages:
-                content = sanitize_input(msg.get("content", ""))
-                is_from_user = msg.get("is_from_user", True)
-                timestamp = msg.get("timestamp", now)
-                
-                message = Message(
-                    conversation_id=conv.conversation_id,
-                    is_from_user=is_from_user,
-                    content=content,
-                    timestamp=timestamp
-                )
-                session.add(message)
+            message = Message(
+                conversation_id=conv.conversation_id,
+                is_from_user=is_from_user,
+                content=content,
+                timestamp=timestamp
+            )
+            session.add(message)
+            added.append(message)
             
-            # Update user last seen
-            user = session.query(User).filter_by(user_id=user_id).first()
-            if user:
-                user.last_seen = now
-                
-            return conv.conversation_id
+            # Later messages win ties, as in history order
+            if conv.last_message_at is None or timestamp >= conv.last_message_at:
+                conv.last_message_at = timestamp
+                conv.last_message_preview = message_preview(content)
+        conv.message_count = len(messages)
+        embeddings.index_messages(session, user_id, added)
+        
+        # Update user last seen
+        user = session.query(User).filter_by(user_id=user_id).first()
+        if user:
+            user.last_seen = now
+        
+        return conv.conversation_id
     
     def batch_store_conversations(self, user_id: str, platform_name: str, 
                                 conversations: List[Dict[str, Any]]) -> List[str]:
         """Store multiple conversations in batch."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         platform_name = sanitize_input(platform_name)
         conversation_ids = []
         
@@ -345,94 +716,280 @@ class CallistoAPI(CallistoAPIInterface):
                 conversation_id=conversation_id
             )
             conversation_ids.append(conv_id)
-            
+        
         return conversation_ids
     
-    def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+    def get_conversation_history(self, conversation_id: str) -> List[MessageRecord]:
         """Get all messages in a conversation."""
         if not validate_uuid(conversation_id):
             raise ValueError("Invalid conversation ID format")
-            
-        return ConversationManager.get_conversation_history(conversation_id)
+        
+        history = self.conversations.get_conversation_history(conversation_id)
+        if self._write_buffers:
+            history.extend(self._buffered_messages(conversation_id))
+        return history
+    
+    def get_conversation_history_page(self, conversation_id: str, limit: int = 50,
+                                      before: Optional[Cursor] = None,
+                                      after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Get up to limit consecutive messages of a conversation, oldest first.
+        
+        Messages are ordered by (timestamp, message_id), which is also the
+        cursor: with neither ``before`` nor ``after`` the latest page is
+        returned; pass (timestamp, message_id) of the first message of a
+        page as ``before`` to page backwards, or of the last as ``after`` to
+        page forwards. Messages still in the write buffer are not included.
+        """
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        if limit < 1:
+            raise ValueError("Invalid limit: must be at least 1")
+        for cursor in (before, after):
+            if cursor is not None and len(cursor) != 2:
+                raise ValueError("Invalid cursor: must be (timestamp, message_id)")
+        
+        return self.conversations.get_history_page(conversation_id, limit, before, after)
+    
+    def get_context_window(self, conversation_id: str, max_tokens: int,
+                           max_messages: Optional[int] = None) -> List[ContextMessageRecord]:
+        """Get the most recent messages of a conversation that fit in max_tokens.
+        
+        Walks back from the newest message and stops at the first one that
+        would overflow the budget (or after max_messages), so the result is
+        always a contiguous tail of the history. Messages come back oldest
+        first, each with its ``token_count`` as counted by the tokenizer set
+        in tokens.py.
+        """
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        if max_tokens < 1:
+            raise ValueError("Invalid max_tokens: must be at least 1")
+        if max_messages is not None and max_messages < 1:
+            raise ValueError("Invalid max_messages: must be at least 1")
+        
+        # Buffered messages are the newest, so they are the first to fit
+        pending = []
+        if self._write_buffers:
+            for message in reversed(self._buffered_messages(conversation_id)):
+                tokens = count_tokens(message["content"])
+                if tokens > max_tokens or len(pending) == max_messages:
+                    return pending[::-1]
+                max_tokens -= tokens
+                pending.append(ContextMessageRecord(*message.values(), tokens))
+            if max_messages is not None:
+                max_messages -= len(pending)
+        
+        return self.conversations.get_context_window(conversation_id, max_tokens, max_messages) + pending[::-1]
+    
+    def iter_conversation_history(self, conversation_id: str, batch_size: int = 500) -> Iterator[MessageRecord]:
+        """Stream every message of a conversation, oldest first.
+        
+        Rows are fetched batch_size at a time, so memory stays flat however
+        long the conversation is. Messages still in the write buffer are not
+        included.
+        """
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        if batch_size < 1:
+            raise ValueError("Invalid batch_size: must be at least 1")
+        
+        return self.conversations.iter_conversation_history(conversation_id, batch_size)
+    
+    def search_messages(self, user_id: str, query: str, limit: int = 20,
+                        since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Find a user's messages matching every word of query.
+        
+        Returns the best matches first, each with its conversation ID,
+        timestamp, a snippet with the matched terms in [brackets] and a
+        relevance score. A trailing * on a word matches any word starting
+        with it; ``since`` limits results to messages sent at or after that
+        timestamp. Archived conversations are not searched.
+        """
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        if limit < 1:
+            raise ValueError("Invalid limit: must be at least 1")
+        
+        # Stored content is sanitized, so the query must be too for its terms to match
+        return self.conversations.search_messages(user_id, sanitize_input(query), limit, since)
+    
+    def semantic_search(self, user_id: str, text: str, k: int = 10,
+                        kinds: Sequence[str] = KINDS) -> List[Dict[str, Any]]:
+        """Find the k messages and knowledge items of a user closest in meaning to text.
+        
+        Results come best first, each with its ``kind`` ("message" or
+        "knowledge"), a similarity ``score`` and the item's fields. Only
+        reads: items are embedded as they are written, once
+        configure_semantic_search() has been called. Messages still in the
+        write buffer or in archived conversations are not searched.
+        """
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        if k < 1:
+            raise ValueError("Invalid k: must be at least 1")
+        if not kinds or any(kind not in KINDS for kind in kinds):
+            raise ValueError(f"Invalid kinds: must be some of {', '.join(KINDS)}")
+        
+        return self._semantic_index(self.db.for_user(user_id)).search(user_id, text, k, kinds)
+    
+    def configure_semantic_search(self, embedder=None, nprobe: int = 4) -> None:
+        """Turn on semantic search, setting the embedder and the number of cells each search scans.
+        
+        The embedder is a callable mapping a list of texts to vectors, with
+        ``name`` and ``dimensions`` attributes (see embeddings.py); by
+        default a local HashingEmbedder is used. From then on messages and
+        knowledge are embedded in the transaction that writes them. This
+        call first embeds whatever is not embedded yet, or was embedded by a
+        different embedder, which reads every item: call it once at startup,
+        not per request.
+        """
+        if nprobe < 1:
+            raise ValueError("Invalid nprobe: must be at least 1")
+        for shard in self.db.shards:
+            index = SemanticIndex(shard, embedder, nprobe)
+            index.sync()
+            shard.semantic_index = index
+    
+    def train_semantic_partitions(self, cells: int = 64, sample: int = 10000) -> int:
+        """Split each database's embeddings into cells.
+        
+        Searches then scan only the cells nearest the query rather than all
+        of a user's embeddings; items written later join the nearest cell.
+        Returns the total number of cells.
+        """
+        total = 0
+        for shard in self.db.shards:
+            total += self._semantic_index(shard).train_partitions(cells, sample)
+        return total
+    
+    def _semantic_index(self, database: Database) -> SemanticIndex:
+        """Return the semantic index of a database file."""
+        if database.semantic_index is None:
+            raise RuntimeError("Semantic search is off; call configure_semantic_search() first")
+        return database.semantic_index
+    
+    def _buffered_messages(self, conversation_id: str) -> List[MessageRecord]:
+        """Return messages for a conversation that are still in the write buffer."""
+        messages = []
+        for kind, args in self._pending_writes():
+            if kind == "add_message" and args[0] == conversation_id:
+                messages.append(MessageRecord(None, args[2], args[1], args[3]))
+            elif kind == "store_conversation" and args[3] == conversation_id:
+                messages.extend(MessageRecord(
+                    None, msg.get("is_from_user", True), sanitize_input(msg.get("content", "")), msg["timestamp"]
+                ) for msg in args[2])
+        return messages
     
     def get_recent_conversations(self, user_id: str, limit: int = 10, 
                               include_processed: bool = True,
-                              since_timestamp: Optional[int] = None) -> List[Dict[str, Any]]:
+                              since_timestamp: Optional[int] = None) -> List[ConversationRecord]:
         """Get recent conversations for a user with optional filtering."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
-        with db.session() as session:
-            query = session.query(Conversation).filter_by(user_id=user_id)
-            
-            if not include_processed:
-                query = query.filter_by(extracted=False)
-                
-            if since_timestamp is not None:
-                query = query.filter(Conversation.started_at >= since_timestamp)
-                
-            conversations = (query.order_by(Conversation.started_at.desc())
-                           .limit(limit)
-                           .all())
-                
-            return [
-                {
-                    "conversation_id": conv.conversation_id,
-                    "started_at": conv.started_at,
-                    "ended_at": conv.ended_at,
-                    "processed": conv.extracted
-                }
-                for conv in conversations
-            ]
+        
+        with self.db.for_user(user_id).read_session() as session:
+            conversations = self._get_recent_conversations(session, user_id, limit, include_processed, since_timestamp)
+        
+        if self._write_buffers:
+            # Buffered conversations are new and unprocessed
+            known = {conv["conversation_id"] for conv in conversations}
+            for _, args in self._pending_writes("store_conversation"):
+                started_at = min((msg["timestamp"] for msg in args[2]), default=None)
+                if args[0] != user_id or args[3] in known:
+                    continue
+                if since_timestamp is not None and (started_at is None or started_at < since_timestamp):
+                    continue
+                latest = max(reversed(args[2]), key=lambda msg: msg["timestamp"], default=None)
+                conversations.append(ConversationRecord(
+                    conversation_id=args[3], user_id=user_id, started_at=started_at, ended_at=None,
+                    processed=False, message_count=len(args[2]),
+                    last_message_at=latest["timestamp"] if latest else None,
+                    last_message_preview=message_preview(sanitize_input(latest.get("content", "")))
+                                         if latest else None
+                ))
+            conversations.sort(key=lambda conv: conv["started_at"] or 0, reverse=True)
+            conversations = conversations[:limit]
+        
+        return conversations
+    
+    @staticmethod
+    def _get_recent_conversations(session: Session, user_id: str, limit: int = 10, 
+                                 include_processed: bool = True,
+                                 since_timestamp: Optional[int] = None) -> List[ConversationRecord]:
+        """Get recent conversations for a user within an existing session."""
+        query = select(*CONVERSATION_COLUMNS).where(Conversation.user_id == user_id)
+        
+        if not include_processed:
+            # Literal comparison so SQLite can use the partial index
+            query = query.where(Conversation.extracted == false())
+        
+        if since_timestamp is not None:
+            query = query.where(Conversation.started_at >= since_timestamp)
+        
+        rows = session.execute(query.order_by(Conversation.started_at.desc()).limit(limit))
+        return [ConversationRecord(*row) for row in rows]
     
     def mark_conversation_processed(self, conversation_id: str) -> None:
         """Mark a conversation as processed."""
         if not validate_uuid(conversation_id):
             raise ValueError("Invalid conversation ID format")
+        
+        with self.db.for_conversation(conversation_id).session() as session:
+            self._mark_conversation_processed(session, conversation_id)
+    
+    @staticmethod
+    def _mark_conversation_processed(session: Session, conversation_id: str) -> None:
+        """Mark a conversation as processed within an existing session."""
+        conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
+        if conv:
+            conv.extracted = True
+            
+            # Mark any extraction jobs as completed
+            jobs = session.query(ExtractionJob).filter_by(
+                conversation_id=conversation_id,
+                status="pending"
+            ).all()
             
-        with db.session() as session:
-            conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
-            if conv:
-                conv.extracted = True
-                
-                # Mark any extraction jobs as completed
-                jobs = session.query(ExtractionJob).filter_by(
-                    conversation_id=conversation_id,
-                    status="pending"
-                ).all()
-                
-                for job in jobs:
-                    job.status = "completed"
-                    job.completed_at = int(datetime.now().timestamp())
-                    
+            for job in jobs:
+                job.status = "completed"
+                job.completed_at = int(datetime.now().timestamp())
+    
     """Adding missing methods to CallistoAPI."""
-
+    
     # Add these methods to the CallistoAPI class
-
+    
     def start_conversation(self, user_id: str, platform_name: str) -> str:
         """Start a new conversation and return the conversation ID."""
         if not validate_uuid(user_id):
             raise ValueError("Invalid user ID format")
-            
+        
         platform_name = sanitize_input(platform_name)
         
-        with db.session() as session:
-            # Find platform
-            platform = session.query(Platform).filter_by(platform_name=platform_name).first()
-            if not platform:
-                platform = Platform(platform_name=platform_name)
-                session.add(platform)
-                session.flush()
-            
-            # Create conversation
-            conv = Conversation.create(user_id, platform.platform_id)
-            session.add(conv)
-            session.flush()
-            
-            return conv.conversation_id
-
-    def add_message(self, conversation_id: str, content: str, is_from_user: bool) -> None:
-        """Add a message to a conversation."""
+        with self.db.for_user(user_id).session() as session:
+            return self._start_conversation(session, user_id, platform_name,
+                                            self.db.new_conversation_id(user_id))
+    
+    @staticmethod
+    def _start_conversation(session: Session, user_id: str, platform_name: str,
+                            conversation_id: Optional[str] = None) -> str:
+        """Start a new conversation within an existing session."""
+        # Find platform
+        platform_id = CallistoAPI._get_or_create_platform_id(session, platform_name)
+        
+        # Create conversation
+        conv = Conversation.create(user_id, platform_id)
+        if conversation_id:
+            conv.conversation_id = conversation_id
+        session.add(conv)
+        session.flush()
+        
+        return conv.conversation_id
+    
+    def add_message(self, conversation_id: str, content: str, is_from_user: bool) -> Optional[Future]:
+        """Add a message to a conversation.
+        
+        Returns a Future acknowledging the commit when group commit is enabled.
+        """
         # Validate inputs
         MessageAddModel(
             conversation_id=conversation_id,
@@ -442,41 +999,74 @@ class CallistoAPI(CallistoAPIInterface):
         
         if not validate_uuid(conversation_id):
             raise ValueError("Invalid conversation ID format")
-            
+        
         content = sanitize_input(content)
         
-        with db.session() as session:
-            # Check if conversation exists
-            conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
-            if not conv:
-                raise ValueError("Conversation not found")
-            
-            # Add message
-            now = int(datetime.now().timestamp())
-            message = Message(
-                conversation_id=conversation_id,
-                is_from_user=is_from_user,
-                content=content,
-                timestamp=now
-            )
-            session.add(message)
-            
-            # Update user last seen
-            user = session.query(User).filter_by(user_id=conv.user_id).first()
-            if user:
-                user.last_seen = now
-
+        shard = self.db.for_conversation(conversation_id)
+        writer = self._message_writer(shard)
+        if writer is not None:
+            return writer.submit(conversation_id, content, is_from_user)
+        
+        buffer = self._write_buffer(shard)
+        if buffer is not None:
+            buffer.write("add_message", conversation_id, content, is_from_user,
+                         int(datetime.now().timestamp()))
+            return None
+        
+        with shard.session() as session:
+            self._add_message(session, conversation_id, content, is_from_user)
+    
+    @staticmethod
+    def _add_message(session: Session, conversation_id: str, content: str, is_from_user: bool,
+                    timestamp: Optional[int] = None) -> None:
+        """Add a message to a conversation within an existing session."""
+        # Check if conversation exists
+        conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
+        if not conv:
+            raise ValueError("Conversation not found")
+        
+        # Add message
+        now = int(datetime.now().timestamp())
+        timestamp = timestamp or now
+        message = Message(
+            conversation_id=conversation_id,
+            is_from_user=is_from_user,
+            content=content,
+            timestamp=timestamp
+        )
+        session.add(message)
+        embeddings.index_messages(session, conv.user_id, [message])
+        
+        # Counters are updated in SQL so a concurrent writer cannot lose an increment
+        is_latest = or_(Conversation.last_message_at.is_(None), Conversation.last_message_at <= timestamp)
+        session.query(Conversation).filter_by(conversation_id=conversation_id).update({
+            Conversation.message_count: Conversation.message_count + 1,
+            Conversation.last_message_at: case((is_latest, timestamp), else_=Conversation.last_message_at),
+            Conversation.last_message_preview: case((is_latest, message_preview(content)),
+                                                    else_=Conversation.last_message_preview)
+        }, synchronize_session=False)
+        
+        # Update user last seen
+        user = session.query(User).filter_by(user_id=conv.user_id).first()
+        if user:
+            user.last_seen = now
+    
     def end_conversation(self, conversation_id: str) -> None:
         """End a conversation."""
         if not validate_uuid(conversation_id):
             raise ValueError("Invalid conversation ID format")
-            
-        with db.session() as session:
-            # Find conversation
-            conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
-            if conv and not conv.ended_at:
-                now = int(datetime.now().timestamp())
-                conv.ended_at = now
+        
+        with self.db.for_conversation(conversation_id).session() as session:
+            self._end_conversation(session, conversation_id)
+    
+    @staticmethod
+    def _end_conversation(session: Session, conversation_id: str) -> None:
+        """End a conversation within an existing session."""
+        # Find conversation
+        conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
+        if conv and not conv.ended_at:
+            now = int(datetime.now().timestamp())
+            conv.ended_at = now
 
 # Create global API instance for easy import
 api = CallistoAPI()
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""Cold storage for the messages of old, ended conversations."""
+import atexit
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, Integer, LargeBinary, String
+from sqlalchemy.ext.declarative import declarative_base
+
+from .db import Database
+from .models import Conversation, Embedding, Message
+from .records import MessageRecord
+
+# Kept apart from models.Base so init_db() never creates it in the hot database
+ArchiveBase = declarative_base()
+
+class ArchivedConversation(ArchiveBase):
+    """All messages of one conversation, stored as a single compressed block."""
+    __tablename__ = "archived_conversations"
+    
+    conversation_id = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False, index=True)
+    message_count = Column(Integer, nullable=False)
+    archived_at = Column(Integer, nullable=False)
+    block = Column(LargeBinary, nullable=False)
+
+
+# Conversations become archivable this long after they end
+DEFAULT_MIN_AGE = 30 * 86400
+
+# zlib level for message blocks; blocks are written once and read rarely
+COMPRESSION_LEVEL = 6
+
+
+def encode_block(messages: List[Dict[str, Any]]) -> bytes:
+    """Pack a conversation's messages into a compressed block."""
+    rows = [[m["message_id"], m["is_from_user"], m["content"], m["timestamp"]] for m in messages]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decode_block(block: bytes) -> List[MessageRecord]:
+    """Unpack a block written by encode_block()."""
+    return [MessageRecord(*row) for row in json.loads(zlib.decompress(block))]
+
+
+class ConversationArchive:
+    """Moves old conversations' messages out of the hot messages table.
+    
+    Once a conversation has been over for ``min_age`` seconds, its messages
+    are packed into one zlib-compressed block in a separate SQLite file, then
+    deleted from ``messages`` and the conversation is stamped with
+    ``archived_at``. The conversation row itself stays, so listings and
+    routing work as before, and ConversationManager loads archived messages
+    on demand.
+    
+    Work is done in batches of ``batch_size`` conversations, each in one
+    short writer transaction. The archive block is committed before the hot
+    rows are deleted, so a crash in between leaves a duplicate that the next
+    batch overwrites, never a loss.
+    """
+    
+    def __init__(self, database: Database, path: Optional[str] = None, min_age: float = DEFAULT_MIN_AGE,
+                 batch_size: int = 100, interval: float = 60.0, pause: float = 0.05):
+        """Open (or create) the archive file; call start() to archive in the background."""
+        if batch_size < 1:
+            raise ValueError("Invalid batch_size: must be at least 1")
+        
+        self.database = database
+        self.path = path or os.path.splitext(database.db_path)[0] + ".archive.db"
+        self.min_age = min_age
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        
+        # An AsyncDatabase opens the archive to read it and has no retry policy
+        self.store = Database(self.path, database.profile, getattr(database, "retry_policy", None))
+        with self.store.engine.begin() as conn:
+            ArchiveBase.metadata.create_all(conn)
+        
+        self._lock = threading.Lock()
+        self._stats = {"conversations": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0,
+                       "last_run": None, "last_error": None}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    # ARCHIVING
+    
+    def archive_batch(self, now: Optional[int] = None) -> int:
+        """Archive up to batch_size eligible conversations; return how many."""
+        cutoff = int(now if now is not None else time.time()) - self.min_age
+        
+        with self.database.session() as session:
+            conversations = (session.query(Conversation.conversation_id, Conversation.user_id)
+                .filter(Conversation.archived_at.is_(None), Conversation.ended_at < cutoff)
+                .order_by(Conversation.ended_at)
+                .limit(self.batch_size)
+                .all())
+            if not conversations:
+                return 0
+            
+            ids = [conversation_id for conversation_id, _ in conversations]
+            grouped = {conversation_id: [] for conversation_id in ids}
+            for message in (session.query(Message)
+                    .filter(Message.conversation_id.in_(ids))
+                    .order_by(Message.conversation_id, Message.timestamp, Message.message_id)):
+                grouped[message.conversation_id].append({
+                    "message_id": message.message_id,
+                    "is_from_user": message.is_from_user,
+                    "content": message.content,
+                    "timestamp": message.timestamp,
+                })
+            
+            archived_at = int(time.time())
+            raw_bytes = stored_bytes = message_count = 0
+            with self.store.session() as archive:
+                for conversation_id, user_id in conversations:
+                    messages = grouped[conversation_id]
+                    block = encode_block(messages)
+                    archive.merge(ArchivedConversation(
+                        conversation_id=conversation_id, user_id=user_id,
+                        message_count=len(messages), archived_at=archived_at, block=block
+                    ))
+                    message_count += len(messages)
+                    raw_bytes += sum(len(m["content"].encode("utf-8")) for m in messages)
+                    stored_bytes += len(block)
+            
+            # Semantic search skips archived messages, like full-text search
+            session.query(Embedding).filter(
+                Embedding.kind == "message",
+                Embedding.item_id.in_(session.query(Message.message_id).filter(Message.conversation_id.in_(ids)))
+            ).delete(synchronize_session=False)
+            session.query(Message).filter(Message.conversation_id.in_(ids)).delete(synchronize_session=False)
+            session.query(Conversation).filter(Conversation.conversation_id.in_(ids)).update(
+                {Conversation.archived_at: archived_at}, synchronize_session=False)
+        
+        with self._lock:
+            self._stats["conversations"] += len(ids)
+            self._stats["messages"] += message_count
+            self._stats["raw_bytes"] += raw_bytes
+            self._stats["stored_bytes"] += stored_bytes
+            self._stats["last_run"] = time.time()
+        return len(ids)
+    
+    def run_once(self, now: Optional[int] = None) -> int:
+        """Archive every eligible conversation, batch by batch; return how many."""
+        total = 0
+        while not self._stop.is_set():
+            archived = self.archive_batch(now)
+            total += archived
+            if archived < self.batch_size:
+                break
+            # Let foreground writes at the writer between batches
+            self._stop.wait(self.pause)
+        return total
+    
+    # READS
+    
+    def load(self, conversation_id: str) -> Optional[List[MessageRecord]]:
+        """Return the archived messages of a conversation, or None if it has none."""
+        with self.store.read_session() as session:
+            block = (session.query(ArchivedConversation.block)
+                .filter_by(conversation_id=conversation_id)
+                .scalar())
+        return decode_block(block) if block is not None else None
+    
+    def message_count(self, conversation_id: str) -> int:
+        """Return how many messages of a conversation are archived."""
+        with self.store.read_session() as session:
+            return (session.query(ArchivedConversation.message_count)
+                .filter_by(conversation_id=conversation_id)
+                .scalar()) or 0
+    
+    def delete_user(self, user_id: str) -> int:
+        """Delete every archived conversation of a user; return how many."""
+        with self.store.session() as session:
+            return session.query(ArchivedConversation).filter_by(user_id=user_id).delete(synchronize_session=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return totals over everything archived since this archive was opened."""
+        with self._lock:
+            return dict(self._stats)
+    
+    # SCHEDULING
+    
+    def start(self) -> None:
+        """Start archiving in a background thread every interval seconds."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="callisto-archiver", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        """Stop the background thread after its current batch."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.stop)
+    
+    def close(self) -> None:
+        """Stop archiving and close the archive file."""
+        self.stop()
+        self.store.dispose()
+    
+    def _run(self) -> None:
+        """Archive whatever has become eligible, then wait for the next round."""
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                # Try again next round rather than stop for good
+                with self._lock:
+                    self._stats["last_error"] = repr(e)
+            if self._stop.wait(self.interval):
+                return
@@ -0,0 +1,568 @@
+"""Asyncio API for interacting with the Callisto memory database.
+
+Every operation reuses the session-level implementation of its synchronous
+counterpart through ``AsyncSession.run_sync``, so both APIs always agree on
+behaviour while the async one never blocks the event loop.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Any, Sequence
+
+from .async_db import AsyncDatabase
+from .embeddings import KINDS, SemanticIndex
+from .records import ContextMessageRecord, MessageRecord, UserRecord
+from .validation import (
+    UserCreateModel, KnowledgeStoreModel,
+    CategoryCreateModel, MessageAddModel
+)
+from .security import sanitize_input, validate_uuid
+from .knowledge import KnowledgeManager
+from .categories import CategoryManager
+from .conversations import ConversationManager, Cursor
+from .api import CallistoAPI
+
+class AsyncKnowledgeManager:
+    """Handles knowledge storage and retrieval operations asynchronously."""
+    
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+    
+    async def get_knowledge(self, user_id: str, category_name: Optional[str] = None,
+                           is_personal: Optional[bool] = None) -> Dict[str, Any]:
+        """Get user knowledge with optional filtering."""
+        async with self.db.read_session() as session:
+            return await session.run_sync(
+                KnowledgeManager._get_knowledge, user_id, category_name, is_personal
+            )
+    
+    async def store_knowledge(self, user_id: str, category_name: str, value: Any,
+                             confidence: float = 1.0, source: str = "user_stated") -> None:
+        """Store a piece of knowledge about a user."""
+        async with self.db.session() as session:
+            await session.run_sync(
+                KnowledgeManager._store_knowledge, user_id, category_name, value, confidence, source
+            )
+    
+    async def batch_store_knowledge(self, user_id: str, knowledge_items: List[Dict[str, Any]]) -> None:
+        """Store multiple knowledge items at once."""
+        for item in knowledge_items:
+            await self.store_knowledge(
+                user_id=user_id,
+                category_name=item["category"],
+                value=item["value"],
+                confidence=item.get("confidence", 1.0),
+                source=item.get("source", "user_stated")
+            )
+    
+    async def delete_knowledge(self, user_id: str, category_name: str) -> None:
+        """Delete a piece of knowledge about a user."""
+        async with self.db.session() as session:
+            await session.run_sync(KnowledgeManager._delete_knowledge, user_id, category_name)
+    
+    async def merge_knowledge(self, user_id: str, target_user_id: str) -> None:
+        """Merge knowledge from target user into this user."""
+        target_knowledge = await self.get_knowledge(target_user_id)
+        
+        for category, data in target_knowledge.items():
+            # Only merge if we don't have higher confidence data
+            existing = await self.get_knowledge(user_id, category)
+            if not existing or existing.get(category, {}).get("confidence", 0) < data["confidence"]:
+                await self.store_knowledge(
+                    user_id=user_id,
+                    category_name=category,
+                    value=data["value"],
+                    confidence=data["confidence"],
+                    source=data["source"]
+                )
+    
+    async def get_knowledge_by_source(self, user_id: str, source: str) -> Dict[str, Any]:
+        """Get all knowledge from a specific source."""
+        async with self.db.read_session() as session:
+            return await session.run_sync(KnowledgeManager._get_knowledge_by_source, user_id, source)
+
+
+class AsyncCategoryManager:
+    """Handles knowledge category operations asynchronously."""
+    
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+    
+    async def get_categories(self, include_personal: bool = True) -> List[Dict[str, Any]]:
+        """Get all knowledge categories."""
+        async with self.db.read_session() as session:
+            return await session.run_sync(CategoryManager._get_categories, include_personal)
+    
+    async def create_category(self, category_name: str, data_type: str, is_personal: bool = False) -> bool:
+        """Create a new knowledge category."""
+        async with self.db.session() as session:
+            return await session.run_sync(
+                CategoryManager._create_category, category_name, data_type, is_personal
+            )
+    
+    async def update_category(self, category_name: str, data_type: Optional[str] = None,
+                             is_personal: Optional[bool] = None) -> bool:
+        """Update an existing knowledge category."""
+        async with self.db.session() as session:
+            return await session.run_sync(
+                CategoryManager._update_category, category_name, data_type, is_personal
+            )
+    
+    async def delete_category(self, category_name: str) -> bool:
+        """Delete a knowledge category."""
+        async with self.db.session() as session:
+            return await session.run_sync(CategoryManager._delete_category, category_name)
+    
+    async def get_category(self, category_name: str) -> Optional[Dict[str, Any]]:
+        """Get a specific category by name."""
+        async with self.db.read_session() as session:
+            return await session.run_sync(CategoryManager._get_category, category_name)
+    
+    async def create_default_categories(self) -> None:
+        """Create default knowledge categories."""
+        for cat in CategoryManager.DEFAULT_CATEGORIES:
+            await self.create_category(**cat)
+
+
+class AsyncConversationManager:
+    """Handles conversation operations asynchronously."""
+    
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+    
+    async def get_conversation_history(self, conversation_id: str) -> List[MessageRecord]:
+        """Get all messages in a conversation, including archived ones."""
+        async with self.db.read_session() as session:
+            history, archived = await session.run_sync(ConversationManager._get_hot_history, conversation_id)
+        
+        if archived:
+            history = await self._load_archived(conversation_id) + history
+        return history
+    
+    async def get_history_page(self, conversation_id: str, limit: int = 50, before: Optional[Cursor] = None,
+                               after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Get up to limit consecutive messages of a conversation, oldest first."""
+        async with self.db.read_session() as session:
+            page = await session.run_sync(ConversationManager._get_history_page, conversation_id, limit, before, after)
+            archived = await session.run_sync(ConversationManager._is_archived, conversation_id)
+        
+        if archived:
+            archived_messages = await self._load_archived(conversation_id)
+            page = ConversationManager._select_page(archived_messages + page, limit, before, after)
+        return page
+    
+    async def get_context_window(self, conversation_id: str, max_tokens: int,
+                                 max_messages: Optional[int] = None) -> List[ContextMessageRecord]:
+        """Get the most recent messages that fit in max_tokens, oldest first."""
+        async with self.db.read_session() as session:
+            window = await session.run_sync(
+                ConversationManager._get_context_window, conversation_id, max_tokens, max_messages)
+            archived = await session.run_sync(ConversationManager._window_reaches_archive, conversation_id, window)
+        
+        if archived:
+            archived_messages = await self._load_archived(conversation_id)
+            window = ConversationManager._extend_window(window, archived_messages, max_tokens, max_messages)
+        return window
+    
+    async def iter_conversation_history(self, conversation_id: str,
+                                        batch_size: int = 500) -> AsyncIterator[MessageRecord]:
+        """Yield every message in a conversation, oldest first, reading batch_size rows at a time.
+        
+        Each batch is read in its own session, so no connection is held
+        while the caller works through the messages.
+        """
+        async with self.db.read_session() as session:
+            archived = await session.run_sync(ConversationManager._is_archived, conversation_id)
+        if archived:
+            for message in await self._load_archived(conversation_id):
+                yield message
+        
+        after = None
+        while True:
+            async with self.db.read_session() as session:
+                batch = await session.run_sync(
+                    ConversationManager._get_history_batch, conversation_id, batch_size, after)
+            for message in batch:
+                yield message
+            if len(batch) < batch_size:
+                return
+            after = (batch[-1]["timestamp"], batch[-1]["message_id"])
+    
+    async def search_messages(self, user_id: str, query: str, limit: int = 20,
+                              since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Full-text search over a user's messages, best matches first."""
+        async with self.db.read_session() as session:
+            return await session.run_sync(ConversationManager._search_messages, user_id, query, limit, since)
+    
+    async def _load_archived(self, conversation_id: str) -> List[MessageRecord]:
+        """Read the archived messages of a conversation."""
+        # The archive is a plain SQLite file; read it off the event loop
+        archive = self.db.open_archive()
+        loaded = await asyncio.get_running_loop().run_in_executor(None, archive.load, conversation_id)
+        return loaded or []
+    
+    async def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific conversation by ID."""
+        async with self.db.read_session() as session:
+            return await session.run_sync(ConversationManager._get_conversation, conversation_id)
+
+
+class AsyncCallistoAPI:
+    """Asyncio API for Jupiter, offering the operations of CallistoAPIInterface."""
+    
+    def __init__(self, db: AsyncDatabase):
+        self.db = db
+        self.knowledge = AsyncKnowledgeManager(db)
+        self.categories = AsyncCategoryManager(db)
+        self.conversations = AsyncConversationManager(db)
+    
+    async def initialize(self) -> None:
+        """Create tables and default categories if they don't exist."""
+        await self.db.init_db()
+        await self.categories.create_default_categories()
+    
+    # USER MANAGEMENT
+    
+    async def get_user(self, platform_name: str, platform_username: str) -> Optional[UserRecord]:
+        """Find a user by platform and username."""
+        platform_name = sanitize_input(platform_name)
+        platform_username = sanitize_input(platform_username)
+        
+        async with self.db.read_session() as session:
+            return await session.run_sync(CallistoAPI._get_user, platform_name, platform_username)
+    
+    async def get_user_by_platform_id(self, platform_name: str, platform_specific_id: str) -> Optional[UserRecord]:
+        """Find a user by platform and the platform's own ID for them."""
+        platform_name = sanitize_input(platform_name)
+        platform_specific_id = sanitize_input(platform_specific_id)
+        
+        async with self.db.read_session() as session:
+            return await session.run_sync(CallistoAPI._get_user_by_platform_id, platform_name, platform_specific_id)
+    
+    async def create_user(self, name: str, platform_name: str, platform_username: str,
+                         platform_specific_id: Optional[str] = None) -> UserRecord:
+        """Create a new user with platform association."""
+        # Validate inputs
+        UserCreateModel(
+            name=name,
+            platform_name=platform_name,
+            platform_username=platform_username,
+            platform_specific_id=platform_specific_id
+        )
+        
+        # Sanitize inputs
+        name = sanitize_input(name)
+        platform_name = sanitize_input(platform_name)
+        platform_username = sanitize_input(platform_username)
+        platform_specific_id = sanitize_input(platform_specific_id) if platform_specific_id else None
+        
+        async with self.db.session() as session:
+            return await session.run_sync(
+                CallistoAPI._create_user, name, platform_name, platform_username, platform_specific_id
+            )
+    
+    async def update_user(self, user_id: str, name: str) -> None:
+        """Update user information."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        name = sanitize_input(name)
+        
+        async with self.db.session() as session:
+            await session.run_sync(CallistoAPI._update_user, user_id, name)
+    
+    async def delete_user(self, user_id: str) -> None:
+        """Delete a user and all associated data."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        async with self.db.session() as session:
+            archived = await session.run_sync(ConversationManager._has_archived, user_id)
+            await session.run_sync(CallistoAPI._delete_user, user_id)
+        
+        if archived:
+            archive = self.db.open_archive()
+            await asyncio.get_running_loop().run_in_executor(None, archive.delete_user, user_id)
+    
+    async def link_platform(self, user_id: str, platform_name: str, platform_username: str,
+                           platform_specific_id: Optional[str] = None) -> None:
+        """Link a user to a platform."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        platform_name = sanitize_input(platform_name)
+        platform_username = sanitize_input(platform_username)
+        platform_specific_id = sanitize_input(platform_specific_id) if platform_specific_id else None
+        
+        async with self.db.session() as session:
+            await session.run_sync(
+                CallistoAPI._link_platform, user_id, platform_name, platform_username, platform_specific_id
+            )
+    
+    # KNOWLEDGE MANAGEMENT
+    
+    async def get_user_knowledge(self, user_id: str, category_name: Optional[str] = None,
+                                include_personal: bool = True,
+                                since_timestamp: Optional[int] = None) -> Dict[str, Any]:
+        """Get all knowledge for a user, with optional filtering."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        if category_name:
+            category_name = sanitize_input(category_name)
+        
+        is_personal = None if include_personal else False
+        knowledge = await self.knowledge.get_knowledge(user_id, category_name, is_personal)
+        
+        # Filter by timestamp if provided
+        if since_timestamp is not None:
+            knowledge = {k: v for k, v in knowledge.items()
+                        if v.get("updated_at", 0) >= since_timestamp}
+        
+        return knowledge
+    
+    async def get_knowledge_by_source(self, user_id: str, source: str) -> Dict[str, Any]:
+        """Get all knowledge from a specific source."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        source = sanitize_input(source)
+        return await self.knowledge.get_knowledge_by_source(user_id, source)
+    
+    async def store_knowledge(self, user_id: str, category_name: str, value: Any,
+                             confidence: float = 1.0, source: str = "user_stated") -> None:
+        """Store a piece of knowledge about a user."""
+        # Validate inputs
+        KnowledgeStoreModel(
+            user_id=user_id,
+            category_name=category_name,
+            value=value,
+            confidence=confidence,
+            source=source
+        )
+        
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        await self.knowledge.store_knowledge(user_id, category_name, value, confidence, source)
+    
+    async def batch_store_knowledge(self, user_id: str, knowledge_items: List[Dict[str, Any]]) -> None:
+        """Store multiple knowledge items at once."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        await self.knowledge.batch_store_knowledge(user_id, knowledge_items)
+    
+    async def delete_knowledge(self, user_id: str, category_name: str) -> None:
+        """Delete a piece of knowledge about a user."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        category_name = sanitize_input(category_name)
+        await self.knowledge.delete_knowledge(user_id, category_name)
+    
+    async def merge_knowledge(self, user_id: str, target_user_id: str) -> None:
+        """Merge knowledge from target user into this user."""
+        if not validate_uuid(user_id) or not validate_uuid(target_user_id):
+            raise ValueError("Invalid user ID format")
+        
+        await self.knowledge.merge_knowledge(user_id, target_user_id)
+    
+    # CATEGORY MANAGEMENT
+    
+    async def get_knowledge_categories(self, include_personal: bool = True) -> List[Dict[str, Any]]:
+        """Get all knowledge categories."""
+        return await self.categories.get_categories(include_personal)
+    
+    async def create_knowledge_category(self, category_name: str, data_type: str,
+                                       is_personal: bool = False) -> bool:
+        """Create a new knowledge category."""
+        # Validate inputs
+        CategoryCreateModel(
+            category_name=category_name,
+            data_type=data_type,
+            is_personal=is_personal
+        )
+        
+        return await self.categories.create_category(category_name, data_type, is_personal)
+    
+    async def update_knowledge_category(self, category_name: str, data_type: Optional[str] = None,
+                                       is_personal: Optional[bool] = None) -> bool:
+        """Update an existing knowledge category."""
+        category_name = sanitize_input(category_name)
+        return await self.categories.update_category(category_name, data_type, is_personal)
+    
+    async def delete_knowledge_category(self, category_name: str) -> bool:
+        """Delete a knowledge category."""
+        category_name = sanitize_input(category_name)
+        return await self.categories.delete_category(category_name)
+    
+    # CONVERSATION MANAGEMENT
+    
+    async def store_conversation(self, user_id: str, platform_name: str, messages: List[Dict[str, Any]],
+                                conversation_id: Optional[str] = None) -> str:
+        """Store a complete conversation."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        platform_name = sanitize_input(platform_name)
+        
+        async with self.db.session() as session:
+            return await session.run_sync(
+                CallistoAPI._store_conversation, user_id, platform_name, messages, conversation_id
+            )
+    
+    async def batch_store_conversations(self, user_id: str, platform_name: str,
+                                       conversations: List[Dict[str, Any]]) -> List[str]:
+        """Store multiple conversations in batch."""
+        conversation_ids = []
+        
+        for conv_data in conversations:
+            conv_id = await self.store_conversation(
+                user_id=user_id,
+                platform_name=platform_name,
+                messages=conv_data.get("messages", []),
+                conversation_id=conv_data.get("conversation_id")
+            )
+            conversation_ids.append(conv_id)
+        
+        return conversation_ids
+    
+    async def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Get all messages in a conversation."""
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        
+        return await self.conversations.get_conversation_history(conversation_id)
+    
+    async def get_conversation_history_page(self, conversation_id: str, limit: int = 50,
+                                            before: Optional[Cursor] = None,
+                                            after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Get up to limit consecutive messages of a conversation, oldest first.
+        
+        Cursors work as in CallistoAPI.get_conversation_history_page.
+        """
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        if limit < 1:
+            raise ValueError("Invalid limit: must be at least 1")
+        for cursor in (before, after):
+            if cursor is not None and len(cursor) != 2:
+                raise ValueError("Invalid cursor: must be (timestamp, message_id)")
+        
+        return await self.conversations.get_history_page(conversation_id, limit, before, after)
+    
+    async def get_context_window(self, conversation_id: str, max_tokens: int,
+                                 max_messages: Optional[int] = None) -> List[ContextMessageRecord]:
+        """Get the most recent messages of a conversation that fit in max_tokens, oldest first."""
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        if max_tokens < 1:
+            raise ValueError("Invalid max_tokens: must be at least 1")
+        if max_messages is not None and max_messages < 1:
+            raise ValueError("Invalid max_messages: must be at least 1")
+        
+        return await self.conversations.get_context_window(conversation_id, max_tokens, max_messages)
+    
+    def iter_conversation_history(self, conversation_id: str,
+                                  batch_size: int = 500) -> AsyncIterator[MessageRecord]:
+        """Stream every message of a conversation, oldest first, with ``async for``."""
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        if batch_size < 1:
+            raise ValueError("Invalid batch_size: must be at least 1")
+        
+        return self.conversations.iter_conversation_history(conversation_id, batch_size)
+    
+    async def search_messages(self, user_id: str, query: str, limit: int = 20,
+                              since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Find a user's messages matching every word of query, best matches first."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        if limit < 1:
+            raise ValueError("Invalid limit: must be at least 1")
+        
+        # Stored content is sanitized, so the query must be too for its terms to match
+        return await self.conversations.search_messages(user_id, sanitize_input(query), limit, since)
+    
+    async def semantic_search(self, user_id: str, text: str, k: int = 10,
+                              kinds: Sequence[str] = KINDS) -> List[Dict[str, Any]]:
+        """Find the k messages and knowledge items of a user closest in meaning to text.
+        
+        Only reads, like CallistoAPI.semantic_search; call
+        configure_semantic_search() first.
+        """
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        if k < 1:
+            raise ValueError("Invalid k: must be at least 1")
+        if not kinds or any(kind not in KINDS for kind in kinds):
+            raise ValueError(f"Invalid kinds: must be some of {', '.join(KINDS)}")
+        
+        index = self.db.semantic_index
+        if index is None:
+            raise RuntimeError("Semantic search is off; call configure_semantic_search() first")
+        async with self.db.read_session() as session:
+            return await session.run_sync(index._search, user_id, text, k, kinds)
+    
+    async def configure_semantic_search(self, embedder=None, nprobe: int = 4) -> None:
+        """Turn on semantic search; see CallistoAPI.configure_semantic_search."""
+        if nprobe < 1:
+            raise ValueError("Invalid nprobe: must be at least 1")
+        index = SemanticIndex(self.db, embedder, nprobe)
+        async with self.db.session() as session:
+            await session.run_sync(index._sync)
+        self.db.semantic_index = index
+    
+    async def get_recent_conversations(self, user_id: str, limit: int = 10,
+                                      include_processed: bool = True,
+                                      since_timestamp: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get recent conversations for a user with optional filtering."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        async with self.db.read_session() as session:
+            return await session.run_sync(
+                CallistoAPI._get_recent_conversations, user_id, limit, include_processed, since_timestamp
+            )
+    
+    async def mark_conversation_processed(self, conversation_id: str) -> None:
+        """Mark a conversation as processed."""
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        
+        async with self.db.session() as session:
+            await session.run_sync(CallistoAPI._mark_conversation_processed, conversation_id)
+    
+    async def start_conversation(self, user_id: str, platform_name: str) -> str:
+        """Start a new conversation and return the conversation ID."""
+        if not validate_uuid(user_id):
+            raise ValueError("Invalid user ID format")
+        
+        platform_name = sanitize_input(platform_name)
+        
+        async with self.db.session() as session:
+            return await session.run_sync(CallistoAPI._start_conversation, user_id, platform_name)
+    
+    async def add_message(self, conversation_id: str, content: str, is_from_user: bool) -> None:
+        """Add a message to a conversation."""
+        # Validate inputs
+        MessageAddModel(
+            conversation_id=conversation_id,
+            content=content,
+            is_from_user=is_from_user
+        )
+        
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        
+        content = sanitize_input(content)
+        
+        async with self.db.session() as session:
+            await session.run_sync(CallistoAPI._add_message, conversation_id, content, is_from_user)
+    
+    async def end_conversation(self, conversation_id: str) -> None:
+        """End a conversation."""
+        if not validate_uuid(conversation_id):
+            raise ValueError("Invalid conversation ID format")
+        
+        async with self.db.session() as session:
+            await session.run_sync(CallistoAPI._end_conversation, conversation_id)
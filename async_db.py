@@ -0,0 +1,132 @@
+"""Asyncio database connection and session management for Callisto."""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .db import (
+    STORAGE_PROFILES, DEFAULT_PROFILE, WRITER_QUEUE_TIMEOUT,
+    _apply_pragmas, _register_functions, default_db_path
+)
+from .models import Base
+from .migrations import run_migrations
+
+class AsyncDatabase:
+    """Asyncio counterpart of Database built on SQLAlchemy's async engine.
+    
+    Uses the aiosqlite driver, so waiting on SQLite happens off the event
+    loop and many calls can be in flight without a thread per call.
+    """
+    
+    def __init__(self, db_path: str = None, profile: str = DEFAULT_PROFILE):
+        """Initialize async database engines using a named storage profile."""
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Storage profile must be one of {list(STORAGE_PROFILES)}")
+        
+        if not db_path:
+            db_path = default_db_path()
+        
+        self.db_path = db_path
+        self.profile = profile
+        self.archive = None
+        # Embeds what async writes store once semantic search is on (see embeddings.py)
+        self.semantic_index = None
+        # Async reads are not cached; writers' cache hooks find none to update
+        self.reference_cache = None
+        self.identity_cache = None
+        self.profile_cache = None
+        self.pragmas = dict(STORAGE_PROFILES[profile]["pragmas"])
+        read_pool = STORAGE_PROFILES[profile]["pool"]
+        
+        # Same layout as Database: one queued writer connection, pooled readers
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{db_path}",
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=WRITER_QUEUE_TIMEOUT
+        )
+        self.read_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{db_path}",
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=read_pool["pool_size"],
+            max_overflow=read_pool.get("max_overflow", 0),
+            pool_timeout=WRITER_QUEUE_TIMEOUT
+        )
+        
+        @event.listens_for(self.engine.sync_engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            _apply_pragmas(dbapi_connection, self.pragmas)
+            _register_functions(dbapi_connection)
+        
+        @event.listens_for(self.read_engine.sync_engine, "connect")
+        def _on_read_connect(dbapi_connection, connection_record):
+            _apply_pragmas(dbapi_connection, dict(self.pragmas, query_only="ON"))
+            _register_functions(dbapi_connection)
+        
+        # Objects must stay readable after commit; async sessions cannot lazy-load.
+        # Sessions know their database, as Database's do, for the writers' hooks.
+        self.Session = sessionmaker(bind=self.engine, class_=AsyncSession, expire_on_commit=False,
+                                    info={"database": self})
+        self.ReadSession = sessionmaker(bind=self.read_engine, class_=AsyncSession, info={"database": self})
+    
+    async def init_db(self) -> None:
+        """Create all tables if they don't exist and apply pending migrations."""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(run_migrations)
+    
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """Provide a transactional scope around operations."""
+        session = self.Session()
+        try:
+            yield session
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            raise e
+        finally:
+            await session.close()
+    
+    @asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+        """Provide a read-only scope that never commits."""
+        session = self.ReadSession()
+        try:
+            yield session
+        finally:
+            await session.close()
+    
+    async def execute_atomic(self, operation, *args, **kwargs):
+        """Execute a coroutine operation atomically within a transaction."""
+        async with self.session() as session:
+            return await operation(session, *args, **kwargs)
+    
+    def open_archive(self, path: Optional[str] = None) -> "ConversationArchive":
+        """Open the cold-storage archive so archived conversations can be read.
+        
+        Archiving itself is done by a Database (see Database.start_archiver).
+        """
+        from .archive import ConversationArchive
+        
+        if self.archive is None:
+            self.archive = ConversationArchive(self, path)
+        return self.archive
+    
+    @property
+    def reference(self) -> "AsyncDatabase":
+        """Return the database holding platforms and categories."""
+        return self
+    
+    async def dispose(self) -> None:
+        """Close all pooled connections."""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        self.semantic_index = None
+        await self.engine.dispose()
+        await self.read_engine.dispose()
@@ -0,0 +1 @@
+"""Performance benchmarks for Callisto."""
\ No newline at end of file
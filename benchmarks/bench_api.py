@@ -0,0 +1,213 @@
+"""
+Benchmark suite for the Callisto API at realistic data sizes.
+
+Builds (or reuses) a populated database, runs each main API operation a fixed
+number of times against random existing entities and writes throughput,
+latency percentiles, queries per call and peak memory as JSON, so runs can be
+compared across versions.
+
+Usage:
+    python -m callisto.benchmarks.bench_api --scale full --output bench.json
+"""
+import argparse
+import json
+import os
+import platform as host_platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import sqlalchemy
+
+import callisto
+from callisto.api import api
+from callisto.db import db
+from callisto.metrics import metrics
+from callisto.models import Platform, UserPlatform
+from callisto.benchmarks import dataset
+
+# Dataset sizes: users, knowledge rows, messages
+SCALES = {
+    "tiny": {"users": 1_000, "knowledge": 10_000, "messages": 100_000},
+    "small": {"users": 10_000, "knowledge": 100_000, "messages": 1_000_000},
+    "full": {"users": 100_000, "knowledge": 1_000_000, "messages": 10_000_000},
+}
+
+
+def build_operations(fixtures: Dict[str, Any], rng: random.Random,
+                     calls: int) -> Dict[str, Callable[[int], Any]]:
+    """Return one callable per benchmarked API operation, keyed by name.
+    
+    ``calls`` is how many times each operation will be run.
+    """
+    user_ids = fixtures["user_ids"]
+    conversation_ids = fixtures["conversation_ids"]
+    usernames = {}
+    with db.engine.connect() as conn:
+        for user_id, platform_name, username in conn.execute(
+                sqlalchemy.select(UserPlatform.user_id, Platform.platform_name, UserPlatform.platform_username)
+                .join(Platform, Platform.platform_id == UserPlatform.platform_id)):
+            usernames[user_id] = (platform_name, username)
+    # delete_user consumes users, so it gets throwaway ones of its own
+    with api.transaction() as tx:
+        deletable = [tx.create_user(f"Deletable User {i}", "discord", f"bench_delete_{i}_{rng.random()}").user_id
+                     for i in range(calls)]
+    messages = [{"content": f"Benchmark line {i}", "is_from_user": i % 2 == 0} for i in range(20)]
+    live_conversation = api.start_conversation(user_ids[0], "discord")
+    
+    def any_user() -> str:
+        return rng.choice(user_ids)
+    
+    return {
+        "create_user": lambda i: api.create_user(f"New User {i}", "discord", f"bench_new_{i}_{rng.random()}"),
+        "get_user": lambda i: api.get_user(*usernames[any_user()]),
+        "store_knowledge": lambda i: api.store_knowledge(any_user(), "likes", ["tea", f"item {i}"], 0.8),
+        "batch_store_knowledge": lambda i: api.batch_store_knowledge(any_user(), [
+            {"category": "occupation", "value": f"job {i}", "confidence": 0.7, "source": "extracted"},
+            {"category": "interests", "value": ["chess", "go"], "confidence": 0.6, "source": "extracted"},
+            {"category": "location", "value": "Perth", "confidence": 0.9},
+        ]),
+        "get_user_knowledge": lambda i: api.get_user_knowledge(any_user()),
+        "store_conversation": lambda i: api.store_conversation(any_user(), "discord", messages),
+        "add_message": lambda i: api.add_message(live_conversation, f"Live message {i}", i % 2 == 0),
+        "get_conversation_history": lambda i: api.get_conversation_history(rng.choice(conversation_ids)),
+        "get_context_window": lambda i: api.get_context_window(rng.choice(conversation_ids), 2000),
+        "get_recent_conversations": lambda i: api.get_recent_conversations(any_user(), include_processed=i % 2 == 0),
+        "search_messages": lambda i: api.search_messages(any_user(), rng.choice(("tea", "music chess", "gard*"))),
+        "merge_knowledge": lambda i: api.merge_knowledge(any_user(), any_user()),
+        "delete_user": lambda i: api.delete_user(deletable.pop()),
+    }
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Return latency percentiles in milliseconds."""
+    ordered = sorted(latencies)
+    
+    def pct(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+    
+    return {
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+    }
+
+
+def run_operation(name: str, operation: Callable[[int], Any], iterations: int,
+                  memory_iterations: int) -> Dict[str, Any]:
+    """Time one operation, then measure its peak Python heap separately."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    
+    # tracemalloc slows every allocation, so it gets its own short pass
+    tracemalloc.start()
+    for i in range(iterations, iterations + memory_iterations):
+        operation(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    result = {
+        "iterations": iterations,
+        "seconds": elapsed,
+        "ops_per_second": iterations / elapsed if elapsed else None,
+        "latency": summarize(latencies),
+        "peak_traced_memory_kb": peak // 1024,
+    }
+    stats = metrics.snapshot().get(name)
+    if stats:
+        result["statements_per_call"] = stats["statements_per_call"]
+    return result
+
+
+def git_revision() -> str:
+    """Return the current git revision of the package, if available."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(callisto.__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv=None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="full")
+    parser.add_argument("--db", help="Database file to use; populated if it does not exist")
+    parser.add_argument("--snapshot", help="Snapshot to restore instead of generating; written if missing")
+    parser.add_argument("--profile", default="balanced", help="Storage profile to benchmark")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--memory-iterations", type=int, default=50)
+    parser.add_argument("--operations", nargs="*", help="Only run these operations")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+    
+    scale = SCALES[args.scale]
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="callisto-bench-"), "callisto.db")
+    
+    setup_started = time.perf_counter()
+    if not os.path.exists(db_path) and args.snapshot and os.path.exists(args.snapshot):
+        print(f"Restoring {args.snapshot} into {db_path}", file=sys.stderr)
+        dataset.restore_snapshot(args.snapshot, db_path)
+    
+    if not os.path.exists(db_path):
+        callisto.initialize(db_path, "throughput")
+        print(f"Populating {db_path} ({args.scale}: {scale})", file=sys.stderr)
+        dataset.generate(db, seed=args.seed, **scale)
+        if args.snapshot:
+            dataset.save_snapshot(db, args.snapshot)
+    
+    callisto.initialize(db_path, args.profile)
+    fixtures = dataset.fixture_ids(db)
+    setup_seconds = time.perf_counter() - setup_started
+    
+    rng = random.Random(args.seed)
+    operations = build_operations(fixtures, rng, args.iterations + args.memory_iterations)
+    selected = args.operations or list(operations)
+    metrics.reset()
+    
+    results = {}
+    for name in selected:
+        print(f"Running {name}", file=sys.stderr)
+        results[name] = run_operation(name, operations[name], args.iterations, args.memory_iterations)
+    
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "sqlalchemy": sqlalchemy.__version__,
+        "machine": host_platform.platform(),
+        "profile": args.profile,
+        "scale": args.scale,
+        "seed": args.seed,
+        "dataset": scale,
+        "setup_seconds": setup_seconds,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
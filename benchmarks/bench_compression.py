@@ -0,0 +1,117 @@
+"""
+Benchmark for message content compression.
+
+Samples messages from a database (a synthetic one unless --db is given) and,
+for each codec, reports the stored size relative to plain text and the
+per-message cost of encoding and decoding. Decoding runs on every history
+read, so its cost is the number to watch. Results are written as JSON.
+
+Usage:
+    python -m callisto.benchmarks.bench_compression --messages 50000 --output compression.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import callisto
+from callisto import compression
+from callisto.db import db
+from callisto.models import Message
+from callisto.benchmarks import dataset
+
+
+def sample_messages(limit: int) -> List[str]:
+    """Return up to limit message texts from the current database."""
+    with db.read_session() as session:
+        return [content for content, in session.query(Message.content).limit(limit)]
+
+
+def time_per_item(function: Callable[[Any], Any], items: List[Any], repeat: int) -> float:
+    """Return the best mean time per item over several runs, in microseconds."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1_000_000
+
+
+def bench_codec(name: str, texts: List[str], dictionary_id, repeat: int) -> Dict[str, Any]:
+    """Measure size and speed of encode()/decode() with a dictionary (or None)."""
+    stored = [compression.encode(text, dictionary_id) for text in texts]
+    raw_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    stored_bytes = sum(len(v) if isinstance(v, bytes) else len(v.encode("utf-8")) for v in stored)
+    return {
+        "codec": name,
+        "compressed_fraction": sum(isinstance(v, bytes) for v in stored) / len(stored),
+        "size_ratio": stored_bytes / raw_bytes,
+        "encode_us": time_per_item(lambda text: compression.encode(text, dictionary_id), texts, repeat),
+        "decode_us": time_per_item(compression.decode, stored, repeat),
+    }
+
+
+def main(argv=None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Database to sample; a synthetic one is generated if omitted")
+    parser.add_argument("--messages", type=int, default=50_000, help="Messages to sample")
+    parser.add_argument("--train-samples", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_compression.json")
+    args = parser.parse_args(argv)
+    
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="callisto-bench-"), "callisto.db")
+    if not os.path.exists(db_path):
+        callisto.initialize(db_path, "throughput")
+        print(f"Populating {db_path}", file=sys.stderr)
+        dataset.generate(db, users=max(1, args.messages // 100), knowledge=0, messages=args.messages,
+                         seed=args.seed)
+    else:
+        callisto.initialize(db_path)
+    
+    texts = sample_messages(args.messages)
+    if not texts:
+        raise SystemExit(f"No messages in {db_path}")
+    
+    results = [bench_codec("plain+zlib", texts, None, args.repeat)]
+    
+    # Train the fallback zlib dictionary even when zstandard is installed
+    encoded = [text.encode("utf-8") for text in texts[:args.train_samples]]
+    zlib_dictionary = compression._build_zlib_dictionary(encoded, compression.DICTIONARY_SIZE)
+    zlib_id = zlib.crc32(zlib_dictionary)
+    compression.register_dictionary(zlib_id, compression.FORMAT_ZLIB_DICT, zlib_dictionary)
+    results.append(bench_codec("zlib+dictionary", texts, zlib_id, args.repeat))
+    
+    if compression.zstandard is not None:
+        zstd_dictionary = compression.zstandard.train_dictionary(compression.DICTIONARY_SIZE, encoded).as_bytes()
+        zstd_id = zlib.crc32(zstd_dictionary)
+        compression.register_dictionary(zstd_id, compression.FORMAT_ZSTD_DICT, zstd_dictionary)
+        results.append(bench_codec("zstd+dictionary", texts, zstd_id, args.repeat))
+    
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "zstandard": getattr(compression.zstandard, "__version__", None),
+        "messages": len(texts),
+        "mean_message_bytes": sum(len(text.encode("utf-8")) for text in texts) / len(texts),
+        "results": results,
+    }
+    
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        print(f"{result['codec']:>16}: size {result['size_ratio']:.2f}x, "
+              f"encode {result['encode_us']:.1f} us, decode {result['decode_us']:.1f} us", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
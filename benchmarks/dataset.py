@@ -0,0 +1,232 @@
+"""
+Deterministic synthetic datasets for benchmarks and load tests.
+
+Rows are written straight through bulk Core inserts instead of the API, so a
+database with millions of messages is built in minutes rather than hours. The
+same seed always produces the same rows. Activity is heavy-tailed, as in real
+chat logs: most users have only a few short conversations and a small share
+have a great many.
+
+A generated database can be saved as a compressed snapshot and restored later,
+so repeated test or benchmark runs skip generation entirely.
+"""
+import gzip
+import json
+import math
+import os
+import random
+import shutil
+import uuid
+from typing import Any, Dict, List
+
+import sqlalchemy
+
+from callisto.counters import message_preview
+from callisto.db import Database
+from callisto.models import (
+    User, Platform, UserPlatform,
+    KnowledgeCategory, UserKnowledge,
+    Conversation, Message
+)
+
+# Reference "now" for generated timestamps, so output does not depend on the clock
+DEFAULT_NOW = 1_760_000_000
+
+# Rows per executemany call
+INSERT_CHUNK = 50_000
+
+# Shape of the generated data
+PARETO_ALPHA = 1.2          # messages per user; lower is more skewed
+MEAN_CONVERSATION_LENGTH = 20
+HISTORY_DAYS = 180
+EXTRACTED_FRACTION = 0.9
+SECOND_PLATFORM_FRACTION = 0.2
+
+_WORDS = (
+    "tea coffee music chess hiking python rust garden cats dogs travel film jazz "
+    "cooking running books painting football guitar piano science history poetry "
+    "cycling climbing photography gaming anime swimming baking yoga astronomy"
+).split()
+_OCCUPATIONS = ["engineer", "teacher", "nurse", "designer", "student", "chef", "writer", "analyst"]
+_LOCATIONS = ["London", "Berlin", "Tokyo", "Toronto", "Perth", "Lagos", "Lima", "Oslo"]
+
+
+def generate(database: Database, users: int, knowledge: int, messages: int,
+             seed: int = 42, now: int = DEFAULT_NOW) -> Dict[str, int]:
+    """Fill an initialized database with synthetic data.
+    
+    ``knowledge`` and ``messages`` are target totals; the generated counts land
+    close to them. Returns the number of rows written per table.
+    """
+    if users < 1:
+        raise ValueError("Invalid dataset size: users must be at least 1")
+    
+    rng = random.Random(seed)
+    counts = {"users": 0, "user_platforms": 0, "user_knowledge": 0, "conversations": 0, "messages": 0}
+    
+    with database.engine.begin() as conn:
+        platform_ids = [row[0] for row in conn.execute(
+            sqlalchemy.select(Platform.platform_id).order_by(Platform.platform_id))]
+        if not platform_ids:
+            raise ValueError("Invalid database: no platforms, run init_default_data() first")
+        
+        categories = _ensure_categories(conn, max(1, math.ceil(knowledge / users)))
+        user_ids = [_uuid(rng) for _ in range(users)]
+        
+        # Users and their platform links
+        user_rows, link_rows = [], []
+        for i, user_id in enumerate(user_ids):
+            created = now - rng.randrange(2 * HISTORY_DAYS * 86400)
+            user_rows.append({"user_id": user_id, "name": f"User {i}", "created_at": created,
+                              "last_seen": now - rng.randrange(HISTORY_DAYS * 86400), "user_metadata": None})
+            linked = [platform_ids[i % len(platform_ids)]]
+            if len(platform_ids) > 1 and rng.random() < SECOND_PLATFORM_FRACTION:
+                linked.append(platform_ids[(i + 1) % len(platform_ids)])
+            for platform_id in linked:
+                link_rows.append({"user_id": user_id, "platform_id": platform_id,
+                                  "platform_username": f"user{i}", "platform_specific_id": str(i),
+                                  "last_active": created})
+            counts["users"] += _flush(conn, User, user_rows)
+            counts["user_platforms"] += _flush(conn, UserPlatform, link_rows)
+        counts["users"] += _flush(conn, User, user_rows, force=True)
+        counts["user_platforms"] += _flush(conn, UserPlatform, link_rows, force=True)
+        
+        # Knowledge: a random subset of categories per user, sized around the target mean
+        mean_per_user = knowledge / users
+        knowledge_rows = []
+        for user_id in user_ids:
+            k = min(len(categories), _poisson(rng, mean_per_user))
+            for category_id, data_type in rng.sample(categories, k):
+                stamp = now - rng.randrange(HISTORY_DAYS * 86400)
+                knowledge_rows.append({
+                    "user_id": user_id, "category_id": category_id,
+                    "value": _knowledge_value(rng, data_type),
+                    "confidence": round(rng.uniform(0.3, 1.0), 2),
+                    "source": rng.choice(("user_stated", "extracted", "extracted")),
+                    "created_at": stamp, "updated_at": stamp,
+                })
+            counts["user_knowledge"] += _flush(conn, UserKnowledge, knowledge_rows)
+        counts["user_knowledge"] += _flush(conn, UserKnowledge, knowledge_rows, force=True)
+        
+        # Messages: each user's share follows a Pareto weight, split into conversations
+        weights = [rng.paretovariate(PARETO_ALPHA) for _ in user_ids]
+        scale = messages / sum(weights)
+        conversation_rows, message_rows = [], []
+        for i, user_id in enumerate(user_ids):
+            remaining = round(weights[i] * scale)
+            while remaining > 0:
+                length = min(remaining, max(1, int(rng.expovariate(1 / MEAN_CONVERSATION_LENGTH))))
+                remaining -= length
+                conversation_id = _uuid(rng)
+                started = now - rng.randrange(HISTORY_DAYS * 86400)
+                conversation = {
+                    "conversation_id": conversation_id, "user_id": user_id,
+                    "platform_id": platform_ids[i % len(platform_ids)],
+                    "started_at": started, "ended_at": started + length * 30,
+                    "extracted": rng.random() < EXTRACTED_FRACTION,
+                }
+                conversation_rows.append(conversation)
+                for position in range(length):
+                    message_rows.append({
+                        "conversation_id": conversation_id, "is_from_user": position % 2 == 0,
+                        "content": _sentence(rng), "timestamp": started + position * 30,
+                    })
+                # The counters add_message maintains, so list views read like real data
+                last = message_rows[-1]
+                conversation.update(message_count=length, last_message_at=last["timestamp"],
+                                    last_message_preview=message_preview(last["content"]))
+                # Conversations go first so messages never reference a missing row
+                if len(message_rows) >= INSERT_CHUNK:
+                    counts["conversations"] += _flush(conn, Conversation, conversation_rows, force=True)
+                    counts["messages"] += _flush(conn, Message, message_rows, force=True)
+        counts["conversations"] += _flush(conn, Conversation, conversation_rows, force=True)
+        counts["messages"] += _flush(conn, Message, message_rows, force=True)
+    
+    return counts
+
+
+def save_snapshot(database: Database, path: str) -> None:
+    """Write a gzip-compressed copy of the database to path."""
+    database.backup(path, pages_per_step=-1, compress=True)
+
+
+def restore_snapshot(path: str, db_path: str) -> None:
+    """Replace the database file at db_path with the contents of a snapshot.
+    
+    The database must not be open; call callisto.initialize(db_path) afterwards.
+    """
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+    with gzip.open(path, "rb") as src, open(db_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def fixture_ids(database: Database) -> Dict[str, List[str]]:
+    """Return the user and conversation IDs present in the database."""
+    with database.engine.connect() as conn:
+        return {
+            "user_ids": [row[0] for row in conn.execute(
+                sqlalchemy.select(User.user_id).order_by(User.user_id))],
+            "conversation_ids": [row[0] for row in conn.execute(
+                sqlalchemy.select(Conversation.conversation_id).order_by(Conversation.conversation_id))],
+        }
+
+
+def _ensure_categories(conn, needed: int) -> List[tuple]:
+    """Return (category_id, data_type) pairs, adding categories until there are enough."""
+    existing = {row.category_name: row for row in conn.execute(
+        sqlalchemy.select(KnowledgeCategory.category_id, KnowledgeCategory.category_name,
+                          KnowledgeCategory.data_type).order_by(KnowledgeCategory.category_id))}
+    missing = []
+    for i in range(max(0, needed * 2 - len(existing))):
+        name = f"topic_{i}"
+        if name not in existing:
+            # Alternate types so list and string values are both well represented
+            missing.append({"category_name": name, "data_type": "list" if i % 2 else "string",
+                            "is_personal": False})
+    if missing:
+        conn.execute(sqlalchemy.insert(KnowledgeCategory), missing)
+    return [(row.category_id, row.data_type) for row in conn.execute(
+        sqlalchemy.select(KnowledgeCategory.category_id, KnowledgeCategory.data_type)
+        .order_by(KnowledgeCategory.category_id))]
+
+
+def _flush(conn, model, rows: list, force: bool = False) -> int:
+    """Insert buffered rows once a chunk is full (or when forced); return how many."""
+    if not rows or (len(rows) < INSERT_CHUNK and not force):
+        return 0
+    conn.execute(sqlalchemy.insert(model), rows)
+    count = len(rows)
+    rows.clear()
+    return count
+
+
+def _knowledge_value(rng: random.Random, data_type: str) -> str:
+    """Return a stored value in the format KnowledgeManager writes."""
+    if data_type == "list":
+        return json.dumps(rng.sample(_WORDS, rng.randint(1, 5)))
+    if data_type == "date":
+        return f"{rng.randint(1950, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    return rng.choice(_OCCUPATIONS + _LOCATIONS + _WORDS)
+
+
+def _sentence(rng: random.Random) -> str:
+    """Return message text with a log-normal word count."""
+    length = max(1, min(200, int(rng.lognormvariate(2.2, 0.8))))
+    return " ".join(rng.choice(_WORDS) for _ in range(length))
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """Draw from a Poisson distribution (Knuth's method; fine for small means)."""
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def _uuid(rng: random.Random) -> str:
+    """Return a version-4 UUID string drawn from rng."""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
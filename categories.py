@@ -1,36 +1,61 @@
 """Category management for Callisto."""
 from typing import Dict, List, Any, Optional
 
-from .db import db
+from sqlalchemy.orm import Session
+
+from .db import Database
 from .models import KnowledgeCategory
 from .security import sanitize_input
+from . import reference_cache
 
 class CategoryManager:
     """Handles knowledge category operations."""
     
     VALID_DATA_TYPES = ["string", "list", "date", "number", "boolean"]
     
-    @staticmethod
-    def get_categories(include_personal: bool = True) -> List[Dict[str, Any]]:
+    DEFAULT_CATEGORIES = [
+        {"category_name": "location", "data_type": "string", "is_personal": True},
+        {"category_name": "likes", "data_type": "list", "is_personal": False},
+        {"category_name": "dislikes", "data_type": "list", "is_personal": False},
+        {"category_name": "birthday", "data_type": "date", "is_personal": True},
+        {"category_name": "occupation", "data_type": "string", "is_personal": False},
+        {"category_name": "interests", "data_type": "list", "is_personal": False},
+        {"category_name": "preferences", "data_type": "list", "is_personal": False},
+        {"category_name": "family", "data_type": "list", "is_personal": True},
+    ]
+    
+    def __init__(self, database: Database):
+        """Use the given database, or shard router, for every operation."""
+        self.db = database
+    
+    def get_categories(self, include_personal: bool = True) -> List[Dict[str, Any]]:
         """Get all knowledge categories."""
-        with db.session() as session:
-            query = session.query(KnowledgeCategory)
-            if not include_personal:
-                query = query.filter(KnowledgeCategory.is_personal == False)
-                
-            categories = query.all()
-            return [
-                {
-                    "category_name": cat.category_name,
-                    "data_type": cat.data_type,
-                    "is_personal": cat.is_personal
-                }
-                for cat in categories
-            ]
+        with self.db.reference.read_session() as session:
+            return CategoryManager._get_categories(session, include_personal)
     
     @staticmethod
-    def create_category(category_name: str, data_type: str, is_personal: bool = False) -> bool:
+    def _get_categories(session: Session, include_personal: bool = True) -> List[Dict[str, Any]]:
+        """Get all knowledge categories within an existing session."""
+        categories = [cat for cat in reference_cache.categories(session)
+                      if include_personal or not cat.is_personal]
+        return [
+            {
+                "category_name": cat.category_name,
+                "data_type": cat.data_type,
+                "is_personal": cat.is_personal
+            }
+            for cat in categories
+        ]
+    
+    def create_category(self, category_name: str, data_type: str, is_personal: bool = False) -> bool:
         """Create a new knowledge category."""
+        with self.db.reference.session() as session:
+            return CategoryManager._create_category(session, category_name, data_type, is_personal)
+    
+    @staticmethod
+    def _create_category(session: Session, category_name: str, data_type: str, 
+                        is_personal: bool = False) -> bool:
+        """Create a new knowledge category within an existing session."""
         # Validate data_type
         if data_type not in CategoryManager.VALID_DATA_TYPES:
             raise ValueError(f"Data type must be one of {CategoryManager.VALID_DATA_TYPES}")
@@ -38,24 +63,30 @@ class CategoryManager:
         # Sanitize inputs
         category_name = sanitize_input(category_name)
         
-        with db.session() as session:
-            # Check if category already exists
-            existing = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
-            if existing:
-                return False
-                
-            category = KnowledgeCategory(
-                category_name=category_name,
-                data_type=data_type,
-                is_personal=is_personal
-            )
-            session.add(category)
-            return True
+        # Check if category already exists
+        existing = reference_cache.category(session, category_name)
+        if existing:
+            return False
+        
+        category = KnowledgeCategory(
+            category_name=category_name,
+            data_type=data_type,
+            is_personal=is_personal
+        )
+        session.add(category)
+        reference_cache.invalidate(session)
+        return True
     
-    @staticmethod
-    def update_category(category_name: str, data_type: Optional[str] = None, 
+    def update_category(self, category_name: str, data_type: Optional[str] = None, 
                       is_personal: Optional[bool] = None) -> bool:
         """Update an existing knowledge category."""
+        with self.db.reference.session() as session:
+            return CategoryManager._update_category(session, category_name, data_type, is_personal)
+    
+    @staticmethod
+    def _update_category(session: Session, category_name: str, data_type: Optional[str] = None, 
+                        is_personal: Optional[bool] = None) -> bool:
+        """Update an existing knowledge category within an existing session."""
         # Validate data_type if provided
         if data_type and data_type not in CategoryManager.VALID_DATA_TYPES:
             raise ValueError(f"Data type must be one of {CategoryManager.VALID_DATA_TYPES}")
@@ -63,60 +94,57 @@ class CategoryManager:
         # Sanitize inputs
         category_name = sanitize_input(category_name)
         
-        with db.session() as session:
-            category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
-            if not category:
-                return False
-                
-            if data_type:
-                category.data_type = data_type
-            if is_personal is not None:
-                category.is_personal = is_personal
-                
-            return True
+        category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
+        if not category:
+            return False
+        
+        if data_type:
+            category.data_type = data_type
+        if is_personal is not None:
+            category.is_personal = is_personal
+        
+        reference_cache.invalidate(session)
+        return True
     
-    @staticmethod
-    def delete_category(category_name: str) -> bool:
+    def delete_category(self, category_name: str) -> bool:
         """Delete a knowledge category."""
+        with self.db.reference.session() as session:
+            return CategoryManager._delete_category(session, category_name)
+    
+    @staticmethod
+    def _delete_category(session: Session, category_name: str) -> bool:
+        """Delete a knowledge category within an existing session."""
         category_name = sanitize_input(category_name)
         
-        with db.session() as session:
-            category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
-            if not category:
-                return False
-                
-            session.delete(category)
-            return True
+        category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
+        if not category:
+            return False
+        
+        session.delete(category)
+        reference_cache.invalidate(session)
+        return True
     
-    @staticmethod
-    def get_category(category_name: str) -> Optional[Dict[str, Any]]:
+    def get_category(self, category_name: str) -> Optional[Dict[str, Any]]:
         """Get a specific category by name."""
+        with self.db.reference.read_session() as session:
+            return CategoryManager._get_category(session, category_name)
+    
+    @staticmethod
+    def _get_category(session: Session, category_name: str) -> Optional[Dict[str, Any]]:
+        """Get a specific category by name within an existing session."""
         category_name = sanitize_input(category_name)
         
-        with db.session() as session:
-            category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
-            if not category:
-                return None
-                
-            return {
-                "category_name": category.category_name,
-                "data_type": category.data_type,
-                "is_personal": category.is_personal
-            }
-            
-    @staticmethod
-    def create_default_categories() -> None:
-        """Create default knowledge categories."""
-        default_categories = [
-            {"category_name": "location", "data_type": "string", "is_personal": True},
-            {"category_name": "likes", "data_type": "list", "is_personal": False},
-            {"category_name": "dislikes", "data_type": "list", "is_personal": False},
-            {"category_name": "birthday", "data_type": "date", "is_personal": True},
-            {"category_name": "occupation", "data_type": "string", "is_personal": False},
-            {"category_name": "interests", "data_type": "list", "is_personal": False},
-            {"category_name": "preferences", "data_type": "list", "is_personal": False},
-            {"category_name": "family", "data_type": "list", "is_personal": True},
-        ]
+        category = reference_cache.category(session, category_name)
+        if not category:
+            return None
         
-        for cat in default_categories:
-            CategoryManager.create_category(**cat)
\ No newline at end of file
+        return {
+            "category_name": category.category_name,
+            "data_type": category.data_type,
+            "is_personal": category.is_personal
+        }
+    
+    def create_default_categories(self) -> None:
+        """Create default knowledge categories."""
+        for cat in CategoryManager.DEFAULT_CATEGORIES:
+            self.create_category(**cat)
\ No newline at end of file
@@ -0,0 +1,382 @@
+"""Transparent compression of message content.
+
+Short chat lines barely compress on their own, so content is compressed
+against a dictionary trained on the database's own messages: with zstd when
+the optional ``zstandard`` package is installed, otherwise with zlib's preset
+dictionary support. Compressed values are stored as BLOBs that start with a
+format byte (and, for dictionary formats, the 4-byte ID of the dictionary);
+plain TEXT values are read back unchanged, so rows written before
+compression was enabled, or too short to benefit, stay readable.
+
+Dictionaries live in the ``compression_dictionaries`` table. Each Database
+encodes only with a dictionary stored in it (``Database.dictionary_id``),
+made current for the thread by its write sessions, so a file never holds
+content it cannot decode by itself. Decoding looks dictionaries up in a
+process-wide registry, since values are decoded wherever a Message is
+loaded; dictionary IDs are a CRC of the dictionary bytes, so they are the
+same in every database and process.
+"""
+import atexit
+import collections
+import re
+import struct
+import threading
+import time
+import weakref
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib dictionaries are used instead
+    zstandard = None
+
+# Format byte at the start of every compressed value
+FORMAT_ZLIB = 1        # raw deflate, no dictionary
+FORMAT_ZLIB_DICT = 2   # raw deflate with a preset dictionary
+FORMAT_ZSTD_DICT = 3   # zstd with a trained dictionary
+
+# Content shorter than this (in UTF-8 bytes) is stored as plain text
+DICT_THRESHOLD = 48
+ZLIB_THRESHOLD = 256
+
+DICTIONARY_SIZE = 16 * 1024  # zlib only uses the last 32 KiB of a dictionary
+COMPRESSION_LEVEL = 6
+ZSTD_LEVEL = 9
+
+_HEADER = struct.Struct(">BI")
+
+# dictionary_id -> (format, dictionary bytes)
+_dictionaries: Dict[int, tuple] = {}
+# Databases dictionaries were loaded from, to look for ones trained elsewhere
+_sources = weakref.WeakSet()
+_lock = threading.Lock()
+_scope = threading.local()
+# Per-thread compressor objects, keyed by dictionary
+_codecs = threading.local()
+
+
+@contextmanager
+def dictionary_scope(dictionary_id: Optional[int]) -> Iterator[None]:
+    """Compress content written by this thread with a dictionary (None for none)."""
+    previous = getattr(_scope, "dictionary_id", None)
+    _scope.dictionary_id = dictionary_id
+    try:
+        yield
+    finally:
+        _scope.dictionary_id = previous
+
+
+def register_dictionary(dictionary_id: int, fmt: int, data: bytes) -> None:
+    """Make a dictionary available for decoding."""
+    with _lock:
+        _dictionaries[dictionary_id] = (fmt, data)
+
+
+def load_dictionaries(database) -> int:
+    """Load the dictionaries stored in a database and encode with the newest usable one.
+    
+    ``database`` may be a Database or a ShardRouter. Returns how many were
+    loaded; 0 if the table does not exist yet.
+    """
+    from .models import CompressionDictionary
+    
+    try:
+        with database.reference.read_session() as session:
+            rows = session.query(CompressionDictionary).order_by(CompressionDictionary.created_at).all()
+    except OperationalError:
+        return 0
+    
+    _sources.add(database)
+    newest = None
+    for row in rows:
+        register_dictionary(row.dictionary_id, row.format, row.data)
+        if row.format != FORMAT_ZSTD_DICT or zstandard is not None:
+            newest = row.dictionary_id
+    _set_dictionary(database, newest)
+    return len(rows)
+
+
+def _set_dictionary(database, dictionary_id: Optional[int]) -> None:
+    """Make a dictionary the one a database (or every database of a router) encodes with."""
+    for target in [database.reference] + list(database.shards):
+        target.dictionary_id = dictionary_id
+
+
+def _dictionary(dictionary_id: int) -> tuple:
+    """Return a registered dictionary, reloading from known databases if needed."""
+    if dictionary_id not in _dictionaries:
+        # Another process may have trained it since we last looked
+        for database in list(_sources):
+            load_dictionaries(database)
+        if dictionary_id not in _dictionaries:
+            raise ValueError(f"Invalid compressed content: unknown dictionary {dictionary_id:#010x}")
+    return _dictionaries[dictionary_id]
+
+
+# CODEC
+
+def encode(text: Optional[str], dictionary_id: Optional[int] = None) -> Union[str, bytes, None]:
+    """Compress text if that makes it smaller; otherwise return it unchanged.
+    
+    Uses the given dictionary, or else the one of the current dictionary_scope().
+    """
+    if text is None:
+        return None
+    raw = text.encode("utf-8")
+    
+    if dictionary_id is None:
+        dictionary_id = getattr(_scope, "dictionary_id", None)
+    if dictionary_id is not None and len(raw) >= DICT_THRESHOLD:
+        fmt, data = _dictionaries[dictionary_id]
+        if fmt == FORMAT_ZSTD_DICT:
+            body = _zstd_compressor(dictionary_id, data).compress(raw)
+        else:
+            compressor = _zlib_compressor(dictionary_id, data)
+            body = compressor.compress(raw) + compressor.flush()
+        value = _HEADER.pack(fmt, dictionary_id) + body
+    elif len(raw) >= ZLIB_THRESHOLD:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+        value = bytes([FORMAT_ZLIB]) + compressor.compress(raw) + compressor.flush()
+    else:
+        return text
+    
+    return value if len(value) < len(raw) else text
+
+
+def decode(value: Union[str, bytes, None]) -> Optional[str]:
+    """Return the text of a stored value, compressed or not."""
+    if value is None or isinstance(value, str):
+        return value
+    
+    fmt = value[0]
+    if fmt == FORMAT_ZLIB:
+        return zlib.decompress(value[1:], -15).decode("utf-8")
+    if fmt in (FORMAT_ZLIB_DICT, FORMAT_ZSTD_DICT):
+        _, dictionary_id = _HEADER.unpack_from(value)
+        _, data = _dictionary(dictionary_id)
+        body = value[_HEADER.size:]
+        if fmt == FORMAT_ZSTD_DICT:
+            return _zstd_decompressor(dictionary_id, data).decompress(body).decode("utf-8")
+        decompressor = zlib.decompressobj(-15, zdict=data)
+        return (decompressor.decompress(body) + decompressor.flush()).decode("utf-8")
+    raise ValueError(f"Invalid compressed content: unknown format {fmt}")
+
+
+def is_current(value: Union[str, bytes, None], dictionary_id: Optional[int]) -> bool:
+    """Return True if a stored value is already encoded the way encode() would."""
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) < (DICT_THRESHOLD if dictionary_id is not None else ZLIB_THRESHOLD)
+    if dictionary_id is None:
+        return value[0] == FORMAT_ZLIB
+    return value[0] != FORMAT_ZLIB and _HEADER.unpack_from(value)[1] == dictionary_id
+
+
+def _zlib_compressor(dictionary_id: int, data: bytes):
+    """Return a fresh zlib compressor primed with a dictionary.
+    
+    Loading a 16 KiB dictionary costs more than compressing a chat line, so
+    a primed compressor is kept per dictionary and copied for each value.
+    """
+    cache = _codecs.__dict__.setdefault("zlib_compressors", {})
+    if dictionary_id not in cache:
+        cache[dictionary_id] = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15, zdict=data)
+    return cache[dictionary_id].copy()
+
+
+def _zstd_compressor(dictionary_id: int, data: bytes):
+    """Return this thread's zstd compressor for a dictionary (they are not thread-safe)."""
+    cache = _codecs.__dict__.setdefault("compressors", {})
+    if dictionary_id not in cache:
+        cache[dictionary_id] = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL, dict_data=zstandard.ZstdCompressionDict(data),
+            write_checksum=False, write_content_size=True, write_dict_id=False)
+    return cache[dictionary_id]
+
+
+def _zstd_decompressor(dictionary_id: int, data: bytes):
+    """Return this thread's zstd decompressor for a dictionary."""
+    if zstandard is None:
+        raise ValueError("Invalid compressed content: zstd content needs the zstandard package")
+    cache = _codecs.__dict__.setdefault("decompressors", {})
+    if dictionary_id not in cache:
+        cache[dictionary_id] = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(data))
+    return cache[dictionary_id]
+
+
+class CompressedText(TypeDecorator):
+    """Text column whose values are compressed on write and decoded on read."""
+    impl = Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        return encode(value)
+    
+    def process_result_value(self, value, dialect):
+        return decode(value)
+
+
+# TRAINING
+
+def train_dictionary(database, samples: int = 5000, size: int = DICTIONARY_SIZE) -> int:
+    """Train a dictionary on recent messages, store it and use it from now on.
+    
+    ``database`` may be a Database or a ShardRouter; samples are drawn from
+    every shard and the dictionary is stored in the reference database.
+    Returns the new dictionary's ID.
+    """
+    from .models import CompressionDictionary, Message
+    
+    texts = []
+    for shard in database.shards:
+        with shard.read_session() as session:
+            texts.extend(content for content, in session.query(Message.content)
+                         .order_by(Message.message_id.desc())
+                         .limit(max(1, samples // len(database.shards))))
+    if not texts:
+        raise ValueError("Invalid training set: there are no messages to train on")
+    
+    encoded = [text.encode("utf-8") for text in texts]
+    if zstandard is not None and len(encoded) >= 10:
+        fmt = FORMAT_ZSTD_DICT
+        data = zstandard.train_dictionary(size, encoded).as_bytes()
+    else:
+        fmt = FORMAT_ZLIB_DICT
+        data = _build_zlib_dictionary(encoded, size)
+    dictionary_id = zlib.crc32(data)
+    
+    with database.reference.session() as session:
+        session.merge(CompressionDictionary(
+            dictionary_id=dictionary_id, format=fmt, data=data, created_at=int(time.time())))
+    _sources.add(database)
+    register_dictionary(dictionary_id, fmt, data)
+    _set_dictionary(database, dictionary_id)
+    return dictionary_id
+
+
+def _build_zlib_dictionary(samples: List[bytes], size: int) -> bytes:
+    """Pack the substrings that save the most bytes into a zlib preset dictionary.
+    
+    Candidates are words and word pairs (with their separators); each scores
+    its length times the number of messages containing it. zlib finds nearby
+    matches more cheaply, so the best candidates go at the end.
+    """
+    counts = collections.Counter()
+    for sample in samples:
+        tokens = re.findall(rb"\S+\s*", sample)
+        seen = set(tokens)
+        seen.update(a + b for a, b in zip(tokens, tokens[1:]))
+        counts.update(seen)
+    
+    scored = sorted(((count * len(token), token) for token, count in counts.items() if count > 1 and len(token) > 2),
+                    reverse=True)
+    chosen, total = [], 0
+    for _, token in scored:
+        if total + len(token) > size:
+            continue
+        chosen.append(token)
+        total += len(token)
+    return b"".join(reversed(chosen))
+
+
+# RECOMPRESSION
+
+class RecompressionJob:
+    """Rewrites stored messages that are not encoded with the current dictionary.
+    
+    Covers rows written before compression (or before the latest dictionary
+    was trained). Works through ``messages`` in primary-key order, one short
+    writer transaction per batch of ``batch_size`` rows, and can run in a
+    background thread.
+    """
+    
+    def __init__(self, database, batch_size: int = 500, pause: float = 0.05):
+        """Create a job over a Database; call start() or run_once()."""
+        if batch_size < 1:
+            raise ValueError("Invalid batch_size: must be at least 1")
+        self.database = database
+        self.batch_size = batch_size
+        self.pause = pause
+        self.last_id = 0
+        
+        self._lock = threading.Lock()
+        self._stats = {"scanned": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0, "last_error": None}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def run_batch(self) -> int:
+        """Recompress the next batch; return how many rows were scanned."""
+        with self.database.session() as session:
+            # Raw values: the ORM type would decode them
+            rows = session.connection().exec_driver_sql(
+                "SELECT message_id, content FROM messages WHERE message_id > ? ORDER BY message_id LIMIT ?",
+                (self.last_id, self.batch_size)).fetchall()
+            
+            dictionary_id = self.database.dictionary_id
+            rewritten, before, after = [], 0, 0
+            for message_id, value in rows:
+                if is_current(value, dictionary_id):
+                    continue
+                new_value = encode(decode(value), dictionary_id)
+                if new_value == value:
+                    continue
+                rewritten.append((new_value, message_id))
+                before += len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+                after += len(new_value) if isinstance(new_value, bytes) else len(new_value.encode("utf-8"))
+            if rewritten:
+                session.connection().exec_driver_sql(
+                    "UPDATE messages SET content = ? WHERE message_id = ?", rewritten)
+        
+        if rows:
+            self.last_id = rows[-1][0]
+        with self._lock:
+            self._stats["scanned"] += len(rows)
+            self._stats["rewritten"] += len(rewritten)
+            self._stats["bytes_before"] += before
+            self._stats["bytes_after"] += after
+        return len(rows)
+    
+    def run_once(self) -> Dict[str, Any]:
+        """Recompress every message from the start; return the totals so far."""
+        self.last_id = 0
+        while not self._stop.is_set() and self.run_batch() == self.batch_size:
+            # Let foreground writes at the writer between batches
+            self._stop.wait(self.pause)
+        return self.stats()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return totals over every batch run so far."""
+        with self._lock:
+            return dict(self._stats)
+    
+    def start(self) -> None:
+        """Run one full pass in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="callisto-recompression", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        """Stop the background thread after its current batch."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.stop)
+    
+    def _run(self) -> None:
+        """Background pass; errors are recorded rather than raised."""
+        try:
+            self.run_once()
+        except Exception as e:
+            with self._lock:
+                self._stats["last_error"] = repr(e)
@@ -1,47 +1,299 @@
 """Conversation management for Callisto."""
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 
-from .db import db
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.orm import Session
+
+from .db import Database
 from .models import Conversation, Message
+from .records import ContextMessageRecord, ConversationRecord, MessageRecord
+from .tokens import count_tokens
+
+# Markers around matched terms in search snippets, and snippet length in tokens
+SNIPPET_START = "["
+SNIPPET_END = "]"
+SNIPPET_TOKENS = 16
+
+# Position of a message in its conversation: (timestamp, message_id)
+Cursor = Tuple[int, int]
+
+# Columns read into records, in the order of the record fields
+CONVERSATION_COLUMNS = (Conversation.conversation_id, Conversation.user_id, Conversation.started_at,
+                        Conversation.ended_at, Conversation.extracted, Conversation.message_count,
+                        Conversation.last_message_at, Conversation.last_message_preview)
+MESSAGE_COLUMNS = (Message.message_id, Message.is_from_user, Message.content, Message.timestamp)
+
+_SEARCH_SQL = """
+    SELECT m.message_id, m.conversation_id, m.is_from_user, m.timestamp,
+           snippet(messages_fts, 0, :start, :end, '…', :tokens) AS snippet,
+           bm25(messages_fts, 1.0, 0.0) AS rank
+    FROM messages_fts JOIN messages m ON m.message_id = messages_fts.rowid
+    WHERE messages_fts MATCH :match {since}
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+# Walks a conversation back from its newest message, one index seek per step,
+# and stops at the first message that would overflow the token budget
+_CONTEXT_WINDOW_SQL = """
+    WITH RECURSIVE recent(message_id, timestamp, used, n) AS (
+        SELECT message_id, timestamp, token_count, 1 FROM (
+            SELECT message_id, timestamp, token_count FROM messages
+            WHERE conversation_id = :conversation_id
+            ORDER BY timestamp DESC, message_id DESC LIMIT 1
+        ) WHERE token_count <= :max_tokens
+        UNION ALL
+        SELECT m.message_id, m.timestamp, recent.used + m.token_count, recent.n + 1
+        FROM recent JOIN messages m ON m.message_id = (
+            SELECT message_id FROM messages
+            WHERE conversation_id = :conversation_id
+              AND (timestamp, message_id) < (recent.timestamp, recent.message_id)
+            ORDER BY timestamp DESC, message_id DESC LIMIT 1)
+        WHERE recent.used + m.token_count <= :max_tokens AND recent.n < :max_messages
+    )
+    SELECT messages.message_id, messages.is_from_user, messages.content, messages.timestamp,
+           messages.token_count
+    FROM recent JOIN messages ON messages.message_id = recent.message_id
+    ORDER BY messages.timestamp, messages.message_id
+"""
 
 class ConversationManager:
     """Handles conversation operations."""
     
+    def __init__(self, database: Database):
+        """Use the given database, or shard router, for every operation."""
+        self.db = database
+    
+    def get_conversation_history(self, conversation_id: str) -> List[MessageRecord]:
+        """Get all messages in a conversation, including archived ones."""
+        database = self.db.for_conversation(conversation_id)
+        with database.read_session() as session:
+            history, archived = ConversationManager._get_hot_history(session, conversation_id)
+        
+        if archived:
+            # Messages added after archiving are still in the hot table
+            history = (database.open_archive().load(conversation_id) or []) + history
+        return history
+    
     @staticmethod
-    def get_conversation_history(conversation_id: str) -> List[Dict[str, Any]]:
-        """Get all messages in a conversation."""
-        with db.session() as session:
-            messages = (session.query(Message)
-                .filter_by(conversation_id=conversation_id)
-                .order_by(Message.timestamp)
-                .all())
-                
-            return [
-                {
-                    "message_id": message.message_id,
-                    "is_from_user": message.is_from_user,
-                    "content": message.content,
-                    "timestamp": message.timestamp
-                }
-                for message in messages
-            ]
-    
-    @staticmethod
-    def get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific conversation by ID."""
-        with db.session() as session:
-            conv = session.query(Conversation).filter_by(conversation_id=conversation_id).first()
-            if not conv:
-                return None
-                
-            # Get message count
-            message_count = session.query(Message).filter_by(conversation_id=conversation_id).count()
+    def _get_hot_history(session: Session, conversation_id: str) -> Tuple[List[MessageRecord], bool]:
+        """Get the messages still in the hot table, and whether older ones are in the archive."""
+        return (ConversationManager._get_conversation_history(session, conversation_id),
+                ConversationManager._is_archived(session, conversation_id))
+    
+    @staticmethod
+    def _get_conversation_history(session: Session, conversation_id: str) -> List[MessageRecord]:
+        """Get all messages in a conversation within an existing session."""
+        rows = session.execute(select(*MESSAGE_COLUMNS)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.timestamp, Message.message_id))
+        
+        return [MessageRecord(*row) for row in rows]
+    
+    def get_history_page(self, conversation_id: str, limit: int = 50, before: Optional[Cursor] = None,
+                         after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Get up to limit consecutive messages of a conversation, oldest first.
+        
+        Without a cursor this is the latest page. Pass the cursor of the first
+        message of a page as ``before`` to get the page before it, or of the
+        last message as ``after`` to get the page after it.
+        """
+        database = self.db.for_conversation(conversation_id)
+        with database.read_session() as session:
+            page = ConversationManager._get_history_page(session, conversation_id, limit, before, after)
+            archived = ConversationManager._is_archived(session, conversation_id)
+        
+        if archived:
+            archived_messages = database.open_archive().load(conversation_id) or []
+            page = ConversationManager._select_page(archived_messages + page, limit, before, after)
+        return page
+    
+    @staticmethod
+    def _get_history_page(session: Session, conversation_id: str, limit: int = 50,
+                          before: Optional[Cursor] = None, after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Get a page of messages within an existing session."""
+        # Row-value comparisons are served by idx_messages_conversation_timestamp,
+        # which ends in the rowid (message_id)
+        position = tuple_(Message.timestamp, Message.message_id)
+        query = select(*MESSAGE_COLUMNS).where(Message.conversation_id == conversation_id)
+        if before is not None:
+            query = query.where(position < tuple_(*before))
+        if after is not None:
+            query = query.where(position > tuple_(*after))
+        
+        if after is None:
+            # Walk back from the end, then return the page in reading order
+            messages = [MessageRecord(*row) for row in session.execute(
+                query.order_by(Message.timestamp.desc(), Message.message_id.desc()).limit(limit))]
+            messages.reverse()
+        else:
+            messages = [MessageRecord(*row) for row in session.execute(
+                query.order_by(Message.timestamp, Message.message_id).limit(limit))]
+        
+        return messages
+    
+    @staticmethod
+    def _get_history_batch(session: Session, conversation_id: str, limit: int,
+                           after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Get up to limit messages following after, or from the first, within an existing session."""
+        query = select(*MESSAGE_COLUMNS).where(Message.conversation_id == conversation_id)
+        if after is not None:
+            query = query.where(tuple_(Message.timestamp, Message.message_id) > tuple_(*after))
+        rows = session.execute(query.order_by(Message.timestamp, Message.message_id).limit(limit))
+        return [MessageRecord(*row) for row in rows]
+    
+    @staticmethod
+    def _select_page(messages: List[MessageRecord], limit: int, before: Optional[Cursor] = None,
+                     after: Optional[Cursor] = None) -> List[MessageRecord]:
+        """Pick the same page as _get_history_page from messages already in memory."""
+        messages = sorted(messages, key=lambda m: (m["timestamp"], m["message_id"]))
+        if before is not None:
+            messages = [m for m in messages if (m["timestamp"], m["message_id"]) < tuple(before)]
+        if after is not None:
+            messages = [m for m in messages if (m["timestamp"], m["message_id"]) > tuple(after)]
+        return messages[:limit] if after is not None else messages[-limit:]
+    
+    def get_context_window(self, conversation_id: str, max_tokens: int,
+                           max_messages: Optional[int] = None) -> List[ContextMessageRecord]:
+        """Get the most recent messages that fit in max_tokens, oldest first."""
+        database = self.db.for_conversation(conversation_id)
+        with database.read_session() as session:
+            window = ConversationManager._get_context_window(session, conversation_id, max_tokens, max_messages)
+            archived = ConversationManager._window_reaches_archive(session, conversation_id, window)
+        
+        if archived:
+            archived_messages = database.open_archive().load(conversation_id) or []
+            window = ConversationManager._extend_window(window, archived_messages, max_tokens, max_messages)
+        return window
+    
+    @staticmethod
+    def _window_reaches_archive(session: Session, conversation_id: str, window: List[ContextMessageRecord]) -> bool:
+        """Return True if a context window may continue into archived messages."""
+        # Older messages are only in the archive if every hot one fitted
+        return (ConversationManager._is_archived(session, conversation_id)
+                and len(window) == session.query(Message).filter_by(conversation_id=conversation_id).count())
+    
+    @staticmethod
+    def _extend_window(window: List[ContextMessageRecord], archived_messages: List[MessageRecord],
+                       max_tokens: int, max_messages: Optional[int] = None) -> List[ContextMessageRecord]:
+        """Keep walking back through the archived messages, which predate the hot ones."""
+        used = sum(message["token_count"] for message in window)
+        room = max_messages - len(window) if max_messages is not None else None
+        older = []
+        for message in reversed(archived_messages):
+            tokens = count_tokens(message["content"])
+            if used + tokens > max_tokens or len(older) == room:
+                break
+            used += tokens
+            older.append(ContextMessageRecord(*message.values(), tokens))
+        return older[::-1] + window
+    
+    @staticmethod
+    def _get_context_window(session: Session, conversation_id: str, max_tokens: int,
+                            max_messages: Optional[int] = None) -> List[ContextMessageRecord]:
+        """Get the most recent messages that fit in max_tokens within an existing session."""
+        # Every message costs at least one token, so no more than max_tokens can fit
+        limit = max_tokens if max_messages is None else min(max_tokens, max_messages)
+        if limit < 1:
+            return []
+        # Typed columns so content is decompressed and is_from_user read as a bool
+        statement = text(_CONTEXT_WINDOW_SQL).columns(
+            *(column.expression for column in MESSAGE_COLUMNS), Message.token_count.expression)
+        rows = session.execute(statement, {
+            "conversation_id": conversation_id, "max_tokens": max_tokens, "max_messages": limit})
+        
+        return [ContextMessageRecord(*row) for row in rows]
+    
+    def iter_conversation_history(self, conversation_id: str, batch_size: int = 500) -> Iterator[MessageRecord]:
+        """Yield every message in a conversation, oldest first, batch_size rows at a time.
+        
+        A read connection stays checked out until the generator is exhausted
+        or closed.
+        """
+        database = self.db.for_conversation(conversation_id)
+        with database.read_session() as session:
+            if ConversationManager._is_archived(session, conversation_id):
+                yield from database.open_archive().load(conversation_id) or []
             
-            return {
-                "conversation_id": conv.conversation_id,
-                "user_id": conv.user_id,
-                "started_at": conv.started_at,
-                "ended_at": conv.ended_at,
-                "processed": conv.extracted,
-                "message_count": message_count
-            }
\ No newline at end of file
+            rows = session.execute(select(*MESSAGE_COLUMNS)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.timestamp, Message.message_id)
+                .execution_options(stream_results=True))
+            for row in rows.yield_per(batch_size):
+                yield MessageRecord(*row)
+    
+    def search_messages(self, user_id: str, query: str, limit: int = 20,
+                        since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Full-text search over a user's messages, best matches first."""
+        with self.db.for_user(user_id).read_session() as session:
+            return ConversationManager._search_messages(session, user_id, query, limit, since)
+    
+    @staticmethod
+    def _search_messages(session: Session, user_id: str, query: str, limit: int = 20,
+                         since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Full-text search over a user's messages within an existing session."""
+        match = ConversationManager._match_expression(user_id, query)
+        if match is None:
+            return []
+        
+        params = {"match": match, "limit": limit, "start": SNIPPET_START, "end": SNIPPET_END,
+                  "tokens": SNIPPET_TOKENS}
+        if since is not None:
+            params["since"] = since
+        rows = session.execute(
+            text(_SEARCH_SQL.format(since="AND m.timestamp >= :since" if since is not None else "")), params)
+        
+        return [
+            {
+                "message_id": row.message_id,
+                "conversation_id": row.conversation_id,
+                "is_from_user": bool(row.is_from_user),
+                "timestamp": row.timestamp,
+                "snippet": row.snippet,
+                # bm25() is lower for better matches
+                "score": -row.rank
+            }
+            for row in rows
+        ]
+    
+    @staticmethod
+    def _match_expression(user_id: str, query: str) -> Optional[str]:
+        """Build an FTS5 query matching every term of query in one user's messages.
+        
+        Terms are quoted so punctuation in user input is never read as FTS5
+        syntax; a trailing * keeps its meaning as a prefix search.
+        """
+        terms = []
+        for term in query.split():
+            prefix = term.endswith("*")
+            term = term.rstrip("*")
+            if term:
+                terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+        if not terms:
+            return None
+        return f'user_token : "{user_id.replace("-", "")}" AND content : ({" ".join(terms)})'
+    
+    @staticmethod
+    def _is_archived(session: Session, conversation_id: str) -> bool:
+        """Return True if a conversation's messages were moved to the archive."""
+        return session.query(Conversation.archived_at).filter_by(
+            conversation_id=conversation_id).scalar() is not None
+    
+    @staticmethod
+    def _has_archived(session: Session, user_id: str) -> bool:
+        """Return True if any of a user's conversations were moved to the archive."""
+        return session.query(Conversation.conversation_id).filter(
+            Conversation.user_id == user_id, Conversation.archived_at.isnot(None)).first() is not None
+    
+    def get_conversation(self, conversation_id: str) -> Optional[ConversationRecord]:
+        """Get a specific conversation by ID."""
+        with self.db.for_conversation(conversation_id).read_session() as session:
+            return ConversationManager._get_conversation(session, conversation_id)
+    
+    @staticmethod
+    def _get_conversation(session: Session, conversation_id: str) -> Optional[ConversationRecord]:
+        """Get a specific conversation by ID within an existing session."""
+        row = session.execute(select(*CONVERSATION_COLUMNS)
+            .where(Conversation.conversation_id == conversation_id)).first()
+        return ConversationRecord(*row) if row is not None else None
+
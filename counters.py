@@ -0,0 +1,155 @@
+"""Message counters kept on each conversation.
+
+``Conversation.message_count``, ``last_message_at`` and
+``last_message_preview`` are updated in the same transaction as the
+messages they describe (see CallistoAPI._add_message and
+_store_conversation), so listing conversations needs no per-row COUNT.
+Archiving moves messages out of the hot table but leaves the counters
+alone. repair_counters() recomputes them from the messages themselves.
+"""
+import atexit
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+
+from .models import Conversation, Message
+
+# Characters of the latest message kept in Conversation.last_message_preview
+PREVIEW_LENGTH = 80
+
+_PARTIAL_ENTITY = re.compile(r"&#?\w*$")
+
+
+def message_preview(content: str) -> str:
+    """Return the start of a message, as stored in last_message_preview."""
+    if len(content) <= PREVIEW_LENGTH:
+        return content
+    # Content is HTML-escaped by sanitize_input; don't leave half an entity
+    return _PARTIAL_ENTITY.sub("", content[:PREVIEW_LENGTH - 1]) + "…"
+
+
+def repair_counters(conn: Connection, after_id: str = "", batch_size: int = 500,
+                    archive=None) -> Tuple[Optional[str], int, int]:
+    """Recompute the message counters of the next batch of conversations after after_id.
+    
+    Returns the last conversation_id checked, to pass back in for the next
+    batch (None once there are no more), how many conversations were read
+    and how many had wrong counters. Archived conversations are only checked when their
+    archive is given, since their messages are no longer in this database.
+    """
+    conversations, messages = Conversation.__table__, Message.__table__
+    rows = conn.execute(
+        select(conversations.c.conversation_id, conversations.c.archived_at, conversations.c.message_count,
+               conversations.c.last_message_at, conversations.c.last_message_preview)
+        .where(conversations.c.conversation_id > after_id)
+        .order_by(conversations.c.conversation_id)
+        .limit(batch_size)).fetchall()
+    if not rows:
+        return None, 0, 0
+    
+    repaired = 0
+    for conversation_id, archived_at, *stored in rows:
+        if archived_at is not None and archive is None:
+            continue
+        in_conversation = messages.c.conversation_id == conversation_id
+        count = conn.execute(select(func.count()).select_from(messages).where(in_conversation)).scalar()
+        latest = conn.execute(
+            select(messages.c.timestamp, messages.c.message_id, messages.c.content)
+            .where(in_conversation)
+            .order_by(messages.c.timestamp.desc(), messages.c.message_id.desc())
+            .limit(1)).first()
+        candidates = [tuple(latest)] if latest is not None else []
+        if archived_at is not None:
+            archived = archive.load(conversation_id) or []
+            count += len(archived)
+            candidates.extend((m["timestamp"], m["message_id"], m["content"]) for m in archived)
+        
+        latest = max(candidates, default=None, key=lambda m: (m[0], m[1]))
+        actual = [count, latest[0], message_preview(latest[2])] if latest else [count, None, None]
+        if actual != stored:
+            conn.execute(conversations.update()
+                .where(conversations.c.conversation_id == conversation_id)
+                .values(message_count=actual[0], last_message_at=actual[1], last_message_preview=actual[2]))
+            repaired += 1
+    return rows[-1][0], len(rows), repaired
+
+
+class CounterRepairJob:
+    """Recomputes the message counters kept on conversations.
+    
+    The counters are maintained as messages are written, so this is only
+    needed after a crash or manual edits, or after upgrading a database
+    whose conversations were archived before the counters existed. Works
+    through ``conversations`` in primary-key order, one short writer
+    transaction per batch, and can run in a background thread. Open the
+    database's archive first so archived conversations are checked too.
+    """
+    
+    def __init__(self, database, batch_size: int = 500, pause: float = 0.05):
+        """Create a job over a Database; call start() or run_once()."""
+        if batch_size < 1:
+            raise ValueError("Invalid batch_size: must be at least 1")
+        self.database = database
+        self.batch_size = batch_size
+        self.pause = pause
+        self.last_id = ""
+        
+        self._lock = threading.Lock()
+        self._stats = {"scanned": 0, "repaired": 0, "last_error": None}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def run_batch(self) -> int:
+        """Check the next batch of conversations; return how many were scanned."""
+        with self.database.session() as session:
+            last_id, scanned, repaired = repair_counters(session.connection(), self.last_id, self.batch_size,
+                                                         self.database.archive)
+        
+        if last_id is not None:
+            self.last_id = last_id
+        with self._lock:
+            self._stats["scanned"] += scanned
+            self._stats["repaired"] += repaired
+        return scanned
+    
+    def run_once(self) -> Dict[str, Any]:
+        """Check every conversation from the start; return the totals so far."""
+        self.last_id = ""
+        while not self._stop.is_set() and self.run_batch() == self.batch_size:
+            # Let foreground writes at the writer between batches
+            self._stop.wait(self.pause)
+        return self.stats()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return totals over every batch run so far."""
+        with self._lock:
+            return dict(self._stats)
+    
+    def start(self) -> None:
+        """Run one full pass in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="callisto-counter-repair", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        """Stop the background thread after its current batch."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.stop)
+    
+    def _run(self) -> None:
+        """Background pass; errors are recorded rather than raised."""
+        try:
+            self.run_once()
+        except Exception as e:
+            with self._lock:
+                self._stats["last_error"] = repr(e)
@@ -1,62 +1,689 @@
 """Database connection and session management for Callisto."""
 import os
+import gzip
 import json
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
 from contextlib import contextmanager
-from typing import Iterator, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.schema import Table
 
 from .models import Base
+from .migrations import run_migrations
+from .metrics import metrics
+from . import reference_cache
+from .identity_cache import IdentityCache
+from .profile_cache import ProfileCache
+from . import compression
+
+# Named SQLite storage profiles. Each entry lists the PRAGMAs applied to every
+# pooled connection plus the pool used for read-only connections. Writes always
+# go through a single dedicated connection (see Database.session).
+#   durable    - WAL with a full fsync on every commit
+#   balanced   - WAL with fsync only at checkpoints; safe against app crashes
+#   throughput - no fsync at all, large caches; for bulk loads and benchmarks
+STORAGE_PROFILES = {
+    "durable": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "cache_size": -8000,  # KiB when negative
+            "mmap_size": 0,
+            "temp_store": "DEFAULT",
+            "busy_timeout": 5000,  # milliseconds
+        },
+        "pool": {"poolclass": QueuePool, "pool_size": 5, "max_overflow": 5},
+    },
+    "balanced": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -32000,
+            "mmap_size": 64 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+        "pool": {"poolclass": QueuePool, "pool_size": 5, "max_overflow": 5},
+    },
+    "throughput": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "cache_size": -128000,
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+            "busy_timeout": 10000,
+        },
+        # Enough pooled readers for bulk loads and benchmarks running many
+        # reader threads; connections are reused so their page caches stay warm
+        "pool": {"poolclass": QueuePool, "pool_size": 16, "max_overflow": 16},
+    },
+}
+
+DEFAULT_PROFILE = "balanced"
+
+# How long a write waits in the queue for the writer connection, in seconds
+WRITER_QUEUE_TIMEOUT = 30
+
+# Online backup: pages copied per step and pause between steps, in seconds
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+# Restarts (caused by writes from other connections) tolerated before the
+# backup falls back to copying everything from a single read snapshot
+BACKUP_MAX_RESTARTS = 3
+
+# SQLite error messages that clear up on their own once the lock holder is done
+TRANSIENT_ERRORS = ("database is locked", "database table is locked", "database schema has changed")
+
+
+def _apply_pragmas(dbapi_connection, pragmas: dict) -> None:
+    """Apply PRAGMA settings to a raw DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _register_functions(dbapi_connection) -> None:
+    """Register the SQL functions used by the schema's triggers and views."""
+    # Decodes compressed message content for the full-text index
+    dbapi_connection.create_function("callisto_text", 1, compression.decode, deterministic=True)
+
+
+class _BackupRestarted(Exception):
+    """Raised from the progress callback to abandon a stepwise backup."""
+
+
+def _copy_database(source: sqlite3.Connection, target: sqlite3.Connection, pages_per_step: int,
+                   sleep: float, progress: Optional[Callable[[int, int], None]]) -> Dict[str, Any]:
+    """Copy source into target with the SQLite online backup API.
+    
+    Each step holds the source's read lock only briefly. A write from another
+    connection makes SQLite restart the copy; if that keeps happening, the
+    copy is redone in one step, which under WAL reads from a single snapshot
+    and still never blocks writers.
+    """
+    state = {"remaining": None, "total": 0, "restarts": 0}
+    
+    def on_step(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state["remaining"], state["total"] = remaining, total
+        if progress:
+            progress(total - remaining, total)
+    
+    started = time.perf_counter()
+    try:
+        source.backup(target, pages=pages_per_step, progress=on_step, sleep=sleep)
+    except _BackupRestarted:
+        state["remaining"] = None
+        source.backup(target, pages=-1, progress=on_step)
+    elapsed = time.perf_counter() - started
+    
+    page_size = source.execute("PRAGMA page_size").fetchone()[0]
+    copied = state["total"] * page_size
+    return {
+        "pages": state["total"],
+        "bytes": copied,
+        "seconds": elapsed,
+        "bytes_per_second": copied / elapsed if elapsed else None,
+        "restarts": state["restarts"],
+    }
+
+
+def _is_gzip(path: str) -> bool:
+    """Return True if the file starts with the gzip magic number."""
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+def default_db_path() -> str:
+    """Return the default database location in the user's home directory."""
+    home_dir = os.path.expanduser("~")
+    jupiter_dir = os.path.join(home_dir, ".jupiter")
+    os.makedirs(jupiter_dir, exist_ok=True)
+    return os.path.join(jupiter_dir, "callisto.db")
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for transient SQLite errors.
+    
+    The delay before retry n (counting from 0) is drawn uniformly from
+    [0, min(max_delay, base_delay * 2**n)] so contending writers spread out
+    instead of retrying in lockstep.
+    """
+    
+    def __init__(self, attempts: int = 5, base_delay: float = 0.01, 
+                 max_delay: float = 1.0, jitter: bool = True):
+        """Create a policy allowing up to ``attempts`` tries in total."""
+        if attempts < 1:
+            raise ValueError("Invalid retry policy: attempts must be at least 1")
+        if base_delay < 0 or max_delay < 0:
+            raise ValueError("Invalid retry policy: delays must not be negative")
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+    
+    def delay(self, attempt: int) -> float:
+        """Return how long to sleep after the given failed attempt."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+    
+    @staticmethod
+    def is_transient(error: Exception) -> bool:
+        """Return True for busy/locked errors that are worth retrying."""
+        if not isinstance(error, OperationalError):
+            return False
+        message = str(error.orig if error.orig is not None else error).lower()
+        return any(text in message for text in TRANSIENT_ERRORS)
+    
+    def run(self, operation, *args, **kwargs):
+        """Call operation, retrying it while it fails with a transient error."""
+        for attempt in range(self.attempts):
+            try:
+                return operation(*args, **kwargs)
+            except OperationalError as e:
+                if not self.is_transient(e):
+                    raise
+                if attempt == self.attempts - 1:
+                    metrics.record_retry(exhausted=True)
+                    raise
+                metrics.record_retry()
+                time.sleep(self.delay(attempt))
+
 
 class Database:
     """Database connection manager with connection pooling and transactions."""
     
-    def __init__(self, db_path: str = None):
-        """Initialize database connection."""
+    def __init__(self, db_path: str = None, profile: str = DEFAULT_PROFILE, 
+                 retry_policy: RetryPolicy = None, tables: Optional[List[Table]] = None,
+                 attach: Optional[Dict[str, str]] = None, lazy: bool = False,
+                 reference: Optional["Database"] = None):
+        """Initialize database connection using a named storage profile.
+        
+        ``tables`` limits init_db() to a subset of the schema, and ``attach``
+        maps schema aliases to other database files opened alongside this
+        one; tables missing from this file are then found in those.
+        ``reference`` is the database that writes platforms, categories and
+        platform identities when those live in an attached file. With
+        ``lazy`` the file is not opened until it is first used.
+        """
+        self.engine = None
+        self.maintenance = None
+        self.archive = None
+        self._archive_lock = threading.Lock()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.tables = tables
+        self.attach = dict(attach or {})
+        self._reference = reference
+        self.identity_cache = IdentityCache()
+        self.profile_cache = ProfileCache()
+        self.configure(db_path, profile, lazy)
+    
+    def configure(self, db_path: str = None, profile: str = DEFAULT_PROFILE, lazy: bool = False) -> None:
+        """(Re)open the database at db_path, closing any existing connections.
+        
+        Modules hold on to the shared instance, so reconfiguring it in place
+        is how the whole package is pointed at a different database file.
+        With ``lazy`` the file is only opened by the first session.
+        """
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Storage profile must be one of {list(STORAGE_PROFILES)}")
+        
         if not db_path:
-            # Default to database in user's home directory
-            home_dir = os.path.expanduser("~")
-            jupiter_dir = os.path.join(home_dir, ".jupiter")
-            os.makedirs(jupiter_dir, exist_ok=True)
-            db_path = os.path.join(jupiter_dir, "callisto.db")
+            db_path = default_db_path()
+        
+        if self.engine is not None:
+            self.dispose()
         
-        # Create engine with connection pooling
+        self.db_path = db_path
+        self.profile = profile
+        self.pragmas = dict(STORAGE_PROFILES[profile]["pragmas"])
+        
+        # SQLite allows one writer at a time, so all writes share a single
+        # connection. Callers queue on the pool checkout instead of racing
+        # each other for the file lock and failing with "database is locked".
+        # Local SQLite files never drop connections, so there is no pre-ping.
         self.engine = create_engine(
             f"sqlite:///{db_path}", 
             poolclass=QueuePool,
-            pool_pre_ping=True,  # Verify connections before using them
-            pool_size=5,
-            max_overflow=10,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=WRITER_QUEUE_TIMEOUT,
             connect_args={"check_same_thread": False}
         )
         
-        self.Session = sessionmaker(bind=self.engine)
+        # Readers use the profile's pool; under WAL they never block the writer
+        self.read_engine = create_engine(
+            f"sqlite:///{db_path}", 
+            connect_args={"check_same_thread": False},
+            **STORAGE_PROFILES[profile]["pool"]
+        )
+        
+        @event.listens_for(self.engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            # Let SQLAlchemy issue BEGIN itself (see _on_begin)
+            dbapi_connection.isolation_level = None
+            # Only takes effect on a new, empty file (switching to WAL already
+            # writes the header); lets maintenance free pages incrementally
+            _apply_pragmas(dbapi_connection, dict(
+                {"busy_timeout": self.pragmas["busy_timeout"], "auto_vacuum": "INCREMENTAL"}, **self.pragmas))
+            _register_functions(dbapi_connection)
+            self._attach(dbapi_connection)
+        
+        @event.listens_for(self.engine, "begin")
+        def _on_begin(conn):
+            # Take the write lock when the transaction starts, not at its first
+            # write: a busy database then fails before any work is done, which
+            # is the one point where a session can safely be retried. IMMEDIATE
+            # locks every attached file too, so with attachments the lock is
+            # taken lazily and only on the files actually written.
+            begin = "BEGIN" if self.attach else "BEGIN IMMEDIATE"
+            if not getattr(self._local, "nowait", False):
+                conn.exec_driver_sql(begin)
+                return
+            # session(wait=False): fail at once if another process holds the lock
+            conn.exec_driver_sql("PRAGMA busy_timeout=0")
+            try:
+                conn.exec_driver_sql(begin)
+            finally:
+                conn.exec_driver_sql(f"PRAGMA busy_timeout={self.pragmas['busy_timeout']}")
+        
+        @event.listens_for(self.read_engine, "connect")
+        def _on_read_connect(dbapi_connection, connection_record):
+            _apply_pragmas(dbapi_connection, dict(self.pragmas, query_only="ON"))
+            _register_functions(dbapi_connection)
+            self._attach(dbapi_connection)
+        
+        metrics.instrument_engine(self.engine)
+        metrics.instrument_engine(self.read_engine)
+        
+        # Keep committed objects readable after their session closes. Sessions
+        # know their Database so lookups can find its reference cache.
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False, info={"database": self})
+        self.ReadSession = sessionmaker(bind=self.read_engine, info={"database": self})
+        self.reference_cache = reference_cache.ReferenceCache(self)
+        self.identity_cache.clear()
+        self.profile_cache.forget()
+        
+        # Session of the unit of work open in each thread, if any
+        self._local = threading.local()
+        
+        # When a session was last opened or closed; maintenance waits for idle
+        self.last_activity = time.monotonic()
+        
+        # Embeds messages and knowledge as they are written, once semantic
+        # search is configured (see embeddings.py)
+        self.semantic_index = None
+        
+        # Dictionary new message content is compressed with (see compression.py)
+        self.dictionary_id = None
+        self._opened = False
+        if not lazy:
+            self.open()
+    
+    def open(self) -> None:
+        """Open the file and load its compression dictionaries.
+        
+        Done by the constructor, so a bad path fails there rather than on
+        first use, unless the database was created lazily; then the first
+        session does it.
+        """
+        self._opened = True
+        self.engine.connect().close()
+        compression.load_dictionaries(self)
+    
+    def _attach(self, dbapi_connection) -> None:
+        """Attach the configured extra database files to a new connection."""
+        for alias, path in self.attach.items():
+            dbapi_connection.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+    
+    def dispose(self) -> None:
+        """Stop background jobs and close all pooled connections."""
+        self.stop_maintenance()
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        self.engine.dispose()
+        self.read_engine.dispose()
+    
+    def backup(self, dest_path: str, pages_per_step: int = BACKUP_PAGES_PER_STEP,
+               compress: bool = False, progress: Optional[Callable[[int, int], None]] = None,
+               sleep: float = BACKUP_STEP_SLEEP) -> Dict[str, Any]:
+        """Write a consistent copy of the live database to dest_path.
+        
+        Uses the SQLite online backup API on its own connection, so reads and
+        writes carry on during the backup. ``progress(copied_pages,
+        total_pages)`` is called after every step. With ``compress`` the copy
+        is written as a gzip archive. The file only appears at dest_path
+        once it is complete.
+        
+        Returns pages and bytes copied, elapsed seconds, throughput and how
+        many times concurrent writes restarted the copy.
+        """
+        if pages_per_step == 0 or pages_per_step < -1:
+            raise ValueError("Invalid pages_per_step: must be positive, or -1 for a single step")
+        
+        dest_dir = os.path.dirname(os.path.abspath(dest_path))
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=dest_dir)
+        os.close(fd)
+        try:
+            source = sqlite3.connect(self.db_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.execute(f"PRAGMA busy_timeout={self.pragmas['busy_timeout']}")
+                stats = _copy_database(source, target, pages_per_step, sleep, progress)
+            finally:
+                target.close()
+                source.close()
+            
+            if compress:
+                with open(tmp_path, "rb") as src, gzip.open(dest_path + ".tmp", "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(dest_path + ".tmp", dest_path)
+                stats["compressed_bytes"] = os.path.getsize(dest_path)
+            else:
+                os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        
+        return stats
+    
+    def restore(self, src_path: str, pages_per_step: int = BACKUP_PAGES_PER_STEP,
+                progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Replace the database contents with a backup made by backup().
+        
+        Plain and gzip-compressed backups are both accepted. The copy goes
+        through the writer connection, so queued writes wait until it is done
+        and open readers, including the in-process caches, see the restored
+        data afterwards. New content is compressed with the backup's own
+        dictionaries from then on. Call init_db() afterwards to migrate a
+        backup taken by an older version.
+        """
+        if not os.path.exists(src_path):
+            raise ValueError(f"Invalid backup file: {src_path} does not exist")
+        
+        tmp_path = None
+        if _is_gzip(src_path):
+            fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(self.db_path)))
+            os.close(fd)
+            with gzip.open(src_path, "rb") as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        
+        try:
+            source = sqlite3.connect(tmp_path or src_path)
+            try:
+                try:
+                    source.execute("PRAGMA schema_version").fetchone()
+                except sqlite3.DatabaseError as e:
+                    raise ValueError(f"Invalid backup file: {e}")
+                
+                raw = self.engine.raw_connection()
+                try:
+                    stats = _copy_database(source, raw.driver_connection, pages_per_step, 0, progress)
+                finally:
+                    raw.close()
+            finally:
+                source.close()
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        
+        # Pooled readers and in-process caches may hold data from before
+        self.read_engine.dispose()
+        self.reference_cache.expire()
+        self.identity_cache.clear()
+        self.profile_cache.forget()
+        # The dictionary in use may not be in the backup, which may hold none at all
+        self.dictionary_id = None
+        compression.load_dictionaries(self)
+        return stats
+    
+    def enable_incremental_vacuum(self) -> bool:
+        """Switch a database created without it to auto_vacuum=INCREMENTAL.
+        
+        New files get the setting when they are created. Older ones keep
+        auto_vacuum=NONE, and maintenance cannot shrink them, until a full
+        VACUUM rebuilds the file. This method runs that VACUUM. It holds the
+        write lock while rewriting the whole file, so run it at a quiet
+        time. Returns False if the database already used incremental vacuum.
+        """
+        with self.engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:  # INCREMENTAL
+                return False
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        return True
     
     def init_db(self) -> None:
-        """Create all tables if they don't exist."""
-        Base.metadata.create_all(self.engine)
-
+        """Create all tables if they don't exist and apply pending migrations."""
+        self._opened = True
+        with self.engine.begin() as conn:
+            Base.metadata.create_all(conn, tables=self.tables)
+            run_migrations(conn)
+        compression.load_dictionaries(self)
+    
+    def start_maintenance(self, **options) -> "MaintenanceScheduler":
+        """Run vacuum, checkpoints and PRAGMA optimize in the background when idle.
+        
+        Options are passed to MaintenanceScheduler.
+        """
+        from .maintenance import MaintenanceScheduler
+        
+        if self.maintenance is None:
+            self.maintenance = MaintenanceScheduler(self, **options)
+            self.maintenance.start()
+        return self.maintenance
+    
+    def stop_maintenance(self) -> None:
+        """Stop background maintenance, if running."""
+        if self.maintenance is not None:
+            self.maintenance.stop()
+            self.maintenance = None
+    
+    def open_archive(self, path: Optional[str] = None, **options) -> "ConversationArchive":
+        """Open the cold-storage archive so archived conversations can be read.
+        
+        The archive defaults to a ``.archive.db`` file next to the database.
+        Options are passed to ConversationArchive. Reads of archived
+        conversations open the default archive themselves when needed.
+        """
+        from .archive import ConversationArchive
+        
+        with self._archive_lock:
+            if self.archive is None:
+                self.archive = ConversationArchive(self, path, **options)
+        return self.archive
+    
+    def start_archiver(self, path: Optional[str] = None, **options) -> "ConversationArchive":
+        """Move old, ended conversations to the archive in the background."""
+        archive = self.open_archive(path, **options)
+        archive.start()
+        return archive
+    
     @contextmanager
-    def session(self) -> Iterator[Session]:
-        """Provide a transactional scope around operations."""
+    def session(self, wait: bool = True) -> Iterator[Session]:
+        """Provide a transactional scope around operations.
+        
+        Inside transaction() this joins the enclosing unit of work instead,
+        which commits once at its end. With ``wait=False`` a busy database
+        fails at once instead of queueing for the writer connection and
+        retrying: with a TimeoutError while another thread writes, or a
+        "database is locked" OperationalError while another process does.
+        """
+        active = self.active_session()
+        if active is not None:
+            yield active
+            return
+        
+        if not wait and self.engine.pool.checkedout():
+            raise PoolTimeoutError("Writer connection is in use")
+        if not self._opened:
+            self.open()
+        self.last_activity = time.monotonic()
         session = self.Session()
         try:
-            yield session
-            session.commit()
+            self._begin(session, wait)
+            with compression.dictionary_scope(self.dictionary_id):
+                yield session
+                session.commit()
         except Exception as e:
             session.rollback()
             raise e
         finally:
             session.close()
-
-    def execute_atomic(self, operation, *args, **kwargs):
-        """Execute an operation atomically within a transaction."""
+            self.last_activity = time.monotonic()
+    
+    @contextmanager
+    def read_session(self) -> Iterator[Session]:
+        """Provide a read-only scope that never commits.
+        
+        Closing the session releases the connection (rolling back its
+        transaction) without expiring loaded objects, so results stay usable.
+        Inside transaction() reads use the unit of work's session so they see
+        its uncommitted writes.
+        """
+        active = self.active_session()
+        if active is not None:
+            yield active
+            return
+        
+        if not self._opened:
+            self.open()
+        self.last_activity = time.monotonic()
+        session = self.ReadSession()
+        try:
+            self._checkout(session)
+            yield session
+        finally:
+            session.close()
+            self.last_activity = time.monotonic()
+    
+    @staticmethod
+    def _checkout(session: Session) -> None:
+        """Acquire the session's connection up front, recording the pool wait."""
+        started = time.perf_counter()
+        session.connection()
+        metrics.record_pool_wait(time.perf_counter() - started)
+    
+    def _begin(self, session: Session, wait: bool = True) -> None:
+        """Start a write transaction, backing off while the database is busy.
+        
+        Inside execute_atomic() the whole operation is retried instead, and
+        without ``wait`` there is a single attempt that does not wait.
+        """
+        if not wait:
+            self._local.nowait = True
+            try:
+                self._checkout(session)
+            finally:
+                self._local.nowait = False
+            return
+        
+        if getattr(self._local, "retrying", False):
+            self._checkout(session)
+            return
+        
+        def attempt():
+            try:
+                self._checkout(session)
+            except OperationalError:
+                # Return the connection so the next attempt starts clean
+                session.close()
+                raise
+        
+        self.retry_policy.run(attempt)
+    
+    @contextmanager
+    def transaction(self) -> Iterator[Session]:
+        """Open a unit of work shared by every session in this thread.
+        
+        All session() and read_session() scopes entered by the current thread
+        before the block exits reuse one session, so the whole block commits
+        once or rolls back entirely. Nested transactions join the outer one.
+        """
+        active = self.active_session()
+        if active is not None:
+            yield active
+            return
+        
         with self.session() as session:
-            return operation(session, *args, **kwargs)
-            
+            self._local.session = session
+            try:
+                yield session
+            finally:
+                self._local.session = None
+    
+    def active_session(self) -> Optional[Session]:
+        """Return the unit-of-work session open in this thread, if any."""
+        return getattr(self._local, "session", None)
+    
+    # ROUTING
+    # The same calls as ShardRouter, so code written against a router also
+    # works with a single database holding everything.
+    
+    @property
+    def reference(self) -> "Database":
+        """Return the database holding platforms and categories."""
+        return self._reference if self._reference is not None else self
+    
+    @property
+    def shards(self) -> List["Database"]:
+        """Return every database holding user data."""
+        return [self]
+    
+    def for_user(self, user_id: Optional[str]) -> "Database":
+        """Return the database holding a user's data."""
+        return self
+    
+    def for_conversation(self, conversation_id: Optional[str]) -> "Database":
+        """Return the database holding a conversation."""
+        return self
+    
+    def new_conversation_id(self, user_id: str) -> str:
+        """Return a new conversation ID for a user."""
+        return str(uuid.uuid4())
+    
+    def execute_atomic(self, operation, *args, **kwargs):
+        """Execute an operation atomically within a transaction.
+        
+        Database calls made by the operation join the same transaction. If the
+        transaction fails with a transient busy/locked error it is rolled back
+        and the operation run again under the retry policy, so operations
+        must not have side effects outside the database. Inside an enclosing
+        transaction() there is nothing to retry and errors propagate.
+        """
+        active = self.active_session()
+        if active is not None:
+            return operation(active, *args, **kwargs)
+        
+        def attempt():
+            with self.transaction() as session:
+                return operation(session, *args, **kwargs)
+        
+        self._local.retrying = True
+        try:
+            return self.retry_policy.run(attempt)
+        finally:
+            self._local.retrying = False
+    
     def init_default_data(self) -> None:
         """Initialize default data like platforms and knowledge categories."""
         # Default platforms
@@ -78,6 +705,8 @@ class Database:
         from .models import Platform, KnowledgeCategory
         
         with self.session() as session:
+            reference_cache.invalidate(session)
+            
             # Add platforms if they don't exist
             for platform_data in default_platforms:
                 platform_name = platform_data["platform_name"]
@@ -94,5 +723,5 @@ class Database:
                     category = KnowledgeCategory(**category_data)
                     session.add(category)
 
-# Global database instance
-db = Database()
+# Global database instance; opened on first use so importing has no side effects
+db = Database(lazy=True)
@@ -0,0 +1,459 @@
+"""Semantic search over messages and knowledge with local vector embeddings.
+
+Text is turned into vectors by an embedder: any callable that takes a list
+of strings and returns one vector per string, with ``name`` and
+``dimensions`` attributes. The default HashingEmbedder needs no model files,
+network or GPU: it hashes words, word pairs and character trigrams into a
+fixed-size vector, so texts that share vocabulary score close together.
+Plug in a learned model for real paraphrase matching.
+
+Vectors are stored normalized as packed float32 BLOBs in the ``embeddings``
+table, next to the rows they describe, and scored by dot product: with one
+matrix product when NumPy is installed, otherwise in pure Python. The
+vectors of a user can optionally be split into coarse cells by spherical
+k-means (an inverted file, as in IVF indexes); a search then only scores
+the ``nprobe`` cells whose centroids are nearest the query, so its cost
+stops growing with the whole history.
+
+Once a database has a semantic index (``semantic_index``, set by
+configure_semantic_search of either API), messages and knowledge are
+embedded in the transaction that writes them: the writers call
+index_messages() and index_knowledge(), which find the index through
+``session.info`` and do nothing while semantic search is off. Searches then
+only read.
+"""
+import heapq
+import html
+import json
+import math
+import operator
+import random
+import re
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, exists, or_
+
+from .models import Conversation, Embedding, EmbeddingCell, KnowledgeCategory, Message, UserKnowledge
+
+try:
+    import numpy
+except ImportError:  # optional; vectors are scored in pure Python instead
+    numpy = None
+
+KINDS = ("message", "knowledge")
+
+DEFAULT_DIMENSIONS = 256
+DEFAULT_NPROBE = 4
+
+# Too common to say anything about what a text is about
+STOP_WORDS = frozenset("""
+a about all am an and any are as at be been but by can did do does for from
+had has have he her him his how i if in into is it its me my no not of on or
+our she so that the their them then there they this to too us was we were
+what when where which who why will with would you your
+""".split())
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+class HashingEmbedder:
+    """Deterministic embedder that hashes text features into a vector.
+    
+    Features are the words of a text (minus stop words), adjacent word
+    pairs and the character trigrams of each word, so "dogs" still lands
+    near "dog". Each feature adds +/-weight to one coordinate picked by a
+    CRC32 of the feature, which is stable across processes and platforms.
+    """
+    
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS):
+        """Create an embedder producing vectors of the given size."""
+        if dimensions < 1:
+            raise ValueError("Invalid dimensions: must be at least 1")
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+    
+    def __call__(self, texts: Sequence[str]) -> List[array]:
+        """Return one unit-length vector per text."""
+        return [self._embed(text) for text in texts]
+    
+    def _embed(self, text: str) -> array:
+        vector = array("f", bytes(4 * self.dimensions))
+        words = [w for w in _WORD.findall(html.unescape(text).lower()) if w not in STOP_WORDS]
+        for feature, weight in self._features(words):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dimensions] += weight if h & 0x80000000 else -weight
+        return _normalize(vector)
+    
+    @staticmethod
+    def _features(words: List[str]) -> Iterable[Tuple[str, float]]:
+        for i, word in enumerate(words):
+            yield word, 1.0
+            if i:
+                yield f"{words[i - 1]} {word}", 0.5
+            padded = f"<{word}>"
+            for j in range(len(padded) - 2):
+                yield padded[j:j + 3], 0.25
+
+
+# VECTORS
+
+def _normalize(vector: array) -> array:
+    """Scale a float32 array to unit length in place (zero vectors stay zero)."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm:
+        for i, x in enumerate(vector):
+            vector[i] = x / norm
+    return vector
+
+
+def pack(vector: Sequence[float]) -> bytes:
+    """Return a vector as unit-length float32 bytes."""
+    if numpy is not None:
+        values = numpy.asarray(vector, dtype=numpy.float32)
+        norm = numpy.linalg.norm(values)
+        return (values / norm if norm else values).astype(numpy.float32).tobytes()
+    return _normalize(array("f", vector)).tobytes()
+
+
+def unpack(blob: bytes) -> array:
+    """Return the float32 values packed in blob."""
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector
+
+
+def scores(query: bytes, blobs: Sequence[bytes]) -> List[float]:
+    """Return the dot product of a packed query with each packed vector."""
+    if not blobs:
+        return []
+    if numpy is not None:
+        matrix = numpy.frombuffer(b"".join(blobs), dtype=numpy.float32).reshape(len(blobs), -1)
+        return (matrix @ numpy.frombuffer(query, dtype=numpy.float32)).tolist()
+    q = unpack(query)
+    return [sum(map(operator.mul, q, unpack(blob))) for blob in blobs]
+
+
+def top_k(query: bytes, blobs: Sequence[bytes], k: int) -> List[Tuple[int, float]]:
+    """Return (index, score) of the k vectors most similar to query, best first."""
+    if not blobs or k < 1:
+        return []
+    if numpy is not None and len(blobs) > k:
+        matrix = numpy.frombuffer(b"".join(blobs), dtype=numpy.float32).reshape(len(blobs), -1)
+        similarity = matrix @ numpy.frombuffer(query, dtype=numpy.float32)
+        best = numpy.argpartition(-similarity, k)[:k]
+        best = best[numpy.argsort(-similarity[best], kind="stable")]
+        return [(int(i), float(similarity[i])) for i in best]
+    return heapq.nlargest(k, enumerate(scores(query, blobs)), key=operator.itemgetter(1))
+
+
+def _mean_direction(blobs: Sequence[bytes], dimensions: int) -> bytes:
+    """Return the normalized mean of packed vectors."""
+    if numpy is not None:
+        matrix = numpy.frombuffer(b"".join(blobs), dtype=numpy.float32).reshape(len(blobs), -1)
+        return pack(matrix.sum(axis=0))
+    total = [0.0] * dimensions
+    for blob in blobs:
+        for i, x in enumerate(unpack(blob)):
+            total[i] += x
+    return pack(total)
+
+
+class SemanticIndex:
+    """Embeddings of one database's messages and knowledge, and search over them.
+    
+    New items are embedded as they are written (see index_messages). The
+    rest are brought up to date by sync(), which embeds rows that have
+    none or whose embedding came from another model, older text or another
+    owner, and drops embeddings of deleted rows. Archiving a conversation
+    drops the embeddings of its messages, like full-text search does.
+    """
+    
+    def __init__(self, database, embedder=None, nprobe: int = DEFAULT_NPROBE, batch_size: int = 256):
+        """Create an index over a single Database (not a ShardRouter)."""
+        if nprobe < 1:
+            raise ValueError("Invalid nprobe: must be at least 1")
+        if batch_size < 1:
+            raise ValueError("Invalid batch_size: must be at least 1")
+        self.database = database
+        self.embedder = embedder if embedder is not None else HashingEmbedder()
+        self.nprobe = nprobe
+        self.batch_size = batch_size
+        self._centroids = None  # list of (cell, packed centroid), loaded on first use
+    
+    @property
+    def model(self) -> str:
+        return self.embedder.name
+    
+    # EMBEDDING
+    
+    def sync(self, user_id: Optional[str] = None) -> int:
+        """Embed new or changed items (for one user, or everyone); return how many.
+        
+        Reads every item, so this is for catching up (after switching
+        embedders, or on data written while semantic search was off) rather
+        than for each search.
+        """
+        with self.database.session() as session:
+            return self._sync(session, user_id)
+    
+    def _sync(self, session, user_id: Optional[str] = None) -> int:
+        """Embed new or changed items within an existing session."""
+        pending = self._stale_messages(session, user_id) + self._stale_knowledge(session, user_id)
+        self._delete_orphans(session, user_id)
+        self.embed(session, pending)
+        return len(pending)
+    
+    def embed(self, session, items: List[tuple]) -> None:
+        """Store embeddings of (kind, item_id, user_id, text) items, replacing any they had."""
+        self._load_centroids(session)
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            vectors = [pack(v) for v in self.embedder([item[3] for item in batch])]
+            # Replace outdated embeddings in one statement rather than merging row by row
+            for kind in KINDS:
+                session.query(Embedding).filter(
+                    Embedding.kind == kind,
+                    Embedding.item_id.in_([item[1] for item in batch if item[0] == kind])
+                ).delete(synchronize_session=False)
+            session.add_all([
+                Embedding(kind=kind, item_id=item_id, user_id=owner, model=self.model,
+                          cell=self._assign_cell(vector), checksum=_checksum(text), vector=vector)
+                for (kind, item_id, owner, text), vector in zip(batch, vectors)])
+    
+    # An embedding is only current if it was made by this model, from the
+    # item's current text, for the item's current owner: an item ID alone
+    # may since have been given to another user's row
+    
+    def _stale_messages(self, session, user_id: Optional[str]) -> List[tuple]:
+        query = (session.query(Message.message_id, Conversation.user_id, Message.content,
+                               Embedding.model, Embedding.user_id, Embedding.checksum)
+                 .join(Conversation, Message.conversation_id == Conversation.conversation_id)
+                 .outerjoin(Embedding, and_(Embedding.kind == "message", Embedding.item_id == Message.message_id)))
+        if user_id is not None:
+            query = query.filter(Conversation.user_id == user_id)
+        return [("message", message_id, owner, content)
+                for message_id, owner, content, model, embedded_for, checksum in query
+                if model != self.model or embedded_for != owner or checksum != _checksum(content)]
+    
+    def _stale_knowledge(self, session, user_id: Optional[str]) -> List[tuple]:
+        # Users hold few knowledge items and a value can change within the
+        # same second, so compare the embedded text rather than updated_at
+        query = (session.query(UserKnowledge, KnowledgeCategory, Embedding.model, Embedding.user_id,
+                               Embedding.checksum)
+                 .join(KnowledgeCategory)
+                 .outerjoin(Embedding, and_(Embedding.kind == "knowledge",
+                                            Embedding.item_id == UserKnowledge.knowledge_id)))
+        if user_id is not None:
+            query = query.filter(UserKnowledge.user_id == user_id)
+        
+        stale = []
+        for item, category, model, embedded_for, checksum in query:
+            text = knowledge_text(category, item.value)
+            if model != self.model or embedded_for != item.user_id or checksum != _checksum(text):
+                stale.append(("knowledge", item.knowledge_id, item.user_id, text))
+        return stale
+    
+    @staticmethod
+    def _delete_orphans(session, user_id: Optional[str]) -> None:
+        """Delete embeddings whose item is gone or no longer belongs to the user they were made for."""
+        owned_message = exists().where(
+            Message.message_id == Embedding.item_id,
+            Conversation.conversation_id == Message.conversation_id,
+            Conversation.user_id == Embedding.user_id)
+        owned_knowledge = exists().where(
+            UserKnowledge.knowledge_id == Embedding.item_id,
+            UserKnowledge.user_id == Embedding.user_id)
+        for kind, owned in (("message", owned_message), ("knowledge", owned_knowledge)):
+            query = session.query(Embedding).filter(Embedding.kind == kind, ~owned)
+            if user_id is not None:
+                query = query.filter(Embedding.user_id == user_id)
+            query.delete(synchronize_session=False)
+    
+    # SEARCH
+    
+    def search(self, user_id: str, text: str, k: int = 10,
+               kinds: Sequence[str] = KINDS) -> List[Dict[str, Any]]:
+        """Return the k items of a user most similar to text, best first."""
+        with self.database.read_session() as session:
+            return self._search(session, user_id, text, k, kinds)
+    
+    def _search(self, session, user_id: str, text: str, k: int = 10,
+                kinds: Sequence[str] = KINDS) -> List[Dict[str, Any]]:
+        """Search within an existing session."""
+        query = pack(self.embedder([text])[0])
+        candidates = (session.query(Embedding.kind, Embedding.item_id, Embedding.vector)
+                      .filter(Embedding.user_id == user_id, Embedding.model == self.model,
+                              Embedding.kind.in_(kinds)))
+        centroids = self._load_centroids(session)
+        if centroids:
+            cells = [centroids[i][0] for i, _ in top_k(query, [c for _, c in centroids], self.nprobe)]
+            candidates = candidates.filter(Embedding.cell.in_(cells))
+        candidates = candidates.all()
+        
+        best = top_k(query, [vector for _, _, vector in candidates], k)
+        return self._hydrate(session, user_id, [(candidates[i][0], candidates[i][1], score) for i, score in best])
+    
+    @staticmethod
+    def _hydrate(session, user_id: str, hits: List[tuple]) -> List[Dict[str, Any]]:
+        """Turn (kind, item_id, score) hits into result dicts, keeping their order.
+        
+        Items that no longer belong to user_id are left out, so an outdated
+        embedding can never return another user's data.
+        """
+        message_ids = [item_id for kind, item_id, _ in hits if kind == "message"]
+        knowledge_ids = [item_id for kind, item_id, _ in hits if kind == "knowledge"]
+        messages = {m.message_id: m for m in
+                    session.query(Message).join(Conversation)
+                    .filter(Message.message_id.in_(message_ids), Conversation.user_id == user_id)
+                    } if message_ids else {}
+        knowledge = {item.knowledge_id: (item, category) for item, category in
+                     session.query(UserKnowledge, KnowledgeCategory).join(KnowledgeCategory)
+                     .filter(UserKnowledge.knowledge_id.in_(knowledge_ids), UserKnowledge.user_id == user_id)
+                     } if knowledge_ids else {}
+        
+        results = []
+        for kind, item_id, score in hits:
+            if kind == "message" and item_id in messages:
+                message = messages[item_id]
+                results.append({"kind": kind, "score": score, "message_id": item_id,
+                                "conversation_id": message.conversation_id, "is_from_user": message.is_from_user,
+                                "content": message.content, "timestamp": message.timestamp})
+            elif kind == "knowledge" and item_id in knowledge:
+                item, category = knowledge[item_id]
+                results.append({"kind": kind, "score": score, "knowledge_id": item_id,
+                                "category": category.category_name,
+                                "value": _knowledge_value(category, item.value),
+                                "updated_at": item.updated_at})
+        return results
+    
+    # PARTITIONS
+    
+    def train_partitions(self, cells: int = 64, sample: int = 10000, iterations: int = 10,
+                         seed: int = 0) -> int:
+        """Cluster embeddings into cells and assign every embedding to one; return the cell count.
+        
+        Call after sync() once a database holds many embeddings, and again
+        now and then as it grows. Embeddings added later are assigned to the
+        nearest existing cell.
+        """
+        if cells < 1:
+            raise ValueError("Invalid cells: must be at least 1")
+        with self.database.read_session() as session:
+            vectors = [vector for vector, in session.query(Embedding.vector)
+                       .filter(Embedding.model == self.model)
+                       .order_by(Embedding.kind, Embedding.item_id)]
+        if not vectors:
+            return 0
+        
+        rng = random.Random(seed)
+        if len(vectors) > sample:
+            vectors = rng.sample(vectors, sample)
+        centroids = self._kmeans(vectors, min(cells, len(vectors)), iterations, rng)
+        
+        with self.database.session() as session:
+            session.query(EmbeddingCell).filter(EmbeddingCell.model == self.model).delete()
+            session.add_all(EmbeddingCell(model=self.model, cell=cell, centroid=centroid)
+                            for cell, centroid in enumerate(centroids))
+        self._centroids = list(enumerate(centroids))
+        
+        # Reassign in batches, so foreground writes get the writer in between
+        last_key = ("", 0)
+        while True:
+            with self.database.session() as session:
+                rows = (session.query(Embedding.kind, Embedding.item_id, Embedding.vector)
+                        .filter(Embedding.model == self.model,
+                                or_(Embedding.kind > last_key[0],
+                                    and_(Embedding.kind == last_key[0], Embedding.item_id > last_key[1])))
+                        .order_by(Embedding.kind, Embedding.item_id)
+                        .limit(self.batch_size).all())
+                session.bulk_update_mappings(Embedding, [
+                    {"kind": kind, "item_id": item_id, "cell": self._assign_cell(vector)}
+                    for kind, item_id, vector in rows])
+            if len(rows) < self.batch_size:
+                return len(centroids)
+            last_key = rows[-1][:2]
+    
+    @staticmethod
+    def _kmeans(vectors: List[bytes], cells: int, iterations: int, rng: random.Random) -> List[bytes]:
+        """Spherical k-means: return cell centroids as packed unit vectors."""
+        dimensions = len(vectors[0]) // 4
+        centroids = rng.sample(vectors, cells)
+        for _ in range(iterations):
+            members = [[] for _ in centroids]
+            for vector in vectors:
+                members[top_k(vector, centroids, 1)[0][0]].append(vector)
+            # An empty cell keeps its old centroid
+            updated = [_mean_direction(m, dimensions) if m else c for m, c in zip(members, centroids)]
+            if updated == centroids:
+                break
+            centroids = updated
+        return centroids
+    
+    def _load_centroids(self, session) -> List[Tuple[int, bytes]]:
+        if self._centroids is None:
+            self._centroids = [(cell, centroid) for cell, centroid in
+                               session.query(EmbeddingCell.cell, EmbeddingCell.centroid)
+                               .filter(EmbeddingCell.model == self.model)
+                               .order_by(EmbeddingCell.cell)]
+        return self._centroids
+    
+    def _assign_cell(self, vector: bytes) -> int:
+        """Return the cell of the nearest centroid (call _load_centroids first)."""
+        if not self._centroids:
+            return 0
+        best = top_k(vector, [c for _, c in self._centroids], 1)[0][0]
+        return self._centroids[best][0]
+
+
+# INDEXING ON WRITE
+
+def _index(session) -> Optional[SemanticIndex]:
+    """Return the index a session's writes are embedded with, or None if semantic search is off."""
+    return getattr(session.info.get("database"), "semantic_index", None)
+
+
+def index_messages(session, user_id: str, messages: Sequence[Message]) -> None:
+    """Embed messages a session is adding, if semantic search is on for its database."""
+    index = _index(session)
+    if index is None or not messages:
+        return
+    session.flush()  # assigns the message IDs
+    index.embed(session, [("message", m.message_id, user_id, m.content) for m in messages])
+
+
+def index_knowledge(session, item: UserKnowledge, category) -> None:
+    """Embed a knowledge item a session stored, if semantic search is on for its database."""
+    index = _index(session)
+    if index is None:
+        return
+    session.flush()
+    index.embed(session, [("knowledge", item.knowledge_id, item.user_id, knowledge_text(category, item.value))])
+
+
+def forget_knowledge(session, item: UserKnowledge) -> None:
+    """Drop the embedding of a knowledge item a session is deleting."""
+    session.query(Embedding).filter_by(kind="knowledge", item_id=item.knowledge_id).delete(
+        synchronize_session=False)
+
+
+def _checksum(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def _knowledge_value(category: KnowledgeCategory, value: str) -> Any:
+    # Imported here because knowledge.py embeds the items it stores
+    from .knowledge import KnowledgeManager
+    
+    return KnowledgeManager._convert_value(value, category.data_type)
+
+
+def knowledge_text(category: KnowledgeCategory, value: str) -> str:
+    """Return the text a knowledge item is embedded as, e.g. "pet name: Rex"."""
+    value = _knowledge_value(category, value)
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(map(str, value))
+    elif isinstance(value, dict):
+        value = json.dumps(value)
+    return f"{category.category_name.replace('_', ' ')}: {value}"
@@ -0,0 +1,140 @@
+"""Background group-commit writer for Callisto."""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from .db import Database
+
+# Marks the end of the queue when the writer is closed
+_STOP = object()
+
+class GroupCommitWriter:
+    """Coalesces many small writes into a single transaction.
+    
+    Each submitted write is an ``operation(session, *args)`` call. A background
+    thread collects everything that arrives within ``max_delay`` seconds (or up
+    to ``max_batch`` writes) and runs it in one transaction, so a burst of
+    messages costs one commit instead of one per message. Every submit returns
+    a Future that resolves once the write is durable.
+    """
+    
+    def __init__(self, database: Database, operation: Callable[..., Any],
+                 max_batch: int = 256, max_delay: float = 0.005, max_queue: int = 10000):
+        """Start the background writer thread."""
+        if max_batch < 1 or max_queue < 1:
+            raise ValueError("max_batch and max_queue must be at least 1")
+        
+        self.database = database
+        self.operation = operation
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        
+        # Bounded so a burst blocks producers instead of growing memory
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="callisto-group-commit", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, *args, timeout: float = None) -> Future:
+        """Queue a write and return a Future resolved once it is committed.
+        
+        Blocks while the queue is full; raises queue.Full if ``timeout``
+        seconds pass without room becoming available.
+        """
+        future = Future()
+        self._put((args, future), timeout)
+        return future
+    
+    def flush(self, timeout: float = None) -> None:
+        """Block until every write submitted so far has been committed.
+        
+        Once the writer is closed there is nothing left to wait for beyond
+        close() itself finishing.
+        """
+        marker = Future()
+        try:
+            self._put((None, marker), timeout)
+        except RuntimeError:
+            self._thread.join(timeout)
+            return
+        marker.result(timeout)
+    
+    def close(self) -> None:
+        """Commit everything still queued and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+    
+    def _put(self, item, timeout: Optional[float]) -> None:
+        """Queue an item unless the writer is closed.
+        
+        The check and the put happen under one lock, so nothing can be
+        queued behind the stop marker where it would never run. Waiting for
+        the lock counts towards the timeout like waiting for queue room.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise queue.Full
+        try:
+            if self._closed:
+                raise RuntimeError("Group commit writer is closed")
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            self._queue.put(item, timeout=remaining)
+        finally:
+            self._lock.release()
+    
+    def _run(self) -> None:
+        """Collect and commit batches until closed."""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            self._commit(batch)
+    
+    def _commit(self, batch) -> None:
+        """Run a batch of writes in one transaction and resolve their futures."""
+        done = []
+        try:
+            with self.database.session() as session:
+                for args, future in batch:
+                    if args is None:
+                        # flush() marker
+                        done.append((future, None))
+                        continue
+                    try:
+                        done.append((future, self.operation(session, *args)))
+                    except ValueError as e:
+                        # Rejected before writing anything; only this write fails
+                        future.set_exception(e)
+        except Exception as e:
+            for args, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for future, result in done:
+            future.set_result(result)
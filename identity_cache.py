@@ -0,0 +1,151 @@
+"""In-process cache of platform identities resolved to users.
+
+Every incoming message resolves its sender (platform plus username, or
+platform plus the platform's own ID) to a user, which costs a platform, a
+user_platforms and a users lookup. The cache keeps the answer, the user's
+immutable UserRecord, in an LRU of bounded size. "No such user" is cached as
+well, for a much shorter time, so unknown senders do not hit the database
+on every message either.
+
+Like the reference cache it hangs off the database holding the platform
+mapping (``Database.identity_cache``; shards share the global one), and
+writers find it through ``session.info``. Writes that change who an
+identity resolves to, or the fields cached for a user, call forget(session,
+...): the entries are dropped at once and again after the transaction
+commits, and a generation counter keeps a reader that raced the write from
+putting its stale result back.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .metrics import metrics
+from .records import UserRecord
+
+MAX_ENTRIES = 10000
+TTL = 300.0
+NEGATIVE_TTL = 30.0
+
+# (platform_name, "username" or "platform_id", value)
+IdentityKey = Tuple[str, str, str]
+
+MISSING = object()
+
+
+class IdentityCache:
+    """LRU of identity keys to users, or None for unknown identities."""
+    
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL, negative_ttl: float = NEGATIVE_TTL):
+        """Hold up to max_entries identities; known users for ttl seconds, unknown ones for negative_ttl."""
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[IdentityKey, Tuple[float, Optional[UserRecord]]]" = OrderedDict()
+        self._keys_by_user: Dict[str, set] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.configure(max_entries, ttl, negative_ttl)
+    
+    def configure(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL,
+                  negative_ttl: float = NEGATIVE_TTL) -> None:
+        """Change the size and lifetimes; a size of 0 turns the cache off."""
+        if max_entries < 0:
+            raise ValueError("Invalid cache size: must not be negative")
+        if ttl < 0 or negative_ttl < 0:
+            raise ValueError("Invalid TTL: must not be negative")
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self.negative_ttl = negative_ttl
+            self._evict()
+    
+    def get(self, key: IdentityKey) -> Any:
+        """Return the cached user (None for an unknown user), or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.record_cache("identity", entry is not None)
+        return entry[1] if entry is not None else MISSING
+    
+    def put(self, key: IdentityKey, user: Optional[UserRecord], generation: int) -> None:
+        """Cache a lookup result read while the cache was at generation."""
+        with self._lock:
+            # Something was forgotten since the lookup started; it may be stale
+            if generation != self.generation or not self.max_entries:
+                return
+            self._remove(key)
+            ttl = self.ttl if user is not None else self.negative_ttl
+            self._entries[key] = (time.monotonic() + ttl, user)
+            if user is not None:
+                self._keys_by_user.setdefault(user.user_id, set()).add(key)
+            self._evict()
+    
+    def forget(self, keys: Iterable[IdentityKey] = (), user_id: Optional[str] = None) -> None:
+        """Drop the given identities and every identity of user_id."""
+        with self._lock:
+            self.generation += 1
+            for key in list(keys) + list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+    
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the size and hit rate of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+    
+    def _remove(self, key: IdentityKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            keys = self._keys_by_user.get(entry[1].user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry[1].user_id]
+    
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+
+def identity_keys(platform_name: str, platform_username: Optional[str] = None,
+                  platform_specific_id: Optional[str] = None) -> list:
+    """Return the cache keys of one platform identity."""
+    keys = []
+    if platform_username is not None:
+        keys.append((platform_name, "username", platform_username))
+    if platform_specific_id is not None:
+        keys.append((platform_name, "platform_id", platform_specific_id))
+    return keys
+
+
+def forget(session: Session, keys: Iterable[IdentityKey] = (), user_id: Optional[str] = None) -> None:
+    """Drop identities changed by session, now and once it commits."""
+    database = session.info.get("database")
+    cache = database.identity_cache if database is not None else None
+    if cache is None:
+        return
+    keys = list(keys)
+    cache.forget(keys, user_id)
+    event.listen(session, "after_commit", lambda session: cache.forget(keys, user_id), once=True)
@@ -1,6 +1,6 @@
 """Abstract base classes defining the Callisto API interface."""
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any, Sequence, Tuple
 
 class UserInterface(ABC):
     """Interface for user management operations."""
@@ -10,6 +10,11 @@ class UserInterface(ABC):
         """Find a user by platform and username."""
         pass
     
+    @abstractmethod
+    def get_user_by_platform_id(self, platform_name: str, platform_specific_id: str) -> Optional[Any]:
+        """Find a user by platform and the platform's own ID for them."""
+        pass
+    
     @abstractmethod
     def create_user(self, name: str, platform_name: str, platform_username: str, 
                    platform_specific_id: Optional[str] = None) -> Any:
@@ -86,6 +91,36 @@ class ConversationInterface(ABC):
     def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
         """Get all messages in a conversation."""
         pass
+    
+    @abstractmethod
+    def get_conversation_history_page(self, conversation_id: str, limit: int = 50,
+                                      before: Optional[Tuple[int, int]] = None,
+                                      after: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+        """Get a page of messages before or after a (timestamp, message_id) cursor."""
+        pass
+    
+    @abstractmethod
+    def get_context_window(self, conversation_id: str, max_tokens: int,
+                           max_messages: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the most recent messages that fit in a token budget."""
+        pass
+    
+    @abstractmethod
+    def iter_conversation_history(self, conversation_id: str, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Stream all messages in a conversation."""
+        pass
+    
+    @abstractmethod
+    def search_messages(self, user_id: str, query: str, limit: int = 20,
+                        since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Full-text search over a user's messages."""
+        pass
+    
+    @abstractmethod
+    def semantic_search(self, user_id: str, text: str, k: int = 10,
+                        kinds: Sequence[str] = ("message", "knowledge")) -> List[Dict[str, Any]]:
+        """Find a user's messages and knowledge most similar in meaning to text."""
+        pass
 
 
 class CallistoAPIInterface(UserInterface, KnowledgeInterface, ConversationInterface):
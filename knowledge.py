@@ -3,56 +3,77 @@ import json
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Union, Tuple
 
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
 
-from .db import db
+from .db import Database
 from .models import UserKnowledge, KnowledgeCategory, User
+from .records import KnowledgeRecord
 from .security import sanitize_input
+from . import embeddings, profile_cache, reference_cache
+
+# Knowledge rows joined with their category, as read into KnowledgeRecords
+_KNOWLEDGE_COLUMNS = (KnowledgeCategory.category_name, KnowledgeCategory.data_type, KnowledgeCategory.is_personal,
+                      UserKnowledge.value, UserKnowledge.confidence, UserKnowledge.source, UserKnowledge.updated_at)
 
 class KnowledgeManager:
     """Handles knowledge storage and retrieval operations."""
-
-    @staticmethod
-    def get_knowledge(user_id: str, category_name: Optional[str] = None, 
-                     is_personal: Optional[bool] = None) -> Dict[str, Any]:
+    
+    def __init__(self, database: Database):
+        """Use the given database, or shard router, for every operation."""
+        self.db = database
+    
+    def get_knowledge(self, user_id: str, category_name: Optional[str] = None, 
+                     is_personal: Optional[bool] = None) -> Dict[str, KnowledgeRecord]:
         """Get user knowledge with optional filtering."""
-        with db.session() as session:
-            query = (session.query(UserKnowledge, KnowledgeCategory)
-                    .join(KnowledgeCategory)
-                    .filter(UserKnowledge.user_id == user_id))
-            
-            # Apply filters if provided
-            if category_name:
-                query = query.filter(KnowledgeCategory.category_name == category_name)
-            if is_personal is not None:
-                query = query.filter(KnowledgeCategory.is_personal == is_personal)
-                
-            knowledge_items = query.all()
-            
-            result = {}
-            for knowledge, category in knowledge_items:
-                # Convert value based on data type
-                value = KnowledgeManager._convert_value(knowledge.value, category.data_type)
-                    
-                if category.category_name not in result:
-                    result[category.category_name] = {
-                        "value": value,
-                        "confidence": knowledge.confidence,
-                        "source": knowledge.source,
-                        "is_personal": category.is_personal,
-                        "updated_at": knowledge.updated_at
-                    }
-                elif knowledge.confidence > result[category.category_name]["confidence"]:
-                    # Keep the highest confidence value
-                    result[category.category_name] = {
-                        "value": value,
-                        "confidence": knowledge.confidence,
-                        "source": knowledge.source,
-                        "is_personal": category.is_personal,
-                        "updated_at": knowledge.updated_at
-                    }
-            
-            return result
+        shard = self.db.for_user(user_id)
+        # A unit of work may hold uncommitted knowledge, so it bypasses the cache
+        if shard.active_session() is not None:
+            with shard.read_session() as session:
+                return KnowledgeManager._get_knowledge(session, user_id, category_name, is_personal)
+        
+        cache = shard.profile_cache
+        profile = cache.get(user_id)
+        if profile is None:
+            generation, version = cache.generation, reference_cache.version()
+            with shard.read_session() as session:
+                profile = KnowledgeManager._get_knowledge(session, user_id)
+            cache.put(user_id, profile, generation, version)
+        
+        return {
+            name: entry for name, entry in profile.items()
+            if (not category_name or name == category_name)
+            and (is_personal is None or entry["is_personal"] == is_personal)
+        }
+    
+    @staticmethod
+    def _get_knowledge(session: Session, user_id: str, category_name: Optional[str] = None, 
+                      is_personal: Optional[bool] = None) -> Dict[str, KnowledgeRecord]:
+        """Get user knowledge within an existing session."""
+        query = (select(*_KNOWLEDGE_COLUMNS)
+                .join_from(UserKnowledge, KnowledgeCategory)
+                .where(UserKnowledge.user_id == user_id))
+        
+        # Apply filters if provided
+        if category_name:
+            query = query.where(KnowledgeCategory.category_name == category_name)
+        if is_personal is not None:
+            query = query.where(KnowledgeCategory.is_personal == is_personal)
+        
+        result = {}
+        for row in session.execute(query):
+            # Keep the highest confidence value
+            current = result.get(row.category_name)
+            if current is None or row.confidence > current.confidence:
+                result[row.category_name] = KnowledgeManager._record(row)
+        
+        return result
+    
+    @staticmethod
+    def _record(row) -> KnowledgeRecord:
+        """Decode a row of _KNOWLEDGE_COLUMNS into a record."""
+        return KnowledgeRecord(KnowledgeManager._convert_value(row.value, row.data_type), row.confidence,
+                               row.source, row.is_personal, row.updated_at)
     
     @staticmethod
     def _convert_value(value_str: str, data_type: str) -> Any:
@@ -71,11 +92,17 @@ class KnowledgeManager:
             return value_str.lower() in ('true', 'yes', '1')
         else:
             return value_str
-            
-    @staticmethod
-    def store_knowledge(user_id: str, category_name: str, value: Any, 
+    
+    def store_knowledge(self, user_id: str, category_name: str, value: Any, 
                        confidence: float = 1.0, source: str = "user_stated") -> None:
         """Store a piece of knowledge about a user."""
+        with self.db.for_user(user_id).session() as session:
+            KnowledgeManager._store_knowledge(session, user_id, category_name, value, confidence, source)
+    
+    @staticmethod
+    def _store_knowledge(session: Session, user_id: str, category_name: str, value: Any, 
+                        confidence: float = 1.0, source: str = "user_stated") -> None:
+        """Store a piece of knowledge within an existing session."""
         # Sanitize category name
         category_name = sanitize_input(category_name)
         
@@ -84,49 +111,59 @@ class KnowledgeManager:
             value = sanitize_input(value)
         elif isinstance(value, list):
             value = [sanitize_input(item) if isinstance(item, str) else item for item in value]
-            
-        with db.session() as session:
-            # Find category
-            category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
-            if not category:
-                # Create new category if it doesn't exist
-                data_type = KnowledgeManager._detect_data_type(value)
-                category = KnowledgeCategory(
-                    category_name=category_name,
-                    data_type=data_type,
-                    is_personal=False
-                )
-                session.add(category)
-                session.flush()
-            
-            # Convert value to string
-            value_str = KnowledgeManager._convert_to_storage_format(value, category.data_type)
-            
-            now = int(datetime.now().timestamp())
-            
-            # Create or update knowledge
-            knowledge = (session.query(UserKnowledge)
-                .filter_by(user_id=user_id, category_id=category.category_id)
-                .first())
-                
-            if knowledge:
-                # Only update if new confidence is higher or equal
-                if confidence >= knowledge.confidence:
-                    knowledge.value = value_str
-                    knowledge.confidence = confidence
-                    knowledge.source = source
-                    knowledge.updated_at = now
-            else:
-                knowledge = UserKnowledge(
-                    user_id=user_id,
-                    category_id=category.category_id,
-                    value=value_str,
-                    confidence=confidence,
-                    source=source,
-                    created_at=now,
-                    updated_at=now
-                )
-                session.add(knowledge)
+        
+        # Find category
+        category = reference_cache.category(session, category_name)
+        if not category:
+            with reference_cache.writer(session) as writer:
+                # Another writer may have created it since the lookup
+                category = reference_cache.category(writer, category_name)
+                if not category:
+                    # Create new category if it doesn't exist
+                    data_type = KnowledgeManager._detect_data_type(value)
+                    category = KnowledgeCategory(
+                        category_name=category_name,
+                        data_type=data_type,
+                        is_personal=False
+                    )
+                    writer.add(category)
+                    writer.flush()
+                    reference_cache.invalidate(writer)
+        
+        # Convert value to string
+        value_str = KnowledgeManager._convert_to_storage_format(value, category.data_type)
+        
+        now = int(datetime.now().timestamp())
+        
+        # Create or update knowledge
+        knowledge = (session.query(UserKnowledge)
+            .filter_by(user_id=user_id, category_id=category.category_id)
+            .first())
+        
+        stored = True
+        if knowledge:
+            # Only update if new confidence is higher or equal
+            stored = confidence >= knowledge.confidence
+            if stored:
+                knowledge.value = value_str
+                knowledge.confidence = confidence
+                knowledge.source = source
+                knowledge.updated_at = now
+        else:
+            knowledge = UserKnowledge(
+                user_id=user_id,
+                category_id=category.category_id,
+                value=value_str,
+                confidence=confidence,
+                source=source,
+                created_at=now,
+                updated_at=now
+            )
+            session.add(knowledge)
+        
+        if stored:
+            embeddings.index_knowledge(session, knowledge, category)
+        profile_cache.forget(session, user_id)
     
     @staticmethod
     def _detect_data_type(value: Any) -> str:
@@ -147,12 +184,11 @@ class KnowledgeManager:
             return json.dumps(value)
         else:
             return str(value)
-            
-    @staticmethod
-    def batch_store_knowledge(user_id: str, knowledge_items: List[Dict[str, Any]]) -> None:
+    
+    def batch_store_knowledge(self, user_id: str, knowledge_items: List[Dict[str, Any]]) -> None:
         """Store multiple knowledge items at once."""
         for item in knowledge_items:
-            KnowledgeManager.store_knowledge(
+            self.store_knowledge(
                 user_id=user_id,
                 category_name=item["category"],
                 value=item["value"],
@@ -160,57 +196,55 @@ class KnowledgeManager:
                 source=item.get("source", "user_stated")
             )
     
-    @staticmethod
-    def delete_knowledge(user_id: str, category_name: str) -> None:
+    def delete_knowledge(self, user_id: str, category_name: str) -> None:
         """Delete a piece of knowledge about a user."""
-        with db.session() as session:
-            # Find category
-            category = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
-            if not category:
-                return
-            
-            # Find and delete knowledge
-            knowledge = (session.query(UserKnowledge)
-                .filter_by(user_id=user_id, category_id=category.category_id)
-                .first())
-                
-            if knowledge:
-                session.delete(knowledge)
-                
+        with self.db.for_user(user_id).session() as session:
+            KnowledgeManager._delete_knowledge(session, user_id, category_name)
+    
     @staticmethod
-    def merge_knowledge(user_id: str, target_user_id: str) -> None:
+    def _delete_knowledge(session: Session, user_id: str, category_name: str) -> None:
+        """Delete a piece of knowledge within an existing session."""
+        # Find category
+        category = reference_cache.category(session, category_name)
+        if not category:
+            return
+        
+        # Find and delete knowledge
+        knowledge = (session.query(UserKnowledge)
+            .filter_by(user_id=user_id, category_id=category.category_id)
+            .first())
+        
+        if knowledge:
+            embeddings.forget_knowledge(session, knowledge)
+            session.delete(knowledge)
+            profile_cache.forget(session, user_id)
+    
+    def merge_knowledge(self, user_id: str, target_user_id: str) -> None:
         """Merge knowledge from target user into this user."""
-        target_knowledge = KnowledgeManager.get_knowledge(target_user_id)
+        target_knowledge = self.get_knowledge(target_user_id)
         
         for category, data in target_knowledge.items():
             # Only merge if we don't have higher confidence data
-            existing = KnowledgeManager.get_knowledge(user_id, category)
+            existing = self.get_knowledge(user_id, category)
             if not existing or existing.get(category, {}).get("confidence", 0) < data["confidence"]:
-                KnowledgeManager.store_knowledge(
+                self.store_knowledge(
                     user_id=user_id,
                     category_name=category,
                     value=data["value"],
                     confidence=data["confidence"],
                     source=data["source"]
                 )
-                
-    @staticmethod
-    def get_knowledge_by_source(user_id: str, source: str) -> Dict[str, Any]:
+    
+    def get_knowledge_by_source(self, user_id: str, source: str) -> Dict[str, KnowledgeRecord]:
         """Get all knowledge from a specific source."""
-        with db.session() as session:
-            knowledge_items = (session.query(UserKnowledge, KnowledgeCategory)
-                .join(KnowledgeCategory)
-                .filter(UserKnowledge.user_id == user_id, UserKnowledge.source == source)
-                .all())
-            
-            result = {}
-            for knowledge, category in knowledge_items:
-                value = KnowledgeManager._convert_value(knowledge.value, category.data_type)
-                result[category.category_name] = {
-                    "value": value,
-                    "confidence": knowledge.confidence,
-                    "is_personal": category.is_personal,
-                    "updated_at": knowledge.updated_at
-                }
-            
-            return result
\ No newline at end of file
+        with self.db.for_user(user_id).read_session() as session:
+            return KnowledgeManager._get_knowledge_by_source(session, user_id, source)
+    
+    @staticmethod
+    def _get_knowledge_by_source(session: Session, user_id: str, source: str) -> Dict[str, KnowledgeRecord]:
+        """Get knowledge from a specific source within an existing session."""
+        rows = session.execute(select(*_KNOWLEDGE_COLUMNS)
+            .join_from(UserKnowledge, KnowledgeCategory)
+            .where(UserKnowledge.user_id == user_id, UserKnowledge.source == source))
+        
+        return {row.category_name: KnowledgeManager._record(row) for row in rows}
\ No newline at end of file
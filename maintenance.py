@@ -0,0 +1,179 @@
+"""Background maintenance for Callisto databases."""
+import atexit
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy.engine import Connection
+
+class MaintenanceScheduler:
+    """Runs housekeeping on a Database while it is idle.
+    
+    Three jobs keep a long-running database healthy:
+    
+    - incremental vacuum returns free pages left by deleted rows to the OS
+      (needs auto_vacuum=INCREMENTAL, set on every newly created file; older
+      files are converted by Database.enable_incremental_vacuum());
+    - a passive WAL checkpoint copies committed pages back into the main file
+      without waiting on readers or writers;
+    - ``PRAGMA optimize`` refreshes the planner statistics that need it,
+      with a bounded ANALYZE sample.
+    
+    Work is done only after ``idle_after`` seconds without any session and in
+    slices of at most ``slice_seconds``. Each slice holds the writer
+    connection only briefly, and the scheduler checks again that the database
+    is idle before starting the next one, so foreground calls never wait
+    behind a long maintenance job.
+    """
+    
+    def __init__(self, database, idle_after: float = 5.0, check_interval: float = 1.0,
+                 slice_seconds: float = 0.05, vacuum_pages: int = 256,
+                 optimize_interval: float = 3600.0, analysis_limit: int = 400):
+        """Create a scheduler; call start() to run it in the background."""
+        if slice_seconds <= 0 or vacuum_pages < 1:
+            raise ValueError("slice_seconds and vacuum_pages must be positive")
+        
+        self.database = database
+        self.idle_after = idle_after
+        self.check_interval = check_interval
+        self.slice_seconds = slice_seconds
+        self.vacuum_pages = vacuum_pages
+        self.optimize_interval = optimize_interval
+        self.analysis_limit = analysis_limit
+        
+        self._last_optimize = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "cycles": 0,
+            "slices": 0,
+            "pages_reclaimed": 0,
+            "bytes_reclaimed": 0,
+            "wal_frames_checkpointed": 0,
+            "optimize_runs": 0,
+            "last_run": None,
+            "last_error": None,
+        }
+        self._stop = threading.Event()
+        self._thread = None
+    
+    # SCHEDULING
+    
+    def start(self) -> None:
+        """Start the background maintenance thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="callisto-maintenance", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        """Stop the background thread after its current slice."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        atexit.unregister(self.stop)
+    
+    def is_idle(self) -> bool:
+        """Return True if no session has been active for idle_after seconds."""
+        return time.monotonic() - self.database.last_activity >= self.idle_after
+    
+    def _run(self) -> None:
+        """Wait for idle periods and run a maintenance cycle in each."""
+        while not self._stop.wait(self.check_interval):
+            if not self.is_idle():
+                continue
+            try:
+                self.run_once(only_when_idle=True)
+            except Exception as e:
+                # Try again in the next idle period rather than stop for good
+                with self._lock:
+                    self._stats["last_error"] = repr(e)
+    
+    # JOBS
+    
+    def run_once(self, only_when_idle: bool = False) -> Dict[str, Any]:
+        """Run one maintenance cycle and return what it did.
+        
+        With ``only_when_idle`` the cycle stops early as soon as foreground
+        activity resumes.
+        """
+        def keep_going():
+            return not self._stop.is_set() and (not only_when_idle or self.is_idle())
+        
+        report = {"pages_reclaimed": 0, "bytes_reclaimed": 0, "wal_frames_checkpointed": 0,
+                  "optimized": False, "slices": 0}
+        
+        # Incremental vacuum, one bounded slice at a time
+        while keep_going():
+            pages, page_size = self._vacuum_slice()
+            report["slices"] += 1
+            report["pages_reclaimed"] += pages
+            report["bytes_reclaimed"] += pages * page_size
+            if pages < self.vacuum_pages:
+                break
+        
+        if keep_going():
+            report["wal_frames_checkpointed"] = self._checkpoint()
+            report["slices"] += 1
+        
+        due = self._last_optimize is None or time.monotonic() - self._last_optimize >= self.optimize_interval
+        if due and keep_going():
+            self._optimize()
+            report["optimized"] = True
+            report["slices"] += 1
+        
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["slices"] += report["slices"]
+            self._stats["pages_reclaimed"] += report["pages_reclaimed"]
+            self._stats["bytes_reclaimed"] += report["bytes_reclaimed"]
+            self._stats["wal_frames_checkpointed"] += report["wal_frames_checkpointed"]
+            self._stats["optimize_runs"] += int(report["optimized"])
+            self._stats["last_run"] = time.time()
+        return report
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return totals over every cycle run so far."""
+        with self._lock:
+            return dict(self._stats)
+    
+    def _vacuum_slice(self) -> tuple:
+        """Free up to vacuum_pages pages; return (pages freed, page size)."""
+        with self.database.engine.connect() as conn:
+            page_size = _pragma(conn, "page_size")
+            if _pragma(conn, "auto_vacuum") != 2:  # 2 = INCREMENTAL
+                return 0, page_size
+            
+            before = _pragma(conn, "freelist_count")
+            deadline = time.monotonic() + self.slice_seconds
+            # Small steps so the slice can end on time
+            step = max(1, self.vacuum_pages // 8)
+            freed = 0
+            while freed < self.vacuum_pages and time.monotonic() < deadline:
+                conn.exec_driver_sql(f"PRAGMA incremental_vacuum({step})")
+                remaining = _pragma(conn, "freelist_count")
+                freed = before - remaining
+                if not remaining:
+                    break
+            return freed, page_size
+    
+    def _checkpoint(self) -> int:
+        """Checkpoint the WAL without blocking; return frames copied back."""
+        with self.database.engine.connect() as conn:
+            busy, log_frames, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            return max(0, checkpointed)
+    
+    def _optimize(self) -> None:
+        """Refresh stale planner statistics with a bounded ANALYZE."""
+        with self.database.engine.connect() as conn:
+            conn.exec_driver_sql(f"PRAGMA analysis_limit={self.analysis_limit}")
+            conn.exec_driver_sql("PRAGMA optimize")
+        self._last_optimize = time.monotonic()
+
+
+def _pragma(conn: Connection, name: str) -> int:
+    """Return the value of an integer PRAGMA."""
+    return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
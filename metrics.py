@@ -0,0 +1,266 @@
+"""Per-call latency and query metrics for Callisto."""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _CallRecord:
+    """Counters for a single in-flight call."""
+    
+    __slots__ = ("statements", "pool_wait", "rows", "retries")
+    
+    def __init__(self):
+        self.statements = 0
+        self.pool_wait = 0.0
+        self.rows = 0
+        self.retries = 0
+
+
+class MethodStats:
+    """Aggregated metrics for one API method."""
+    
+    def __init__(self, sample_size: int):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.pool_wait = 0.0
+        self.retries = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        # Recent latencies for percentiles
+        self.samples = deque(maxlen=sample_size)
+    
+    def record(self, elapsed: float, call: _CallRecord, failed: bool) -> None:
+        """Add one finished call."""
+        self.calls += 1
+        self.errors += int(failed)
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.statements += call.statements
+        self.rows += call.rows
+        self.pool_wait += call.pool_wait
+        self.retries += call.retries
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        self.samples.append(elapsed)
+    
+    def percentile(self, fraction: float) -> float:
+        """Return a latency percentile (nearest rank) over recent calls."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+        return ordered[index]
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the stats as a plain dictionary."""
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency": {
+                "p50": self.percentile(0.50),
+                "p95": self.percentile(0.95),
+                "p99": self.percentile(0.99),
+                "mean": self.total_time / calls,
+                "max": self.max_time,
+            },
+            "statements": self.statements,
+            "statements_per_call": self.statements / calls,
+            "rows": self.rows,
+            "pool_wait": self.pool_wait,
+            "retries": self.retries,
+        }
+
+
+class Metrics:
+    """Thread-safe registry of per-method call metrics.
+    
+    SQL statements and connection-pool waits are attributed to every
+    tracked call active in the current thread or task, so a batch method
+    also accounts for the calls it makes internally.
+    """
+    
+    def __init__(self, sample_size: int = 2048):
+        self.sample_size = sample_size
+        self._stats: Dict[str, MethodStats] = {}
+        self._lock = threading.Lock()
+        self._active = contextvars.ContextVar("callisto_active_calls", default=())
+        # Busy/locked retries across all callers, including untracked ones
+        self._retries = {"retried": 0, "exhausted": 0}
+        # Hits and misses of the in-process caches, by cache name
+        self._caches: Dict[str, List[int]] = {}
+    
+    # COLLECTION
+    
+    def instrument_engine(self, engine: Engine) -> None:
+        """Count SQL statements executed through an engine."""
+        event.listen(engine, "before_cursor_execute", self._on_statement)
+    
+    def _on_statement(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        for call in self._active.get():
+            call.statements += 1
+    
+    def record_pool_wait(self, seconds: float) -> None:
+        """Attribute time spent waiting for a pooled connection."""
+        for call in self._active.get():
+            call.pool_wait += seconds
+    
+    def record_retry(self, exhausted: bool = False) -> None:
+        """Count a transient database error that was retried or gave up."""
+        if not exhausted:
+            for call in self._active.get():
+                call.retries += 1
+        with self._lock:
+            self._retries["exhausted" if exhausted else "retried"] += 1
+    
+    def record_cache(self, cache: str, hit: bool) -> None:
+        """Count one lookup in a named in-process cache."""
+        with self._lock:
+            counts = self._caches.get(cache)
+            if counts is None:
+                counts = self._caches[cache] = [0, 0]
+            counts[0 if hit else 1] += 1
+    
+    @contextmanager
+    def track(self, method: str) -> Iterator[_CallRecord]:
+        """Measure one call of an API method."""
+        call = _CallRecord()
+        token = self._active.set(self._active.get() + (call,))
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield call
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._active.reset(token)
+            with self._lock:
+                stats = self._stats.get(method)
+                if stats is None:
+                    stats = self._stats[method] = MethodStats(self.sample_size)
+                stats.record(elapsed, call, failed)
+    
+    def instrument(self, exclude: tuple = ()):
+        """Class decorator that tracks every public method of an API class."""
+        def decorate(cls):
+            for name, member in list(vars(cls).items()):
+                if name.startswith("_") or name in exclude or not callable(member):
+                    continue
+                setattr(cls, name, self._wrap(name, member))
+            return cls
+        return decorate
+    
+    def _wrap(self, name: str, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.track(name) as call:
+                result = method(*args, **kwargs)
+                call.rows = _count_rows(result)
+                return result
+        return wrapper
+    
+    # REPORTING
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return current metrics for every method that has been called."""
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in sorted(self._stats.items())}
+    
+    def retry_snapshot(self) -> Dict[str, int]:
+        """Return how many transient errors were retried and how many gave up."""
+        with self._lock:
+            return dict(self._retries)
+    
+    def cache_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return hits, misses and hit rate of every cache that has been used."""
+        with self._lock:
+            return {
+                name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                for name, (hits, misses) in sorted(self._caches.items())
+            }
+    
+    def reset(self) -> None:
+        """Discard all collected metrics."""
+        with self._lock:
+            self._stats.clear()
+            self._retries = {"retried": 0, "exhausted": 0}
+            self._caches.clear()
+    
+    def to_prometheus(self, prefix: str = "callisto_api") -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stats = sorted(self._stats.items())
+            lines: List[str] = []
+            
+            def family(name, kind, help_text, values):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} {kind}")
+                for method, s in stats:
+                    lines.append(f'{prefix}_{name}{{method="{method}"}} {values(s)}')
+            
+            family("calls_total", "counter", "Number of calls.", lambda s: s.calls)
+            family("errors_total", "counter", "Number of calls that raised.", lambda s: s.errors)
+            family("statements_total", "counter", "SQL statements issued.", lambda s: s.statements)
+            family("rows_total", "counter", "Records returned to callers.", lambda s: s.rows)
+            family("pool_wait_seconds_total", "counter",
+                   "Time spent waiting for a pooled connection.", lambda s: repr(s.pool_wait))
+            family("retries_total", "counter",
+                   "Retries after a transient busy/locked database error.", lambda s: s.retries)
+            
+            for name, key, help_text in (
+                ("db_retries_total", "retried", "Transient database errors that were retried."),
+                ("db_retries_exhausted_total", "exhausted", "Transient database errors that used up every attempt."),
+            ):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                lines.append(f"{prefix}_{name} {self._retries[key]}")
+            
+            for name, index, help_text in (
+                ("cache_hits_total", 0, "Lookups answered by an in-process cache."),
+                ("cache_misses_total", 1, "Lookups an in-process cache had to pass to the database."),
+            ):
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for cache, counts in sorted(self._caches.items()):
+                    lines.append(f'{prefix}_{name}{{cache="{cache}"}} {counts[index]}')
+            
+            lines.append(f"# HELP {prefix}_latency_seconds Call latency.")
+            lines.append(f"# TYPE {prefix}_latency_seconds histogram")
+            for method, s in stats:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), s.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_latency_seconds_bucket{{method="{method}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_latency_seconds_sum{{method="{method}"}} {s.total_time!r}')
+                lines.append(f'{prefix}_latency_seconds_count{{method="{method}"}} {s.calls}')
+            
+            return "\n".join(lines) + "\n"
+
+
+def _count_rows(result: Any) -> int:
+    """Return how many records a call handed back to its caller."""
+    if result is None or isinstance(result, (bool, str, Future)):
+        return 0
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return 1
+
+
+# Global metrics registry
+metrics = Metrics()
@@ -0,0 +1,218 @@
+"""Versioned schema migrations for existing Callisto databases.
+
+``Base.metadata.create_all`` only creates missing tables, so changes to
+existing tables (such as new indexes) are applied here. The schema version is
+kept in SQLite's ``PRAGMA user_version``; each migration runs once, in order,
+and must be safe to run against a freshly created schema as well.
+"""
+from typing import Callable, List, Tuple
+
+from sqlalchemy.engine import Connection
+
+from .models import UserKnowledge, Conversation, Message, ExtractionJob
+from .counters import repair_counters
+from .tokens import fill_token_counts
+
+def _has_table(conn: Connection, name: str) -> bool:
+    """Return True if the table exists in this database file (not an attached one)."""
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).first() is not None
+
+
+def _columns(conn: Connection, table: str) -> set:
+    """Return the column names of a table."""
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA main.table_info({table})")}
+
+
+def _create_indexes(conn: Connection, models: list) -> None:
+    """Create the models' missing indexes whose columns already exist.
+    
+    Indexes on columns added by a later migration are left to that migration.
+    """
+    for model in models:
+        columns = _columns(conn, model.__tablename__)
+        for index in model.__table__.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def _add_hot_path_indexes(conn: Connection) -> None:
+    """Add composite and partial indexes used by the hot queries."""
+    # A shard or the global database of a sharded store holds only some tables
+    models = [m for m in (UserKnowledge, Conversation, Message, ExtractionJob) if _has_table(conn, m.__tablename__)]
+    
+    # Keep the best row per (user, category) so the unique index can be built:
+    # highest confidence first, then the most recently updated
+    if UserKnowledge in models:
+        conn.exec_driver_sql("""
+            DELETE FROM user_knowledge WHERE knowledge_id NOT IN (
+                SELECT knowledge_id FROM (
+                    SELECT knowledge_id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id, category_id
+                        ORDER BY confidence DESC, updated_at DESC, knowledge_id DESC
+                    ) AS rank
+                    FROM user_knowledge
+                ) WHERE rank = 1
+            )
+        """)
+    
+    _create_indexes(conn, models)
+    
+    # Superseded by the composite indexes above
+    for name in ("idx_userknowledge_user_id", "idx_conversations_user_id",
+                 "idx_conversations_extracted", "idx_messages_conversation"):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+def _add_archive_column(conn: Connection) -> None:
+    """Track which conversations have been moved to the cold-storage archive."""
+    if not _has_table(conn, Conversation.__tablename__):
+        return
+    if "archived_at" not in _columns(conn, Conversation.__tablename__):
+        conn.exec_driver_sql("ALTER TABLE conversations ADD COLUMN archived_at INTEGER")
+    _create_indexes(conn, [Conversation])
+
+
+# Full-text index over message content. The index is external-content: it
+# keeps only tokens and reads text back through the view (for snippets), which
+# decodes compressed content with callisto_text() (see db._register_functions).
+# Each message is indexed with its user ID as a single token so a search can
+# intersect the query with that user's messages inside FTS5.
+FTS_SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT m.message_id AS message_id, callisto_text(m.content) AS content,
+               replace(c.user_id, '-', '') AS user_token
+        FROM messages m JOIN conversations c ON c.conversation_id = m.conversation_id""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, user_token,
+        content='messages_fts_source', content_rowid='message_id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, user_token)
+        VALUES (new.message_id, callisto_text(new.content),
+                (SELECT replace(user_id, '-', '') FROM conversations WHERE conversation_id = new.conversation_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, user_token)
+        VALUES ('delete', old.message_id, callisto_text(old.content),
+                (SELECT replace(user_id, '-', '') FROM conversations WHERE conversation_id = old.conversation_id));
+    END""",
+    # Recompression rewrites content without changing the text; skip those
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, conversation_id ON messages
+    WHEN callisto_text(old.content) IS NOT callisto_text(new.content)
+      OR old.conversation_id IS NOT new.conversation_id BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, user_token)
+        VALUES ('delete', old.message_id, callisto_text(old.content),
+                (SELECT replace(user_id, '-', '') FROM conversations WHERE conversation_id = old.conversation_id));
+        INSERT INTO messages_fts(rowid, content, user_token)
+        VALUES (new.message_id, callisto_text(new.content),
+                (SELECT replace(user_id, '-', '') FROM conversations WHERE conversation_id = new.conversation_id));
+    END""",
+]
+
+
+def _add_message_search(conn: Connection) -> None:
+    """Create the full-text index over messages and fill it from existing rows."""
+    if not _has_table(conn, Message.__tablename__):
+        return
+    for statement in FTS_SCHEMA:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def _add_token_counts(conn: Connection) -> None:
+    """Store each message's length in tokens, for context-window budgets."""
+    if not _has_table(conn, Message.__tablename__):
+        return
+    if "token_count" not in _columns(conn, Message.__tablename__):
+        conn.exec_driver_sql("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+    last_id = 0
+    while last_id is not None:
+        last_id = fill_token_counts(conn, last_id)
+
+
+def _add_conversation_counters(conn: Connection) -> None:
+    """Keep message counts and the latest message on each conversation.
+    
+    Archived conversations are left at zero here: their messages are in the
+    archive file, so run counters.CounterRepairJob with it open.
+    """
+    if not _has_table(conn, Conversation.__tablename__):
+        return
+    columns = _columns(conn, Conversation.__tablename__)
+    if "message_count" not in columns:
+        conn.exec_driver_sql("ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+    if "last_message_at" not in columns:
+        conn.exec_driver_sql("ALTER TABLE conversations ADD COLUMN last_message_at INTEGER")
+    if "last_message_preview" not in columns:
+        conn.exec_driver_sql("ALTER TABLE conversations ADD COLUMN last_message_preview TEXT")
+    
+    last_id = ""
+    while last_id is not None:
+        last_id, _, _ = repair_counters(conn, last_id)
+
+
+def _add_message_autoincrement(conn: Connection) -> None:
+    """Stop SQLite from reusing the IDs of deleted messages.
+    
+    Without AUTOINCREMENT a new message can take the ID of the newest one
+    deleted or archived, and anything still referring to that ID (such as an
+    embedding) would point at another user's message. SQLite cannot add the
+    keyword to an existing table, so the table is rebuilt, keeping every ID.
+    """
+    if not _has_table(conn, Message.__tablename__):
+        return
+    sql = conn.exec_driver_sql(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'messages'").scalar()
+    if "AUTOINCREMENT" in sql.upper():
+        return
+    
+    # The full-text triggers and view refer to the table by name; rebuilt below
+    for name in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    conn.exec_driver_sql("DROP VIEW IF EXISTS messages_fts_source")
+    conn.exec_driver_sql("ALTER TABLE messages RENAME TO messages_old")
+    for index in Message.__table__.indexes:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    
+    Message.__table__.create(conn)
+    columns = ", ".join(column.name for column in Message.__table__.columns)
+    conn.exec_driver_sql(f"INSERT INTO messages ({columns}) SELECT {columns} FROM messages_old")
+    conn.exec_driver_sql("DROP TABLE messages_old")
+    # Row IDs are unchanged, so the full-text index itself stays valid
+    for statement in FTS_SCHEMA:
+        conn.exec_driver_sql(statement)
+
+
+# (version, description, migration), in the order they must be applied
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Composite and partial indexes for hot queries", _add_hot_path_indexes),
+    (2, "Conversation archive tracking", _add_archive_column),
+    (3, "Full-text search over messages", _add_message_search),
+    (4, "Message token counts", _add_token_counts),
+    (5, "Conversation message counters", _add_conversation_counters),
+    (6, "Never reuse message IDs", _add_message_autoincrement),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> int:
+    """Return the schema version recorded in the database."""
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def run_migrations(conn: Connection) -> List[int]:
+    """Apply all pending migrations and return the versions applied."""
+    applied = []
+    current = get_schema_version(conn)
+    
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+        applied.append(version)
+    
+    return applied
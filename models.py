@@ -1,10 +1,15 @@
 """SQLAlchemy models for Callisto memory database."""
 from datetime import datetime
 import uuid
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, Float, String, Text, UniqueConstraint, Index
+from sqlalchemy import (
+    Boolean, Column, ForeignKey, Integer, Float, LargeBinary, String, Text, UniqueConstraint, Index, text
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
+from .compression import CompressedText
+from .tokens import default_token_count
+
 Base = declarative_base()
 
 class User(Base):
@@ -20,7 +25,7 @@ class User(Base):
     platforms = relationship("UserPlatform", back_populates="user", cascade="all, delete-orphan")
     knowledge = relationship("UserKnowledge", back_populates="user", cascade="all, delete-orphan")
     conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
-
+    
     @classmethod
     def create(cls, name, metadata=None):
         """Create a new user with generated UUID and timestamps."""
@@ -94,7 +99,8 @@ class UserKnowledge(Base):
     category = relationship("KnowledgeCategory", back_populates="knowledge_items")
     
     __table_args__ = (
-        Index("idx_userknowledge_user_id", "user_id"),
+        # One row per user and category; also serves lookups by user_id alone
+        Index("uq_userknowledge_user_category", "user_id", "category_id", unique=True),
         Index("idx_userknowledge_category", "category_id")
     )
 
@@ -109,6 +115,11 @@ class Conversation(Base):
     started_at = Column(Integer, nullable=False)
     ended_at = Column(Integer)  # NULL if ongoing
     extracted = Column(Boolean, nullable=False, default=False)
+    archived_at = Column(Integer)  # NULL while the messages are in the hot table
+    # Maintained by add_message and store_conversation; archived messages still count
+    message_count = Column(Integer, nullable=False, default=0)
+    last_message_at = Column(Integer)  # NULL until the first message
+    last_message_preview = Column(Text)  # start of the latest message
     
     user = relationship("User", back_populates="conversations")
     platform = relationship("Platform")
@@ -116,8 +127,12 @@ class Conversation(Base):
     extraction_jobs = relationship("ExtractionJob", back_populates="conversation", cascade="all, delete-orphan")
     
     __table_args__ = (
-        Index("idx_conversations_user_id", "user_id"),
-        Index("idx_conversations_extracted", "extracted")
+        Index("idx_conversations_user_started", "user_id", "started_at"),
+        # Only unprocessed conversations are ever looked up by this flag
+        Index("idx_conversations_unextracted", "user_id", "started_at",
+              sqlite_where=text("extracted = 0")),
+        # Finds the oldest ended conversations not yet archived
+        Index("idx_conversations_archive", "archived_at", "ended_at")
     )
     
     @classmethod
@@ -139,16 +154,29 @@ class Message(Base):
     message_id = Column(Integer, primary_key=True, autoincrement=True)
     conversation_id = Column(String, ForeignKey("conversations.conversation_id"), nullable=False)
     is_from_user = Column(Boolean, nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)  # see compression.py
     timestamp = Column(Integer, nullable=False)
+    token_count = Column(Integer, nullable=False, default=default_token_count)  # see tokens.py
     
     conversation = relationship("Conversation", back_populates="messages")
     
     __table_args__ = (
-        Index("idx_messages_conversation", "conversation_id"),
+        Index("idx_messages_conversation_timestamp", "conversation_id", "timestamp"),
+        # IDs of deleted messages are never reused; embeddings refer to messages by ID
+        {"sqlite_autoincrement": True},
     )
 
 
+class CompressionDictionary(Base):
+    """Dictionaries that message content is compressed against."""
+    __tablename__ = "compression_dictionaries"
+    
+    dictionary_id = Column(Integer, primary_key=True, autoincrement=False)  # CRC32 of data
+    format = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(Integer, nullable=False)
+
+
 class ExtractionJob(Base):
     """Scheduled jobs to extract knowledge from conversations."""
     __tablename__ = "extraction_jobs"
@@ -160,4 +188,34 @@ class ExtractionJob(Base):
     completed_at = Column(Integer)  # NULL if not completed
     error = Column(Text)  # NULL if no error
     
-    conversation = relationship("Conversation", back_populates="extraction_jobs")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="extraction_jobs")
+    
+    __table_args__ = (
+        Index("idx_extractionjobs_status_created", "status", "created_at"),
+    )
+
+
+class Embedding(Base):
+    """Vector embedding of a message or knowledge item, for semantic search."""
+    __tablename__ = "embeddings"
+    
+    kind = Column(String, primary_key=True)  # message, knowledge
+    item_id = Column(Integer, primary_key=True, autoincrement=False)  # message_id or knowledge_id
+    user_id = Column(String, nullable=False)
+    model = Column(Text, nullable=False)  # name of the embedder that produced it
+    cell = Column(Integer, nullable=False, default=0)  # coarse partition, see embeddings.py
+    checksum = Column(Integer, nullable=False)  # CRC32 of the embedded text
+    vector = Column(LargeBinary, nullable=False)  # float32, unit length
+    
+    __table_args__ = (
+        Index("idx_embeddings_user_cell", "user_id", "cell"),
+    )
+
+
+class EmbeddingCell(Base):
+    """Centroids of the coarse partitions embeddings are grouped into."""
+    __tablename__ = "embedding_cells"
+    
+    model = Column(Text, primary_key=True)
+    cell = Column(Integer, primary_key=True, autoincrement=False)
+    centroid = Column(LargeBinary, nullable=False)  # float32
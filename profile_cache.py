@@ -0,0 +1,113 @@
+"""In-process cache of decoded per-user knowledge profiles.
+
+Reading a user's knowledge joins user_knowledge with the categories,
+decodes every value and keeps the most confident entry per category. The
+same few active users are read on every turn, so each database file keeps
+the decoded profiles of recently read users in an LRU
+(``Database.profile_cache``); filtered reads are answered from the whole
+cached profile.
+
+Writes to a user's knowledge call forget(session, user_id), which drops the
+profile at once and again when the transaction commits; a generation
+counter stops a read that raced the write from caching what it saw.
+Writes from other processes are picked up after ``TTL`` seconds. Profiles
+also remember the reference-data version they were decoded under (see
+reference_cache), so any category change invalidates them all.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import reference_cache
+from .metrics import metrics
+from .records import KnowledgeRecord
+
+MAX_USERS = 1000
+TTL = 60.0
+
+Profile = Dict[str, KnowledgeRecord]
+
+
+class ProfileCache:
+    """LRU of user IDs to their decoded knowledge profiles."""
+    
+    def __init__(self, max_users: int = MAX_USERS, ttl: float = TTL):
+        """Hold the profiles of up to max_users users for ttl seconds each."""
+        self._lock = threading.Lock()
+        self._profiles: "OrderedDict[str, Tuple[int, float, Profile]]" = OrderedDict()
+        self.generation = 0
+        self.configure(max_users, ttl)
+    
+    def configure(self, max_users: int = MAX_USERS, ttl: float = TTL) -> None:
+        """Change the size and lifetime; a size of 0 turns the cache off."""
+        if max_users < 0:
+            raise ValueError("Invalid cache size: must not be negative")
+        if ttl < 0:
+            raise ValueError("Invalid TTL: must not be negative")
+        with self._lock:
+            self.max_users = max_users
+            self.ttl = ttl
+            self._evict()
+    
+    def get(self, user_id: str) -> Optional[Profile]:
+        """Return a copy of the cached profile of a user, or None."""
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is not None and (entry[0] != reference_cache.version() or entry[1] <= time.monotonic()):
+                del self._profiles[user_id]
+                entry = None
+            if entry is not None:
+                self._profiles.move_to_end(user_id)
+        metrics.record_cache("knowledge", entry is not None)
+        return copy_profile(entry[2]) if entry is not None else None
+    
+    def put(self, user_id: str, profile: Profile, generation: int, version: int) -> None:
+        """Cache a profile read at generation under reference-data version."""
+        with self._lock:
+            # Something was forgotten since the read started; it may be stale
+            if generation != self.generation or not self.max_users:
+                return
+            self._profiles[user_id] = (version, time.monotonic() + self.ttl, copy_profile(profile))
+            self._profiles.move_to_end(user_id)
+            self._evict()
+    
+    def forget(self, user_id: Optional[str] = None) -> None:
+        """Drop the profile of user_id, or of every user."""
+        with self._lock:
+            self.generation += 1
+            if user_id is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(user_id, None)
+    
+    def __len__(self) -> int:
+        return len(self._profiles)
+    
+    def _evict(self) -> None:
+        while len(self._profiles) > self.max_users:
+            self._profiles.popitem(last=False)
+
+
+def copy_profile(profile: Profile) -> Profile:
+    """Copy a profile deep enough that callers cannot change a cached one.
+    
+    Records are immutable and shared; only list values need copying.
+    """
+    return {
+        name: entry._replace(value=list(entry.value)) if isinstance(entry.value, list) else entry
+        for name, entry in profile.items()
+    }
+
+
+def forget(session: Session, user_id: str) -> None:
+    """Drop the profile of a user whose knowledge session changed, now and once it commits."""
+    database = session.info.get("database")
+    cache = database.profile_cache if database is not None else None
+    if cache is None:
+        return
+    cache.forget(user_id)
+    event.listen(session, "after_commit", lambda session: cache.forget(user_id), once=True)
@@ -0,0 +1,100 @@
+"""Immutable result records returned by the read APIs.
+
+Reads build these straight from Core rows instead of loading ORM
+instances, which skips identity-map and instrumentation overhead. The
+records need no session once returned, and they cannot be changed, so they
+can be held in caches and passed between threads. Each type declares its
+fields in ``__slots__`` and carries no per-instance dict.
+
+Records read like the dicts the API returned before: ``record["name"]``,
+``dict(record)`` and comparison with a dict all work, next to attribute
+access. Use ``_asdict()`` to get a plain dict, for example to serialise one.
+"""
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Tuple
+
+
+class Record(Mapping):
+    """Base class of the read-only result records."""
+    
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    
+    def __init__(self, *values, **named):
+        if len(values) + len(named) != len(self._fields):
+            raise TypeError(f"{type(self).__name__} takes fields {', '.join(self._fields)}")
+        for name, value in zip(self._fields, values):
+            object.__setattr__(self, name, value)
+        for name in self._fields[len(values):]:
+            if name not in named:
+                raise TypeError(f"{type(self).__name__} is missing field {name!r}")
+            object.__setattr__(self, name, named[name])
+    
+    @classmethod
+    def from_object(cls, obj: Any) -> "Record":
+        """Copy the record's fields from the attributes of obj, e.g. an ORM instance."""
+        return cls(*(getattr(obj, name) for name in cls._fields))
+    
+    def _replace(self, **changes) -> "Record":
+        """Return a copy with some fields changed."""
+        return type(self)(**dict(self._asdict(), **changes))
+    
+    def _asdict(self) -> Dict[str, Any]:
+        """Return the fields as a new dict."""
+        return {name: getattr(self, name) for name in self._fields}
+    
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+    
+    def __len__(self) -> int:
+        return len(self._fields)
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+    
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+    
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self._fields)
+    
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+
+class UserRecord(Record):
+    """A user, as returned by get_user and create_user."""
+    
+    __slots__ = _fields = ("user_id", "name", "created_at", "last_seen", "user_metadata")
+
+
+class ConversationRecord(Record):
+    """A conversation with its message counters."""
+    
+    __slots__ = _fields = ("conversation_id", "user_id", "started_at", "ended_at", "processed",
+                           "message_count", "last_message_at", "last_message_preview")
+
+
+class MessageRecord(Record):
+    """A message of a conversation history; message_id is None while it is only buffered."""
+    
+    __slots__ = _fields = ("message_id", "is_from_user", "content", "timestamp")
+
+
+class ContextMessageRecord(MessageRecord):
+    """A message of a context window, with its length in tokens."""
+    
+    __slots__ = ("token_count",)
+    _fields = MessageRecord._fields + ("token_count",)
+
+
+class KnowledgeRecord(Record):
+    """The current value of one knowledge category for a user."""
+    
+    __slots__ = _fields = ("value", "confidence", "source", "is_personal", "updated_at")
@@ -0,0 +1,187 @@
+"""In-process cache of platforms and knowledge categories.
+
+Nearly every call looks up a platform or a category by name, and both tables
+hold a few dozen rows that rarely change, so each database keeps them in
+memory (``Database.reference_cache``; the shards of a ShardRouter share the
+cache of the global database). Lookups take the session they would have
+queried with, find its Database through ``session.info`` and fall back to a
+query when there is no cache, so the same helpers work for async sessions.
+
+Writes to either table call invalidate(session). That bumps a process-wide
+version once the transaction commits, and every cache reloads on its next
+use; until then the writing session bypasses the cache, so it sees its own
+uncommitted rows. Caches are reloaded from committed data only. Rows added
+by other processes are still found, because names missing from the cache
+are looked up in the database; other changes are picked up after
+``MAX_AGE`` seconds.
+"""
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .models import KnowledgeCategory, Platform
+
+MAX_AGE = 60.0
+
+CategoryInfo = namedtuple("CategoryInfo", "category_id category_name data_type is_personal")
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+def version() -> int:
+    """Return the current reference-data version; it changes with every committed write."""
+    return _version
+
+
+def _committed(session: Session) -> None:
+    """after_commit hook of a session that changed platforms or categories."""
+    global _version
+    session.info.pop("reference_dirty", None)
+    with _version_lock:
+        _version += 1
+
+
+class ReferenceCache:
+    """Name lookups of the platforms and categories of one database file."""
+    
+    def __init__(self, database, max_age: float = MAX_AGE):
+        """Cache the reference tables of database, reloading at least every max_age seconds."""
+        self.database = database
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = 0.0
+        self._platforms: Dict[str, int] = {}
+        self._categories: Dict[str, CategoryInfo] = {}
+    
+    def platform_id(self, platform_name: str) -> Optional[int]:
+        """Return the ID of a platform, or None if it is not cached."""
+        return self._platforms.get(platform_name) if self._fresh() else None
+    
+    def category(self, category_name: str) -> Optional[CategoryInfo]:
+        """Return a category, or None if it is not cached."""
+        return self._categories.get(category_name) if self._fresh() else None
+    
+    def categories(self) -> Optional[List[CategoryInfo]]:
+        """Return every category in ID order, or None if the tables could not be read."""
+        return list(self._categories.values()) if self._fresh() else None
+    
+    def expire(self) -> None:
+        """Reload on the next lookup."""
+        self._version = None
+    
+    def _fresh(self) -> bool:
+        """Make sure the cached rows are current; return False if they could not be loaded."""
+        if self._version == _version and time.monotonic() - self._loaded_at < self.max_age:
+            return True
+        with self._lock:
+            version = _version
+            if self._version == version and time.monotonic() - self._loaded_at < self.max_age:
+                return True
+            # A session of its own, never the caller's, so uncommitted rows stay out
+            session = self.database.ReadSession()
+            try:
+                platforms = dict(session.query(Platform.platform_name, Platform.platform_id))
+                categories = {
+                    row.category_name: CategoryInfo(row.category_id, row.category_name, row.data_type,
+                                                    row.is_personal)
+                    for row in session.query(KnowledgeCategory).order_by(KnowledgeCategory.category_id)
+                }
+            except OperationalError:
+                # Tables not created yet
+                return False
+            finally:
+                session.close()
+            self._platforms, self._categories = platforms, categories
+            self._loaded_at = time.monotonic()
+            self._version = version
+            return True
+
+
+def _cache(session: Session) -> Optional[ReferenceCache]:
+    """Return the cache to use for a session, or None to query instead."""
+    if session.info.get("reference_dirty"):
+        return None
+    database = session.info.get("database")
+    return database.reference_cache if database is not None else None
+
+
+def invalidate(session: Session) -> None:
+    """Record that session changed platforms or categories.
+    
+    Every cache reloads once the session commits; the session itself stops
+    using the cache so it sees its own changes.
+    """
+    if not session.info.get("reference_dirty"):
+        session.info["reference_dirty"] = True
+        event.listen(session, "after_commit", _committed, once=True)
+
+
+@contextmanager
+def writer(session: Session) -> Iterator[Session]:
+    """Provide the session to write platforms, categories and platform identities with.
+    
+    That is session itself, unless its database keeps those tables in an
+    attached file, as the shards of a ShardRouter do. Writing them through
+    the attachment would take the global file's lock halfway through the
+    shard's transaction, and SQLite fails such a write at once with
+    "database is locked" while another shard holds that lock. Instead they
+    are written in a transaction of the global database, which queues for
+    its writer and retries like any other session, and commits on its own
+    when the block exits.
+    """
+    database = session.info.get("database")
+    reference = database.reference if database is not None else None
+    if reference is None or reference is database:
+        yield session
+        return
+    with reference.session() as reference_session:
+        yield reference_session
+
+
+def platform_id(session: Session, platform_name: str) -> Optional[int]:
+    """Return the ID of a platform by name, or None if there is none."""
+    cache = _cache(session)
+    if cache is not None:
+        cached = cache.platform_id(platform_name)
+        if cached is not None:
+            return cached
+    
+    found = session.query(Platform.platform_id).filter_by(platform_name=platform_name).scalar()
+    if found is not None and cache is not None:
+        # Created by another process since the cache was loaded
+        cache.expire()
+    return found
+
+
+def category(session: Session, category_name: str) -> Optional[CategoryInfo]:
+    """Return a knowledge category by name, or None if there is none."""
+    cache = _cache(session)
+    if cache is not None:
+        cached = cache.category(category_name)
+        if cached is not None:
+            return cached
+    
+    row = session.query(KnowledgeCategory).filter_by(category_name=category_name).first()
+    if row is None:
+        return None
+    if cache is not None:
+        cache.expire()
+    return CategoryInfo(row.category_id, row.category_name, row.data_type, row.is_personal)
+
+
+def categories(session: Session) -> List[CategoryInfo]:
+    """Return every knowledge category in ID order."""
+    cache = _cache(session)
+    cached = cache.categories() if cache is not None else None
+    if cached is not None:
+        return cached
+    return [CategoryInfo(row.category_id, row.category_name, row.data_type, row.is_personal)
+            for row in session.query(KnowledgeCategory).order_by(KnowledgeCategory.category_id)]
@@ -0,0 +1,140 @@
+"""Horizontal sharding of users across several SQLite files."""
+import json
+import os
+import uuid
+import zlib
+from typing import List, Optional
+
+from .db import Database, DEFAULT_PROFILE, RetryPolicy
+from .models import (
+    User, Platform, UserPlatform,
+    KnowledgeCategory, UserKnowledge,
+    Conversation, Message, ExtractionJob, CompressionDictionary,
+    Embedding, EmbeddingCell
+)
+
+# Shared reference data, kept once in the global database
+GLOBAL_TABLES = [Platform.__table__, KnowledgeCategory.__table__, UserPlatform.__table__,
+                 CompressionDictionary.__table__]
+
+# Per-user data, spread over the shards
+SHARD_TABLES = [User.__table__, UserKnowledge.__table__, Conversation.__table__,
+                Message.__table__, ExtractionJob.__table__, Embedding.__table__,
+                EmbeddingCell.__table__]
+
+# Alias under which every shard attaches the global database
+GLOBAL_ALIAS = "global_db"
+
+LAYOUT_FILE = "shards.json"
+
+
+class ShardRouter:
+    """Routes user-scoped data to one of several database files.
+    
+    A directory holds ``global.db`` with platforms, categories and the
+    platform-to-user mapping, plus ``shard_NNN.db`` files with users and
+    everything that belongs to them. A user lives in the shard picked by a
+    hash of their user_id and their conversations live with them, so writes
+    for users on different shards run in parallel, each shard having its
+    own writer connection.
+    
+    Every shard attaches the global database, so queries that join user data
+    with categories or platforms work unchanged. Writes to the global tables
+    do not go through that attachment but through the global database's own
+    writer (see reference_cache.writer), so every transaction commits in a
+    single file. Conversation IDs are minted
+    so that they hash to their user's shard (see new_conversation_id), which
+    lets calls that only know a conversation ID find it without a lookup.
+    
+    The router offers the same routing calls as a plain Database, so
+    CallistoAPI and the managers accept either.
+    """
+    
+    def __init__(self, directory: str, shard_count: int = 4, profile: str = DEFAULT_PROFILE,
+                 retry_policy: RetryPolicy = None):
+        """Open (or create) a sharded store in directory."""
+        if shard_count < 1:
+            raise ValueError("Invalid shard count: must be at least 1")
+        
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._check_layout(shard_count)
+        
+        global_path = os.path.join(directory, "global.db")
+        self.reference = Database(global_path, profile, retry_policy, tables=GLOBAL_TABLES)
+        self.shards: List[Database] = [
+            Database(os.path.join(directory, f"shard_{i:03d}.db"), profile, retry_policy,
+                     tables=SHARD_TABLES, attach={GLOBAL_ALIAS: global_path}, reference=self.reference)
+            for i in range(shard_count)
+        ]
+        # Platforms, categories and platform identities live in the global database only
+        for shard in self.shards:
+            shard.reference_cache = self.reference.reference_cache
+            shard.identity_cache = self.reference.identity_cache
+    
+    def _check_layout(self, shard_count: int) -> None:
+        """Refuse to reopen a store with a different number of shards."""
+        path = os.path.join(self.directory, LAYOUT_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                existing = json.load(f)["shard_count"]
+            if existing != shard_count:
+                raise ValueError(f"Invalid shard count: {self.directory} was created with {existing} shards")
+        else:
+            with open(path, "w") as f:
+                json.dump({"shard_count": shard_count}, f)
+    
+    # ROUTING
+    
+    def shard_index(self, key: str) -> int:
+        """Return the shard number for a user or conversation ID."""
+        # crc32 rather than hash(): it must be stable across processes
+        return zlib.crc32(key.encode()) % len(self.shards)
+    
+    def for_user(self, user_id: Optional[str]) -> Database:
+        """Return the shard holding a user's data."""
+        if not user_id:
+            raise ValueError("Invalid user ID: a sharded database needs one to route the call")
+        return self.shards[self.shard_index(user_id)]
+    
+    def for_conversation(self, conversation_id: Optional[str]) -> Database:
+        """Return the shard holding a conversation."""
+        if not conversation_id:
+            raise ValueError("Invalid conversation ID: a sharded database needs one to route the call")
+        return self.shards[self.shard_index(conversation_id)]
+    
+    def new_conversation_id(self, user_id: str) -> str:
+        """Return a new random conversation ID that routes to the user's shard."""
+        target = self.shard_index(user_id)
+        while True:
+            conversation_id = str(uuid.uuid4())
+            if self.shard_index(conversation_id) == target:
+                return conversation_id
+    
+    # LIFECYCLE
+    
+    def init_db(self) -> None:
+        """Create the schema in the global database and every shard."""
+        self.reference.init_db()
+        for shard in self.shards:
+            shard.init_db()
+    
+    def init_default_data(self) -> None:
+        """Initialize default platforms and categories in the global database."""
+        self.reference.init_default_data()
+    
+    def open_archive(self, **options) -> None:
+        """Open a cold-storage archive next to every shard (see Database.open_archive)."""
+        for shard in self.shards:
+            shard.open_archive(**options)
+    
+    def start_archiver(self, **options) -> None:
+        """Archive old conversations on every shard in the background."""
+        for shard in self.shards:
+            shard.start_archiver(**options)
+    
+    def dispose(self) -> None:
+        """Close all pooled connections."""
+        for shard in self.shards:
+            shard.dispose()
+        self.reference.dispose()
@@ -0,0 +1,168 @@
+"""Tests for moving old conversations to cold storage."""
+import os
+import tempfile
+import time
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.archive import ArchivedConversation, decode_block, encode_block
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.models import Conversation, Message
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    database = Database(os.path.join(directory, "callisto.db"))
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+def old_conversation(db, api, user_id, messages, days_ago=60):
+    """Store a conversation that ended the given number of days ago."""
+    started = int(time.time()) - days_ago * 86400
+    conversation_id = api.store_conversation(user_id, "discord", [
+        {"content": content, "is_from_user": i % 2 == 0, "timestamp": started + i}
+        for i, content in enumerate(messages)
+    ])
+    with db.session() as session:
+        session.query(Conversation).filter_by(conversation_id=conversation_id).update(
+            {Conversation.ended_at: started + len(messages)})
+    return conversation_id
+
+class TestArchive:
+    """Test archiving, transparent reads and background operation."""
+    
+    def test_block_round_trip(self):
+        """Test that message blocks decode to what was encoded."""
+        messages = [{"message_id": 1, "is_from_user": True, "content": "héllo " * 50, "timestamp": 10}]
+        block = encode_block(messages)
+        assert decode_block(block) == messages
+        assert len(block) < len(messages[0]["content"])
+    
+    def test_archives_only_old_ended_conversations(self, db, api):
+        """Test that recent and ongoing conversations stay in the hot table."""
+        user = api.create_user("Alice", "discord", "alice")
+        old_id = old_conversation(db, api, user.user_id, ["one", "two", "three"])
+        recent_id = old_conversation(db, api, user.user_id, ["recent"], days_ago=1)
+        live_id = api.start_conversation(user.user_id, "discord")
+        api.add_message(live_id, "still talking", True)
+        
+        archive = db.open_archive(min_age=30 * 86400)
+        assert archive.run_once() == 1
+        assert archive.run_once() == 0
+        
+        with db.read_session() as session:
+            assert session.query(Message).filter_by(conversation_id=old_id).count() == 0
+            assert session.query(Message).filter_by(conversation_id=recent_id).count() == 1
+            assert session.query(Conversation).get(old_id).archived_at is not None
+        with archive.store.read_session() as session:
+            assert session.query(ArchivedConversation).count() == 1
+        
+        stats = archive.stats()
+        assert stats["conversations"] == 1
+        assert stats["messages"] == 3
+    
+    def test_reads_are_transparent(self, db, api):
+        """Test that history and conversation details include archived messages."""
+        user = api.create_user("Bob", "discord", "bob")
+        conversation_id = old_conversation(db, api, user.user_id, ["first", "second"])
+        before = api.get_conversation_history(conversation_id)
+        
+        archive = db.open_archive(batch_size=1)
+        archive.run_once()
+        
+        assert api.get_conversation_history(conversation_id) == before
+        assert api.conversations.get_conversation(conversation_id)["message_count"] == 2
+        
+        # A late message lands in the hot table and is read after the archived ones
+        api.add_message(conversation_id, "late", True)
+        history = api.get_conversation_history(conversation_id)
+        assert [m["content"] for m in history] == ["first", "second", "late"]
+        assert api.conversations.get_conversation(conversation_id)["message_count"] == 3
+    
+    def test_delete_user_purges_archive(self, db, api):
+        """Test that deleting a user also deletes their archived conversations."""
+        user = api.create_user("Carol", "discord", "carol")
+        old_conversation(db, api, user.user_id, ["secret"])
+        archive = db.open_archive()
+        archive.run_once()
+        
+        api.delete_user(user.user_id)
+        
+        with archive.store.read_session() as session:
+            assert session.query(ArchivedConversation).count() == 0
+    
+    def test_archive_opened_on_demand(self, db, api):
+        """Test that a process that never opened the archive still reads and purges it."""
+        user = api.create_user("Gwen", "discord", "gwen")
+        conversation_id = old_conversation(db, api, user.user_id, ["first", "second"])
+        db.open_archive().run_once()
+        
+        other = Database(db.db_path)
+        try:
+            other_api = CallistoAPI(other)
+            history = other_api.get_conversation_history(conversation_id)
+            assert [m["content"] for m in history] == ["first", "second"]
+            
+            other.archive.close()
+            other.archive = None
+            other_api.delete_user(user.user_id)
+            with db.archive.store.read_session() as session:
+                assert session.query(ArchivedConversation).count() == 0
+        finally:
+            other.dispose()
+    
+    def test_background_archiver(self, db, api):
+        """Test that the background archiver works through batches."""
+        user = api.create_user("Dave", "discord", "dave")
+        ids = [old_conversation(db, api, user.user_id, [f"message {i}"]) for i in range(5)]
+        
+        archive = db.start_archiver(batch_size=2, interval=0.01, pause=0)
+        deadline = time.monotonic() + 5
+        while archive.stats()["conversations"] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        db.archive.stop()
+        
+        assert archive.stats()["conversations"] == 5
+        assert api.get_conversation_history(ids[0])[0]["content"] == "message 0"
+    
+    def test_paged_and_streamed_reads(self, db, api):
+        """Test that history pages and streams span archived and hot messages."""
+        user = api.create_user("Erin", "discord", "erin")
+        conversation_id = old_conversation(db, api, user.user_id, [f"old {i}" for i in range(5)])
+        db.open_archive().run_once()
+        api.add_message(conversation_id, "late", True)
+        history = api.get_conversation_history(conversation_id)
+        
+        latest = api.get_conversation_history_page(conversation_id, limit=3)
+        assert [m["content"] for m in latest] == ["old 3", "old 4", "late"]
+        first = latest[0]
+        earlier = api.get_conversation_history_page(
+            conversation_id, limit=3, before=(first["timestamp"], first["message_id"]))
+        assert [m["content"] for m in earlier] == ["old 0", "old 1", "old 2"]
+        assert list(api.iter_conversation_history(conversation_id)) == history
+    
+    def test_context_window_reaches_into_archive(self, db, api):
+        """Test that a context window continues from hot into archived messages."""
+        user = api.create_user("Finn", "discord", "finn")
+        conversation_id = old_conversation(db, api, user.user_id, [f"old {i}" for i in range(5)])
+        db.open_archive().run_once()
+        api.add_message(conversation_id, "late", True)
+        
+        # "old N" is two tokens and "late" one
+        window = api.get_context_window(conversation_id, max_tokens=5)
+        assert [m["content"] for m in window] == ["old 3", "old 4", "late"]
+        assert [m["token_count"] for m in window] == [2, 2, 1]
@@ -0,0 +1,213 @@
+"""Tests for the asyncio Callisto API."""
+import asyncio
+import inspect
+import os
+import tempfile
+import time
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.archive import ArchivedConversation
+from callisto.async_db import AsyncDatabase
+from callisto.async_api import AsyncCallistoAPI, AsyncConversationManager
+from callisto.db import Database
+from callisto.interfaces import CallistoAPIInterface
+
+@pytest.fixture
+def db_path():
+    """Create a temporary database file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield path
+    for name in (path, os.path.splitext(path)[0] + ".archive.db"):
+        if os.path.exists(name):
+            os.unlink(name)
+
+def run(db_path, scenario):
+    """Run an async scenario against a freshly initialized API."""
+    async def main():
+        api = AsyncCallistoAPI(AsyncDatabase(db_path))
+        await api.initialize()
+        try:
+            return await scenario(api)
+        finally:
+            await api.db.dispose()
+    return asyncio.run(main())
+
+class TestAsyncAPI:
+    """Test the asyncio API against a real SQLite file."""
+    
+    def test_parity_with_sync_api(self):
+        """Test that every operation of the API interface is also async, taking the same arguments."""
+        for name in CallistoAPIInterface.__abstractmethods__:
+            method = getattr(AsyncCallistoAPI, name, None)
+            assert method is not None, f"AsyncCallistoAPI lacks {name}"
+            parameters = inspect.signature(getattr(CallistoAPI, name)).parameters.values()
+            assert [(p.name, p.default) for p in inspect.signature(method).parameters.values()] == [
+                (p.name, p.default) for p in parameters], name
+            if name == "iter_conversation_history":
+                assert inspect.isasyncgenfunction(AsyncConversationManager.iter_conversation_history)
+            else:
+                assert inspect.iscoroutinefunction(method), name
+    
+    def test_user_lifecycle(self, db_path):
+        """Test creating, finding and deleting a user."""
+        async def scenario(api):
+            user = await api.create_user("Async User", "discord", "asyncuser")
+            found = await api.get_user("discord", "asyncuser")
+            assert found.user_id == user.user_id
+            assert found.name == "Async User"
+            
+            await api.update_user(user.user_id, "Renamed")
+            assert (await api.get_user("discord", "asyncuser")).name == "Renamed"
+            
+            await api.delete_user(user.user_id)
+            assert await api.get_user("discord", "asyncuser") is None
+            
+            # Sessions carry their database, as sync ones do, for the writers' hooks
+            async with api.db.session() as session:
+                assert session.info["database"] is api.db
+        
+        run(db_path, scenario)
+    
+    def test_knowledge(self, db_path):
+        """Test storing and retrieving knowledge."""
+        async def scenario(api):
+            user = await api.create_user("Knower", "terminal", "knower")
+            await api.store_knowledge(user.user_id, "likes", ["tea", "cats"], 0.9)
+            await api.store_knowledge(user.user_id, "location", "Perth")
+            
+            knowledge = await api.get_user_knowledge(user.user_id)
+            assert knowledge["likes"]["value"] == ["tea", "cats"]
+            
+            public = await api.get_user_knowledge(user.user_id, include_personal=False)
+            assert "location" not in public
+            
+            await api.delete_knowledge(user.user_id, "likes")
+            assert "likes" not in await api.get_user_knowledge(user.user_id)
+        
+        run(db_path, scenario)
+    
+    def test_get_user_by_platform_id(self, db_path):
+        """Test finding a user by the platform's own ID."""
+        async def scenario(api):
+            user = await api.create_user("Reader", "discord", "reader", "4242")
+            assert (await api.get_user_by_platform_id("discord", "4242")).user_id == user.user_id
+            assert await api.get_user_by_platform_id("discord", "0000") is None
+        
+        run(db_path, scenario)
+    
+    def test_history_pages_and_stream(self, db_path):
+        """Test keyset pages and streamed history."""
+        async def scenario(api):
+            user = await api.create_user("Pager", "discord", "pager")
+            conversation_id = await api.store_conversation(user.user_id, "discord", [
+                {"content": f"message {i}", "timestamp": i} for i in range(5)])
+            history = await api.get_conversation_history(conversation_id)
+            
+            assert await api.get_conversation_history_page(conversation_id, limit=2) == history[-2:]
+            first = history[0]
+            assert await api.get_conversation_history_page(
+                conversation_id, limit=2, after=(first["timestamp"], first["message_id"])) == history[1:3]
+            assert [m async for m in api.iter_conversation_history(conversation_id, batch_size=2)] == history
+            
+            with pytest.raises(ValueError):
+                await api.get_conversation_history_page(conversation_id, limit=0)
+            with pytest.raises(ValueError):
+                api.iter_conversation_history(conversation_id, batch_size=0)
+        
+        run(db_path, scenario)
+    
+    def test_context_window(self, db_path):
+        """Test that the context window is the newest messages within the budget."""
+        async def scenario(api):
+            user = await api.create_user("Windowed", "discord", "windowed")
+            conversation_id = await api.store_conversation(user.user_id, "discord", [
+                {"content": f"message {i}", "timestamp": i} for i in range(5)])
+            
+            window = await api.get_context_window(conversation_id, max_tokens=100, max_messages=3)
+            assert [m["content"] for m in window] == ["message 2", "message 3", "message 4"]
+            assert all(m["token_count"] > 0 for m in window)
+            with pytest.raises(ValueError):
+                await api.get_context_window(conversation_id, max_tokens=0)
+        
+        run(db_path, scenario)
+    
+    def test_search_messages(self, db_path):
+        """Test full-text search over a user's messages."""
+        async def scenario(api):
+            user = await api.create_user("Searcher", "discord", "searcher")
+            await api.store_conversation(user.user_id, "discord", [
+                {"content": "the weather is nice"}, {"content": "our puppy chewed a shoe"}])
+            
+            [hit] = await api.search_messages(user.user_id, "puppy")
+            assert "[puppy]" in hit["snippet"]
+            assert await api.search_messages(user.user_id, "kitten") == []
+        
+        run(db_path, scenario)
+    
+    def test_semantic_search(self, db_path):
+        """Test that async writes are embedded and searched once semantic search is on."""
+        async def scenario(api):
+            user = await api.create_user("Seeker", "discord", "seeker")
+            await api.store_conversation(user.user_id, "discord", [{"content": "the weather is nice"}])
+            with pytest.raises(RuntimeError):
+                await api.semantic_search(user.user_id, "weather")
+            
+            await api.configure_semantic_search()
+            conversation_id = await api.start_conversation(user.user_id, "discord")
+            await api.add_message(conversation_id, "our puppy chewed a shoe", True)
+            
+            results = await api.semantic_search(user.user_id, "dog chewing shoes", k=2)
+            assert [r["content"] for r in results] == ["our puppy chewed a shoe", "the weather is nice"]
+        
+        run(db_path, scenario)
+    
+    def test_concurrent_messages(self, db_path):
+        """Test that many concurrent writes all land without lock errors."""
+        async def scenario(api):
+            user = await api.create_user("Chatty", "discord", "chatty")
+            conversation_id = await api.start_conversation(user.user_id, "discord")
+            
+            await asyncio.gather(*(
+                api.add_message(conversation_id, f"message {i}", i % 2 == 0)
+                for i in range(200)
+            ))
+            
+            history = await api.get_conversation_history(conversation_id)
+            assert len(history) == 200
+            
+            conv = await api.conversations.get_conversation(conversation_id)
+            assert conv["message_count"] == 200
+        
+        run(db_path, scenario)
+    
+    def test_archived_conversations(self, db_path):
+        """Test that history and user deletion cover messages moved to the archive."""
+        async def scenario(api):
+            user = await api.create_user("Archived", "discord", "archived")
+            conversation_id = await api.store_conversation(user.user_id, "discord", [
+                {"content": "first", "timestamp": 10}, {"content": "second", "timestamp": 20}])
+            await api.end_conversation(conversation_id)
+            
+            database = Database(db_path)
+            try:
+                archive = database.open_archive(min_age=0)
+                assert archive.run_once(now=int(time.time()) + 10) == 1
+                await api.add_message(conversation_id, "late", True)
+                
+                history = await api.get_conversation_history(conversation_id)
+                assert [m["content"] for m in history] == ["first", "second", "late"]
+                assert await api.get_conversation_history_page(conversation_id, limit=2) == history[1:]
+                assert [m async for m in api.iter_conversation_history(conversation_id, batch_size=1)] == history
+                window = await api.get_context_window(conversation_id, max_tokens=100)
+                assert [m["content"] for m in window] == ["first", "second", "late"]
+                
+                await api.delete_user(user.user_id)
+                with archive.store.read_session() as session:
+                    assert session.query(ArchivedConversation).count() == 0
+            finally:
+                database.dispose()
+        
+        run(db_path, scenario)
@@ -0,0 +1,144 @@
+"""Tests for online backup and restore."""
+import gzip
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from callisto import reference_cache
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.models import Platform
+
+@pytest.fixture
+def workdir():
+    """Create a temporary directory for database and backup files."""
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+@pytest.fixture
+def db(workdir):
+    """Create an initialized database with some rows."""
+    database = Database(os.path.join(workdir, "callisto.db"))
+    database.init_db()
+    with database.session() as session:
+        for i in range(200):
+            session.add(Platform(platform_name=f"platform-{i}-" + "x" * 200))
+    yield database
+    database.dispose()
+
+def count_platforms(path):
+    """Count platform rows in a plain database file."""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM platforms").fetchone()[0]
+    finally:
+        conn.close()
+
+class TestBackup:
+    """Test backup, compressed archives and restore."""
+    
+    def test_backup_reports_progress(self, db, workdir):
+        """Test a stepwise backup produces a complete copy and reports progress."""
+        dest = os.path.join(workdir, "backup.db")
+        steps = []
+        stats = db.backup(dest, pages_per_step=2, progress=lambda done, total: steps.append((done, total)))
+        
+        assert count_platforms(dest) == 200
+        assert len(steps) > 1
+        assert steps[-1][0] == steps[-1][1] == stats["pages"]
+        assert stats["bytes"] > 0 and stats["seconds"] >= 0
+    
+    def test_backup_during_writes(self, db, workdir):
+        """Test that writers keep going while a backup runs."""
+        dest = os.path.join(workdir, "backup.db")
+        stop = threading.Event()
+        written = []
+        
+        def writer():
+            while not stop.is_set():
+                with db.session() as session:
+                    session.add(Platform(platform_name=f"live-{len(written)}"))
+                written.append(1)
+        
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            db.backup(dest, pages_per_step=1, sleep=0.001)
+        finally:
+            stop.set()
+            thread.join()
+        
+        assert written
+        assert 200 <= count_platforms(dest) <= 200 + len(written)
+        conn = sqlite3.connect(dest)
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        conn.close()
+    
+    def test_compressed_round_trip(self, db, workdir):
+        """Test restoring a compressed backup over changed data."""
+        archive = os.path.join(workdir, "backup.db.gz")
+        stats = db.backup(archive, compress=True)
+        with gzip.open(archive) as f:
+            assert f.read(16) == b"SQLite format 3\x00"
+        assert stats["compressed_bytes"] < stats["bytes"]
+        
+        with db.session() as session:
+            session.query(Platform).delete()
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 0
+        
+        db.restore(archive)
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 200
+        with db.session() as session:
+            session.add(Platform(platform_name="after-restore"))
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 201
+    
+    def test_restore_rejects_invalid_files(self, db, workdir):
+        """Test that missing or non-database files are rejected."""
+        with pytest.raises(ValueError):
+            db.restore(os.path.join(workdir, "missing.db"))
+        
+        junk = os.path.join(workdir, "junk.db")
+        with open(junk, "wb") as f:
+            f.write(b"not a database" * 100)
+        with pytest.raises(ValueError):
+            db.restore(junk)
+        with pytest.raises(ValueError):
+            db.backup(os.path.join(workdir, "x.db"), pages_per_step=0)
+    
+    def test_restore_drops_cached_reads(self, db, workdir):
+        """Test that users, knowledge and categories cached before a restore are not served after it."""
+        db.init_default_data()
+        CategoryManager(db).create_default_categories()
+        api = CallistoAPI(db)
+        user = api.create_user("Alice", "discord", "alice", "1001")
+        api.store_knowledge(user.user_id, "likes", ["tea"], confidence=0.5)
+        backup = os.path.join(workdir, "backup.db")
+        db.backup(backup)
+        
+        api.update_user(user.user_id, "Alicia")
+        api.store_knowledge(user.user_id, "likes", ["coffee"])
+        api.create_user("Bob", "discord", "bob")
+        api.categories.create_category("hobbies", "list")
+        # Warm the caches with the data about to be replaced
+        assert api.get_user("discord", "alice").name == "Alicia"
+        assert api.get_user_by_platform_id("discord", "1001").name == "Alicia"
+        assert api.get_user("discord", "bob") is not None
+        assert api.get_user_knowledge(user.user_id)["likes"].value == ["coffee"]
+        with db.read_session() as session:
+            assert reference_cache.category(session, "hobbies") is not None
+        
+        db.restore(backup)
+        
+        assert api.get_user("discord", "alice").name == "Alice"
+        assert api.get_user_by_platform_id("discord", "1001").name == "Alice"
+        assert api.get_user("discord", "bob") is None
+        assert api.get_user_knowledge(user.user_id)["likes"].value == ["tea"]
+        with db.read_session() as session:
+            assert reference_cache.category(session, "hobbies") is None
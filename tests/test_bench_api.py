@@ -0,0 +1,32 @@
+"""Smoke test for the API benchmark suite."""
+import json
+import os
+import tempfile
+
+import pytest
+
+from callisto.benchmarks import bench_api
+
+@pytest.fixture
+def tmpdir_path():
+    """Create a temporary directory for the database and report."""
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+class TestBenchApi:
+    """Test that the benchmark runs end to end."""
+    
+    def test_tiny_run_with_default_counts(self, tmpdir_path):
+        """Test that every operation survives a default run at the smallest scale."""
+        output = os.path.join(tmpdir_path, "bench.json")
+        report = bench_api.main(["--scale", "tiny", "--db", os.path.join(tmpdir_path, "callisto.db"),
+                                 "--output", output])
+        
+        assert set(report["results"]) == {"create_user", "get_user", "store_knowledge", "batch_store_knowledge",
+                                          "get_user_knowledge", "store_conversation", "add_message",
+                                          "get_conversation_history", "get_context_window",
+                                          "get_recent_conversations", "search_messages", "merge_knowledge",
+                                          "delete_user"}
+        assert all(result["iterations"] == 1000 for result in report["results"].values())
+        with open(output) as f:
+            assert json.load(f)["results"].keys() == report["results"].keys()
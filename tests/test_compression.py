@@ -0,0 +1,142 @@
+"""Tests for transparent message content compression."""
+import os
+import random
+import tempfile
+
+import pytest
+
+from callisto import compression
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.compression import RecompressionJob, decode, encode, train_dictionary
+from callisto.db import Database
+
+WORDS = "hello there how are you doing today I was thinking about the weekend plans with friends".split()
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database = Database(path)
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+def chat_lines(count, seed=1):
+    """Return short, repetitive chat-like messages."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 20))) for _ in range(count)]
+
+def raw_contents(db):
+    """Return message content as stored, without decoding."""
+    with db.engine.connect() as conn:
+        return [row[0] for row in conn.exec_driver_sql("SELECT content FROM messages ORDER BY message_id")]
+
+class TestCompression:
+    """Test the codec, trained dictionaries and recompression."""
+    
+    def test_codec_round_trip(self):
+        """Test that short text stays plain and long text is compressed."""
+        assert encode("short") == "short"
+        long_text = "la " * 200
+        stored = encode(long_text)
+        assert isinstance(stored, bytes) and stored[0] == compression.FORMAT_ZLIB
+        assert decode(stored) == long_text
+        assert decode("plain") == "plain"
+        
+        with pytest.raises(ValueError):
+            decode(b"\x7fgarbage")
+    
+    def test_dictionary_compresses_short_messages(self, db, api):
+        """Test that messages written after training use the dictionary."""
+        user = api.create_user("Alice", "discord", "alice")
+        lines = chat_lines(200)
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in lines])
+        assert all(isinstance(value, str) for value in raw_contents(db))
+        
+        dictionary_id = train_dictionary(db)
+        assert db.dictionary_id == dictionary_id
+        
+        new_lines = chat_lines(50, seed=2)
+        conversation_id = api.store_conversation(user.user_id, "discord", [{"content": line} for line in new_lines])
+        
+        stored = raw_contents(db)[len(lines):]
+        assert all(isinstance(value, bytes) and value[0] == compression.FORMAT_ZLIB_DICT for value in stored)
+        assert sum(map(len, stored)) < sum(len(line) for line in new_lines) / 2
+        assert [m["content"] for m in api.get_conversation_history(conversation_id)] == new_lines
+    
+    def test_dictionary_survives_reopen(self, db, api):
+        """Test that a reopened database loads its dictionary again."""
+        user = api.create_user("Bob", "discord", "bob")
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in chat_lines(100)])
+        dictionary_id = train_dictionary(db)
+        
+        reopened = Database(db.db_path)
+        assert reopened.dictionary_id == dictionary_id
+        reopened.dispose()
+    
+    def test_restore_switches_to_the_backup_dictionaries(self, db, api):
+        """Test that restoring a backup taken before training stops using the dictionary."""
+        user = api.create_user("Erin", "discord", "erin")
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in chat_lines(100)])
+        backup_path = db.db_path + ".bak"
+        db.backup(backup_path)
+        try:
+            train_dictionary(db)
+            db.restore(backup_path)
+        finally:
+            os.unlink(backup_path)
+        assert db.dictionary_id is None
+        
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in chat_lines(10, seed=3)])
+        assert all(isinstance(value, str) for value in raw_contents(db))
+    
+    def test_other_databases_do_not_use_dictionary(self, db, api):
+        """Test that a dictionary is only used for the database that stores it."""
+        user = api.create_user("Carol", "discord", "carol")
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in chat_lines(100)])
+        train_dictionary(db)
+        
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        other = Database(path)
+        other.init_db()
+        other.init_default_data()
+        try:
+            other_api = CallistoAPI(other)
+            other_user = other_api.create_user("Dan", "discord", "dan")
+            other_api.store_conversation(other_user.user_id, "discord", [{"content": chat_lines(1)[0]}])
+            assert all(isinstance(value, str) for value in raw_contents(other))
+        finally:
+            other.dispose()
+            os.unlink(path)
+    
+    def test_recompression_job(self, db, api):
+        """Test that old plain rows are rewritten with the current dictionary."""
+        user = api.create_user("Erin", "discord", "erin")
+        lines = chat_lines(300)
+        conversation_id = api.store_conversation(user.user_id, "discord", [{"content": line} for line in lines])
+        train_dictionary(db)
+        
+        job = RecompressionJob(db, batch_size=64, pause=0)
+        stats = job.run_once()
+        
+        assert stats["scanned"] == 300
+        assert stats["rewritten"] == 300
+        assert stats["bytes_after"] < stats["bytes_before"] / 2
+        assert all(isinstance(value, bytes) for value in raw_contents(db))
+        assert [m["content"] for m in api.get_conversation_history(conversation_id)] == lines
+        
+        # Nothing left to do on a second pass
+        assert job.run_once()["rewritten"] == 300
@@ -6,6 +6,7 @@ import time
 import uuid
 
 import callisto
+from callisto import tokens
 from callisto.models import Conversation, Message
 
 @pytest.fixture
@@ -179,4 +180,84 @@ class TestConversationManagement:
         
         filtered_ids = [conv["conversation_id"] for conv in filtered]
         assert new_conv_id in filtered_ids
-        assert old_conv_id not in filtered_ids
\ No newline at end of file
+        assert old_conv_id not in filtered_ids
+
+
+class TestHistoryPagination:
+    """Test keyset-paginated and streamed conversation history."""
+    
+    def test_pages_in_order(self, api, test_user):
+        """Test paging backwards and forwards, with several messages per second."""
+        messages = [{"content": f"message {i}", "timestamp": 1000 + i // 3} for i in range(10)]
+        conversation_id = api.store_conversation(test_user.user_id, "terminal", messages)
+        history = api.get_conversation_history(conversation_id)
+        assert [m["content"] for m in history] == [m["content"] for m in messages]
+        
+        latest = api.get_conversation_history_page(conversation_id, limit=4)
+        assert latest == history[6:]
+        
+        first = latest[0]
+        previous = api.get_conversation_history_page(
+            conversation_id, limit=4, before=(first["timestamp"], first["message_id"]))
+        assert previous == history[2:6]
+        
+        last = previous[-1]
+        assert api.get_conversation_history_page(
+            conversation_id, limit=4, after=(last["timestamp"], last["message_id"])) == latest
+        assert api.get_conversation_history_page(conversation_id, before=(1000, history[0]["message_id"])) == []
+        
+        with pytest.raises(ValueError):
+            api.get_conversation_history_page(conversation_id, limit=0)
+        with pytest.raises(ValueError):
+            api.get_conversation_history_page(conversation_id, before=(1000,))
+    
+    def test_iter_history(self, api, test_user):
+        """Test that streaming yields the same messages as a full read."""
+        messages = [{"content": f"line {i}", "timestamp": 2000 + i // 5} for i in range(25)]
+        conversation_id = api.store_conversation(test_user.user_id, "terminal", messages)
+        
+        streamed = api.iter_conversation_history(conversation_id, batch_size=4)
+        assert list(streamed) == api.get_conversation_history(conversation_id)
+        
+        with pytest.raises(ValueError):
+            api.iter_conversation_history("not-a-uuid")
+
+class TestContextWindow:
+    """Test token-budgeted context windows."""
+    
+    def test_window_fits_budget(self, api, test_user):
+        """Test that the window is the newest messages that fit, oldest first."""
+        # Three tokens each with the default tokenizer
+        messages = [{"content": f"hello number {i}", "timestamp": 1000 + i // 2} for i in range(10)]
+        conversation_id = api.store_conversation(test_user.user_id, "terminal", messages)
+        history = api.get_conversation_history(conversation_id)
+        
+        window = api.get_context_window(conversation_id, max_tokens=10)
+        assert [m["content"] for m in window] == [m["content"] for m in history[7:]]
+        assert all(m["token_count"] == 3 for m in window)
+        
+        assert len(api.get_context_window(conversation_id, max_tokens=1000)) == 10
+        assert len(api.get_context_window(conversation_id, max_tokens=1000, max_messages=4)) == 4
+        assert api.get_context_window(conversation_id, max_tokens=2) == []
+        with pytest.raises(ValueError):
+            api.get_context_window(conversation_id, max_tokens=0)
+    
+    def test_window_stops_at_first_overflow(self, api, test_user):
+        """Test that a long message ends the window even if older ones would fit."""
+        conversation_id = api.store_conversation(test_user.user_id, "terminal", [
+            {"content": "short", "timestamp": 1},
+            {"content": " ".join(["word"] * 50), "timestamp": 2},
+            {"content": "latest", "timestamp": 3},
+        ])
+        
+        assert [m["content"] for m in api.get_context_window(conversation_id, max_tokens=10)] == ["latest"]
+    
+    def test_custom_tokenizer(self, api, test_user):
+        """Test that a plugged-in tokenizer sets the counts of new messages."""
+        tokens.set_tokenizer(len)
+        try:
+            conversation_id = api.store_conversation(test_user.user_id, "terminal", [{"content": "abcdef"}])
+        finally:
+            tokens.set_tokenizer(None)
+        
+        assert api.get_context_window(conversation_id, max_tokens=100)[0]["token_count"] == 6
@@ -0,0 +1,114 @@
+"""Tests for the message counters kept on conversations."""
+import os
+import tempfile
+import time
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.counters import PREVIEW_LENGTH, CounterRepairJob, message_preview
+from callisto.db import Database
+from callisto.models import Conversation
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    database = Database(os.path.join(directory, "callisto.db"))
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+def corrupt(db, conversation_id):
+    """Overwrite a conversation's counters with wrong values."""
+    with db.session() as session:
+        session.query(Conversation).filter_by(conversation_id=conversation_id).update({
+            Conversation.message_count: 99,
+            Conversation.last_message_at: None,
+            Conversation.last_message_preview: "stale"
+        })
+
+class TestCounters:
+    """Test maintaining, returning and repairing conversation counters."""
+    
+    def test_preview(self):
+        """Test that long messages are cut without splitting an HTML entity."""
+        assert message_preview("short") == "short"
+        preview = message_preview("a" * (PREVIEW_LENGTH - 3) + "&amp;" + "b" * 50)
+        assert preview == "a" * (PREVIEW_LENGTH - 3) + "…"
+        assert len(message_preview("x" * 500)) == PREVIEW_LENGTH
+    
+    def test_counters_follow_writes(self, api):
+        """Test that store_conversation and add_message keep the counters current."""
+        user = api.create_user("Alice", "discord", "alice")
+        conversation_id = api.store_conversation(user.user_id, "discord", [
+            {"content": "first", "timestamp": 100},
+            {"content": "second", "timestamp": 200},
+            {"content": "third", "timestamp": 200},
+        ])
+        conversation = api.conversations.get_conversation(conversation_id)
+        assert conversation["message_count"] == 3
+        assert conversation["last_message_at"] == 200
+        assert conversation["last_message_preview"] == "third"
+        
+        api.add_message(conversation_id, "late but backdated", True)
+        with api.db.session() as session:
+            # An older message counts but does not become the latest
+            api._add_message(session, conversation_id, "old", True, timestamp=50)
+        
+        conversation = api.conversations.get_conversation(conversation_id)
+        assert conversation["message_count"] == 5
+        assert conversation["last_message_preview"] == "late but backdated"
+        
+        empty_id = api.start_conversation(user.user_id, "discord")
+        assert api.conversations.get_conversation(empty_id)["message_count"] == 0
+    
+    def test_recent_conversations_include_counters(self, api):
+        """Test that listing conversations returns the counters."""
+        user = api.create_user("Bob", "discord", "bob")
+        api.store_conversation(user.user_id, "discord", [{"content": "hello <b>there</b>", "timestamp": 10}])
+        
+        [conversation] = api.get_recent_conversations(user.user_id)
+        assert conversation["message_count"] == 1
+        assert conversation["last_message_at"] == 10
+        assert conversation["last_message_preview"] == "hello &lt;b&gt;there&lt;/b&gt;"
+    
+    def test_repair_job(self, db, api):
+        """Test that the repair job recomputes wrong counters, archived ones included."""
+        user = api.create_user("Carol", "discord", "carol")
+        started = int(time.time()) - 60 * 86400
+        ids = [api.store_conversation(user.user_id, "discord", [
+            {"content": f"message {i}", "timestamp": started + i} for i in range(n)
+        ]) for n in (1, 2, 3)]
+        with db.session() as session:
+            session.query(Conversation).update({Conversation.ended_at: started + 10})
+        archive = db.open_archive()
+        archive.archive_batch(int(time.time()))
+        api.add_message(ids[2], "after archiving", True)
+        expected = [api.conversations.get_conversation(i) for i in ids]
+        
+        for conversation_id in ids:
+            corrupt(db, conversation_id)
+        stats = CounterRepairJob(db, batch_size=2, pause=0).run_once()
+        
+        assert stats == {"scanned": 3, "repaired": 3, "last_error": None}
+        assert [api.conversations.get_conversation(i) for i in ids] == expected
+        assert expected[2]["message_count"] == 4
+        assert expected[2]["last_message_preview"] == "after archiving"
+        
+        # Without the archive, archived conversations are left alone
+        db.archive.close()
+        db.archive = None
+        corrupt(db, ids[0])
+        assert CounterRepairJob(db, pause=0).run_once()["repaired"] == 0
@@ -0,0 +1,107 @@
+"""Tests for the synthetic dataset generator and snapshots."""
+import os
+import tempfile
+from collections import Counter
+
+import pytest
+from sqlalchemy import text
+
+from callisto.benchmarks import dataset
+from callisto.counters import repair_counters
+from callisto.db import Database
+
+def make_db(path):
+    """Open and initialize a database at path."""
+    database = Database(path)
+    database.init_db()
+    database.init_default_data()
+    return database
+
+@pytest.fixture
+def tmpdir_path():
+    """Create a temporary directory for database files."""
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+def dump(database, table):
+    """Return every row of a table in primary-key order."""
+    with database.engine.connect() as conn:
+        return conn.execute(text(f"SELECT * FROM {table} ORDER BY 1")).fetchall()
+
+class TestDataset:
+    """Test generation, determinism and snapshot round trips."""
+    
+    def test_generate_counts(self, tmpdir_path):
+        """Test that generated totals land near the requested sizes."""
+        database = make_db(os.path.join(tmpdir_path, "a.db"))
+        counts = dataset.generate(database, users=200, knowledge=1000, messages=5000, seed=1)
+        
+        assert counts["users"] == 200
+        assert len(dump(database, "users")) == 200
+        assert 800 <= counts["user_knowledge"] <= 1200
+        assert 4500 <= counts["messages"] <= 5500
+        assert counts["messages"] == len(dump(database, "messages"))
+        
+        # Conversation counters agree with the messages, as if written through the API
+        with database.engine.begin() as conn:
+            _, scanned, repaired = repair_counters(conn, batch_size=counts["conversations"])
+        assert scanned == counts["conversations"]
+        assert repaired == 0
+        database.dispose()
+    
+    def test_same_seed_same_rows(self, tmpdir_path):
+        """Test that a seed fully determines the generated data."""
+        first = make_db(os.path.join(tmpdir_path, "a.db"))
+        second = make_db(os.path.join(tmpdir_path, "b.db"))
+        dataset.generate(first, users=50, knowledge=200, messages=1000, seed=7)
+        dataset.generate(second, users=50, knowledge=200, messages=1000, seed=7)
+        
+        for table in ("users", "user_platforms", "user_knowledge", "conversations", "messages"):
+            assert dump(first, table) == dump(second, table)
+        first.dispose()
+        second.dispose()
+    
+    def test_heavy_tailed_activity(self, tmpdir_path):
+        """Test that a few users account for a large share of messages."""
+        database = make_db(os.path.join(tmpdir_path, "a.db"))
+        dataset.generate(database, users=500, knowledge=500, messages=20000, seed=3)
+        
+        with database.engine.connect() as conn:
+            per_user = Counter(dict(conn.execute(text(
+                "SELECT c.user_id, COUNT(*) FROM messages m "
+                "JOIN conversations c ON c.conversation_id = m.conversation_id GROUP BY c.user_id"
+            )).fetchall()))
+        top = sum(count for _, count in per_user.most_common(50))
+        assert top > 0.3 * sum(per_user.values())
+        
+        with database.engine.connect() as conn:
+            types = {row[0] for row in conn.execute(text(
+                "SELECT DISTINCT kc.data_type FROM user_knowledge uk "
+                "JOIN knowledge_categories kc ON kc.category_id = uk.category_id"
+            ))}
+        assert {"list", "string"} <= types
+        database.dispose()
+    
+    def test_snapshot_round_trip(self, tmpdir_path):
+        """Test that a restored snapshot matches the original database."""
+        source = make_db(os.path.join(tmpdir_path, "a.db"))
+        dataset.generate(source, users=50, knowledge=200, messages=1000, seed=5)
+        snapshot = os.path.join(tmpdir_path, "data.snapshot.gz")
+        dataset.save_snapshot(source, snapshot)
+        
+        restored_path = os.path.join(tmpdir_path, "restored.db")
+        dataset.restore_snapshot(snapshot, restored_path)
+        restored = Database(restored_path)
+        
+        assert dump(restored, "messages") == dump(source, "messages")
+        assert dataset.fixture_ids(restored) == dataset.fixture_ids(source)
+        source.dispose()
+        restored.dispose()
+    
+    def test_requires_platforms(self, tmpdir_path):
+        """Test that generating into an empty schema is rejected."""
+        database = Database(os.path.join(tmpdir_path, "a.db"))
+        database.init_db()
+        with pytest.raises(ValueError):
+            dataset.generate(database, users=10, knowledge=10, messages=10)
+        database.dispose()
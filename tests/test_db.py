@@ -1,12 +1,20 @@
 """Tests for database initialization and connection."""
 import os
 import pytest
+import shutil
+import sqlite3
+import subprocess
+import sys
 import tempfile
+import threading
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm import Session
 
 import callisto
-from callisto.db import Database
+from callisto.db import Database, RetryPolicy, STORAGE_PROFILES
+from callisto.metrics import metrics
 from callisto.models import Base, Platform, KnowledgeCategory
 
 class TestDatabase:
@@ -35,6 +43,26 @@ class TestDatabase:
         default_path = os.path.join(home_dir, ".jupiter", "callisto.db")
         assert os.path.exists(default_path)
     
+    def test_import_opens_nothing(self):
+        """Test that importing the package leaves the default database alone."""
+        home = tempfile.mkdtemp()
+        env = dict(os.environ, HOME=home, PYTHONPATH=os.pathsep.join(sys.path))
+        try:
+            subprocess.run([sys.executable, "-c", "import callisto"], env=env, check=True)
+            assert not os.path.exists(os.path.join(home, ".jupiter", "callisto.db"))
+        finally:
+            shutil.rmtree(home)
+    
+    def test_lazy_database_opens_on_first_session(self, temp_db_path):
+        """Test that a lazy database is opened by its first session."""
+        os.unlink(temp_db_path)
+        db = Database(temp_db_path, lazy=True)
+        assert not os.path.exists(temp_db_path)
+        
+        with db.read_session() as session:
+            assert session.execute(text("SELECT 1")).scalar() == 1
+        assert os.path.exists(temp_db_path)
+    
     def test_session_context(self, temp_db_path):
         """Test session context manager."""
         db = Database(temp_db_path)
@@ -91,6 +119,231 @@ class TestDatabase:
             assert platform is not None
             assert platform.platform_name == "test_platform"
     
+    def test_default_profile_uses_wal(self, temp_db_path):
+        """Test that the default profile switches the database to WAL."""
+        db = Database(temp_db_path)
+        assert db.profile == "balanced"
+        
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            # NORMAL == 1
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+    
+    @pytest.mark.parametrize("profile,synchronous", [
+        ("durable", 2),
+        ("balanced", 1),
+        ("throughput", 0),
+    ])
+    def test_storage_profiles(self, temp_db_path, profile, synchronous):
+        """Test that each profile applies its PRAGMAs to pooled connections."""
+        db = Database(temp_db_path, profile=profile)
+        pragmas = STORAGE_PROFILES[profile]["pragmas"]
+        
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == synchronous
+            assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == pragmas["cache_size"]
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == pragmas["busy_timeout"]
+    
+    def test_invalid_profile(self, temp_db_path):
+        """Test that unknown profiles are rejected."""
+        with pytest.raises(ValueError):
+            Database(temp_db_path, profile="reckless")
+    
+    def test_read_session_sees_committed_writes(self, temp_db_path):
+        """Test that read sessions see data committed by the writer."""
+        db = Database(temp_db_path)
+        db.init_db()
+        
+        with db.session() as session:
+            session.add(Platform(platform_name="reader_test"))
+        
+        with db.read_session() as session:
+            platform = session.query(Platform).filter_by(platform_name="reader_test").first()
+            assert platform is not None
+    
+    def test_read_session_is_read_only(self, temp_db_path):
+        """Test that read sessions reject writes."""
+        db = Database(temp_db_path)
+        db.init_db()
+        
+        with pytest.raises(OperationalError):
+            with db.read_session() as session:
+                session.add(Platform(platform_name="not_allowed"))
+                session.flush()
+        
+        with db.read_session() as session:
+            assert session.query(Platform).filter_by(platform_name="not_allowed").first() is None
+    
+    @pytest.mark.parametrize("profile", list(STORAGE_PROFILES))
+    def test_concurrent_reads(self, temp_db_path, profile):
+        """Test that many threads can read at once under every profile."""
+        db = Database(temp_db_path, profile=profile)
+        db.init_db()
+        db.init_default_data()
+        errors = []
+        
+        def read():
+            try:
+                for _ in range(30):
+                    with db.read_session() as session:
+                        assert session.query(Platform).count() == 3
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=read) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        db.dispose()
+        
+        assert errors == []
+    
+    def test_single_writer_connection(self, temp_db_path):
+        """Test that all writes share one pooled connection."""
+        db = Database(temp_db_path)
+        assert db.engine.pool.size() == 1
+        assert db.engine.pool._max_overflow == 0
+    
+    def test_transaction_commits_once(self, temp_db_path):
+        """Test that sessions opened inside a transaction share one commit."""
+        db = Database(temp_db_path)
+        db.init_db()
+        commits = []
+        event.listen(db.engine, "commit", lambda conn: commits.append(1))
+        
+        with db.transaction() as tx_session:
+            for name in ("one", "two", "three"):
+                with db.session() as session:
+                    assert session is tx_session
+                    session.add(Platform(platform_name=name))
+            
+            # Reads inside the unit of work see its pending writes
+            with db.read_session() as session:
+                assert session.query(Platform).count() == 3
+        
+        assert len(commits) == 1
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 3
+    
+    def test_transaction_rolls_back_everything(self, temp_db_path):
+        """Test that a failure anywhere in a transaction discards all of it."""
+        db = Database(temp_db_path)
+        db.init_db()
+        
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                with db.session() as session:
+                    session.add(Platform(platform_name="kept?"))
+                raise RuntimeError("boom")
+        
+        assert db.active_session() is None
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 0
+    
+    def test_execute_atomic_joins_nested_calls(self, temp_db_path):
+        """Test that database calls made by an atomic operation join it."""
+        db = Database(temp_db_path)
+        db.init_db()
+        
+        def add_two(session):
+            session.add(Platform(platform_name="outer"))
+            with db.session() as inner:
+                assert inner is session
+                inner.add(Platform(platform_name="inner"))
+            raise ValueError("abort")
+        
+        with pytest.raises(ValueError):
+            db.execute_atomic(add_two)
+        
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 0
+    
+    def hold_write_lock(self, path):
+        """Take the database write lock from a separate connection."""
+        holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        holder.execute("BEGIN IMMEDIATE")
+        return holder
+    
+    def fail_fast(self, db):
+        """Make busy writes fail immediately instead of waiting in SQLite."""
+        db.pragmas["busy_timeout"] = 0
+        db.engine.dispose()
+    
+    def test_retry_policy_backoff(self):
+        """Test exponential delays, the cap and jitter bounds."""
+        policy = RetryPolicy(attempts=5, base_delay=0.01, max_delay=0.05, jitter=False)
+        assert [policy.delay(n) for n in range(4)] == [0.01, 0.02, 0.04, 0.05]
+        
+        jittered = RetryPolicy(base_delay=0.01, max_delay=0.05)
+        assert all(0 <= jittered.delay(3) <= 0.05 for _ in range(100))
+        
+        with pytest.raises(ValueError):
+            RetryPolicy(attempts=0)
+    
+    def test_session_retries_while_locked(self, temp_db_path):
+        """Test that a write waits out another connection's lock."""
+        db = Database(temp_db_path, retry_policy=RetryPolicy(attempts=20, base_delay=0.01, max_delay=0.05))
+        db.init_db()
+        self.fail_fast(db)
+        metrics.reset()
+        
+        holder = self.hold_write_lock(temp_db_path)
+        release = threading.Timer(0.2, holder.commit)
+        release.start()
+        
+        with db.session() as session:
+            session.add(Platform(platform_name="after-lock"))
+        release.join()
+        holder.close()
+        
+        assert metrics.retry_snapshot()["retried"] > 0
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 1
+    
+    def test_session_gives_up_after_attempts(self, temp_db_path):
+        """Test that a lock outlasting every attempt raises."""
+        db = Database(temp_db_path, retry_policy=RetryPolicy(attempts=3, base_delay=0.001))
+        db.init_db()
+        self.fail_fast(db)
+        metrics.reset()
+        
+        holder = self.hold_write_lock(temp_db_path)
+        try:
+            with pytest.raises(OperationalError):
+                with db.session() as session:
+                    session.add(Platform(platform_name="never"))
+        finally:
+            holder.close()
+        
+        assert metrics.retry_snapshot() == {"retried": 2, "exhausted": 1}
+    
+    def test_execute_atomic_reruns_operation(self, temp_db_path):
+        """Test that a transient error mid-operation reruns the whole operation."""
+        db = Database(temp_db_path, retry_policy=RetryPolicy(base_delay=0.001))
+        db.init_db()
+        calls = []
+        
+        def flaky(session):
+            calls.append(1)
+            session.add(Platform(platform_name=f"try-{len(calls)}"))
+            if len(calls) == 1:
+                raise OperationalError("COMMIT", {}, sqlite3.OperationalError("database is locked"))
+            return len(calls)
+        
+        assert db.execute_atomic(flaky) == 2
+        with db.read_session() as session:
+            assert [p.platform_name for p in session.query(Platform)] == ["try-2"]
+        
+        # Other errors are not retried
+        calls.clear()
+        def broken(session):
+            calls.append(1)
+            raise OperationalError("SELECT", {}, sqlite3.OperationalError("no such table: nope"))
+        with pytest.raises(OperationalError):
+            db.execute_atomic(broken)
+        assert len(calls) == 1
+    
     def test_initialize_function(self, temp_db_path):
         """Test global initialize function."""
         db = callisto.initialize(temp_db_path)
@@ -0,0 +1,125 @@
+"""Tests for the background group-commit writer."""
+import os
+import queue
+import tempfile
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from callisto.db import Database
+from callisto.group_commit import GroupCommitWriter
+from callisto.models import Platform
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database = Database(path)
+    database.init_db()
+    yield database
+    database.engine.dispose()
+    database.read_engine.dispose()
+    if os.path.exists(path):
+        os.unlink(path)
+
+def add_platform(session, name):
+    """Write operation used by the tests."""
+    if not name:
+        raise ValueError("Name must not be empty")
+    session.add(Platform(platform_name=name))
+    return name
+
+class TestGroupCommitWriter:
+    """Test batching, acknowledgement and shutdown behaviour."""
+    
+    def test_writes_are_coalesced(self, db):
+        """Test that a burst of writes is committed in few transactions."""
+        commits = []
+        event.listen(db.engine, "commit", lambda conn: commits.append(1))
+        
+        writer = GroupCommitWriter(db, add_platform, max_batch=1000, max_delay=0.05)
+        futures = [writer.submit(f"platform_{i}") for i in range(100)]
+        assert [f.result(5) for f in futures] == [f"platform_{i}" for i in range(100)]
+        writer.close()
+        
+        with db.read_session() as session:
+            assert session.query(Platform).count() == 100
+        assert len(commits) < 10
+    
+    def test_max_batch_limits_transaction_size(self, db):
+        """Test that no transaction holds more than max_batch writes."""
+        commits = []
+        event.listen(db.engine, "commit", lambda conn: commits.append(1))
+        
+        writer = GroupCommitWriter(db, add_platform, max_batch=10, max_delay=1)
+        futures = [writer.submit(f"platform_{i}") for i in range(50)]
+        writer.flush()
+        assert all(f.done() for f in futures)
+        writer.close()
+        
+        assert len(commits) >= 5
+    
+    def test_rejected_write_does_not_fail_batch(self, db):
+        """Test that a ValueError only fails its own future."""
+        writer = GroupCommitWriter(db, add_platform, max_delay=0.05)
+        good = writer.submit("good")
+        bad = writer.submit("")
+        writer.flush()
+        writer.close()
+        
+        assert good.result() == "good"
+        with pytest.raises(ValueError):
+            bad.result()
+    
+    def test_close_flushes_queue(self, db):
+        """Test that closing commits everything still queued."""
+        writer = GroupCommitWriter(db, add_platform, max_delay=1)
+        futures = [writer.submit(f"platform_{i}") for i in range(20)]
+        writer.close()
+        
+        assert all(f.done() and f.exception() is None for f in futures)
+        with pytest.raises(RuntimeError):
+            writer.submit("late")
+        # Nothing is left to wait for, so this must not block
+        writer.flush(timeout=1)
+    
+    def test_submit_racing_close_never_hangs(self, db):
+        """Test that every submit either runs or is refused while closing."""
+        writer = GroupCommitWriter(db, add_platform, max_delay=0.01)
+        accepted = []
+        
+        def submit_many(prefix):
+            for i in range(200):
+                try:
+                    accepted.append(writer.submit(f"{prefix}_{i}"))
+                except RuntimeError:
+                    return
+        
+        threads = [threading.Thread(target=submit_many, args=(f"t{n}",)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        writer.close()
+        for thread in threads:
+            thread.join()
+        
+        assert all(f.result(1) for f in accepted)
+    
+    def test_bounded_queue_applies_backpressure(self, db):
+        """Test that submit blocks when the queue is full."""
+        release = threading.Event()
+        
+        def slow_write(session, name):
+            release.wait(5)
+            return add_platform(session, name)
+        
+        writer = GroupCommitWriter(db, slow_write, max_batch=1, max_queue=1, max_delay=0)
+        writer.submit("first")
+        writer.submit("second", timeout=1)
+        
+        with pytest.raises(queue.Full):
+            writer.submit("third", timeout=0.1)
+        
+        release.set()
+        writer.close()
@@ -0,0 +1,118 @@
+"""Tests for the cache resolving platform identities to users."""
+import os
+import tempfile
+import time
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.identity_cache import MISSING, IdentityCache
+from callisto.metrics import metrics
+from callisto.records import UserRecord
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    database = Database(os.path.join(directory, "callisto.db"))
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+class TestIdentityCache:
+    """Test cached user resolution, its invalidation and its limits."""
+    
+    def test_repeat_lookups_skip_the_database(self, api):
+        """Test that a resolved identity is answered without SQL."""
+        user = api.create_user("Alice", "discord", "alice", "1001")
+        metrics.reset()
+        
+        for _ in range(3):
+            assert api.get_user("discord", "alice").user_id == user.user_id
+            assert api.get_user_by_platform_id("discord", "1001").name == "Alice"
+        
+        stats = metrics.snapshot()
+        # Only the first call of each resolves through user_platforms and users
+        assert stats["get_user"]["statements"] == 2
+        assert stats["get_user_by_platform_id"]["statements"] == 2
+        assert metrics.cache_snapshot()["identity"] == {"hits": 4, "misses": 2, "hit_rate": 4 / 6}
+        assert 'callisto_api_cache_hits_total{cache="identity"} 4' in metrics.to_prometheus()
+    
+    def test_unknown_users_are_cached_until_created(self, api):
+        """Test that a negative result is cached and dropped when the user appears."""
+        assert api.get_user("discord", "bob") is None
+        assert api.get_user_by_platform_id("discord", "2002") is None
+        assert api.identity_cache_stats()["entries"] == 2
+        
+        user = api.create_user("Bob", "discord", "bob", "2002")
+        assert api.get_user("discord", "bob").user_id == user.user_id
+        assert api.get_user_by_platform_id("discord", "2002").user_id == user.user_id
+        
+        assert api.get_user("terminal", "bob") is None
+        api.link_platform(user.user_id, "terminal", "bob")
+        assert api.get_user("terminal", "bob").user_id == user.user_id
+    
+    def test_update_and_delete_invalidate(self, api):
+        """Test that renaming or deleting a user is seen at once."""
+        user = api.create_user("Carol", "discord", "carol", "3003")
+        assert api.get_user("discord", "carol").name == "Carol"
+        assert api.get_user_by_platform_id("discord", "3003").name == "Carol"
+        
+        api.update_user(user.user_id, "Caroline")
+        assert api.get_user("discord", "carol").name == "Caroline"
+        assert api.get_user_by_platform_id("discord", "3003").name == "Caroline"
+        
+        api.delete_user(user.user_id)
+        assert api.get_user("discord", "carol") is None
+        assert api.get_user_by_platform_id("discord", "3003") is None
+    
+    def test_transaction_bypasses_cache(self, api):
+        """Test that a rolled-back user is never cached."""
+        assert api.get_user("discord", "dave") is None
+        with pytest.raises(RuntimeError):
+            with api.transaction() as tx:
+                tx.create_user("Dave", "discord", "dave")
+                assert tx.get_user("discord", "dave").name == "Dave"
+                raise RuntimeError("abort")
+        
+        assert api.get_user("discord", "dave") is None
+    
+    def test_lru_and_ttl(self):
+        """Test eviction of the least recently used entry and expiry of negative entries."""
+        cache = IdentityCache(max_entries=2, negative_ttl=0.05)
+        alice = UserRecord("a", "Alice", 0, 0, None)
+        cache.put(("discord", "username", "alice"), alice, cache.generation)
+        cache.put(("discord", "username", "bob"), None, cache.generation)
+        assert cache.get(("discord", "username", "alice")) == alice
+        cache.put(("discord", "username", "carol"), None, cache.generation)
+        
+        assert cache.get(("discord", "username", "bob")) is MISSING
+        assert cache.get(("discord", "username", "carol")) is None
+        time.sleep(0.06)
+        assert cache.get(("discord", "username", "carol")) is MISSING
+        assert cache.get(("discord", "username", "alice")) == alice
+        
+        # A lookup that raced an invalidation is not cached
+        generation = cache.generation
+        cache.forget(user_id="a")
+        assert cache.get(("discord", "username", "alice")) is MISSING
+        cache.put(("discord", "username", "alice"), alice, generation)
+        assert cache.get(("discord", "username", "alice")) is MISSING
+        
+        with pytest.raises(ValueError):
+            cache.configure(max_entries=-1)
+        cache.configure(max_entries=0)
+        cache.put(("discord", "username", "alice"), alice, cache.generation)
+        assert cache.stats()["entries"] == 0
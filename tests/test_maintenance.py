@@ -0,0 +1,109 @@
+"""Tests for the background maintenance scheduler."""
+import os
+import tempfile
+import time
+
+import pytest
+
+from callisto.db import Database
+from callisto.maintenance import MaintenanceScheduler
+from callisto.models import Platform
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.unlink(path)  # auto_vacuum can only be chosen for an empty file
+    database = Database(path)
+    database.init_db()
+    yield database
+    database.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+def pragma(db, name):
+    """Read an integer PRAGMA through the writer connection."""
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+def churn(db, rows=2000):
+    """Insert and delete enough rows to leave free pages behind."""
+    with db.session() as session:
+        for i in range(rows):
+            session.add(Platform(platform_name=f"platform-{i}-" + "x" * 500))
+    with db.session() as session:
+        session.query(Platform).delete()
+
+class TestMaintenance:
+    """Test vacuum, checkpoints, optimize and idle detection."""
+    
+    def test_init_db_enables_incremental_vacuum(self, db):
+        """Test that new databases are created with auto_vacuum=INCREMENTAL."""
+        assert pragma(db, "auto_vacuum") == 2
+    
+    def test_enable_incremental_vacuum_on_existing_file(self, db):
+        """Test that a file created with auto_vacuum=NONE can be converted."""
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=NONE")
+            conn.exec_driver_sql("VACUUM")
+        churn(db)
+        assert pragma(db, "auto_vacuum") == 0
+        assert MaintenanceScheduler(db).run_once()["pages_reclaimed"] == 0
+        
+        assert db.enable_incremental_vacuum()
+        assert pragma(db, "auto_vacuum") == 2
+        assert not db.enable_incremental_vacuum()
+        
+        churn(db)
+        assert MaintenanceScheduler(db).run_once()["pages_reclaimed"] > 0
+    
+    def test_run_once_reclaims_pages(self, db):
+        """Test that a cycle frees deleted pages and reports them."""
+        churn(db)
+        assert pragma(db, "freelist_count") > 0
+        
+        scheduler = MaintenanceScheduler(db, vacuum_pages=64, slice_seconds=1.0)
+        report = scheduler.run_once()
+        
+        assert report["pages_reclaimed"] > 64
+        assert report["bytes_reclaimed"] == report["pages_reclaimed"] * pragma(db, "page_size")
+        assert report["optimized"]
+        assert pragma(db, "freelist_count") == 0
+        
+        # Statistics are only refreshed once per optimize_interval
+        second = scheduler.run_once()
+        assert second["pages_reclaimed"] == 0
+        assert not second["optimized"]
+        
+        stats = scheduler.stats()
+        assert stats["cycles"] == 2
+        assert stats["pages_reclaimed"] == report["pages_reclaimed"]
+        assert stats["optimize_runs"] == 1
+    
+    def test_skips_work_while_busy(self, db):
+        """Test that an idle-only cycle does nothing while sessions are active."""
+        churn(db)
+        scheduler = MaintenanceScheduler(db, idle_after=60)
+        
+        with db.read_session():
+            assert not scheduler.is_idle()
+        report = scheduler.run_once(only_when_idle=True)
+        
+        assert report["slices"] == 0
+        assert pragma(db, "freelist_count") > 0
+    
+    def test_background_scheduler(self, db):
+        """Test that the scheduler attached to a Database runs when idle."""
+        churn(db, rows=500)
+        scheduler = db.start_maintenance(idle_after=0, check_interval=0.01)
+        assert db.start_maintenance() is scheduler
+        
+        deadline = time.monotonic() + 5
+        while scheduler.stats()["cycles"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        assert scheduler.stats()["pages_reclaimed"] > 0
+        db.stop_maintenance()
+        assert db.maintenance is None
@@ -0,0 +1,101 @@
+"""Tests for per-call metrics collection."""
+import os
+import tempfile
+
+import pytest
+
+from callisto.db import Database
+from callisto.metrics import Metrics
+from callisto.models import Platform
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database = Database(path)
+    database.init_db()
+    yield database
+    if os.path.exists(path):
+        os.unlink(path)
+
+@pytest.fixture
+def registry(db):
+    """Create a metrics registry attached to the test database."""
+    registry = Metrics()
+    registry.instrument_engine(db.engine)
+    registry.instrument_engine(db.read_engine)
+    return registry
+
+def make_service(registry, db):
+    """Build a small instrumented API class."""
+    @registry.instrument(exclude=("skipped",))
+    class Service:
+        def add(self, name):
+            with db.session() as session:
+                session.add(Platform(platform_name=name))
+        
+        def list(self):
+            with db.read_session() as session:
+                session.query(Platform).count()
+                return [p.platform_name for p in session.query(Platform).all()]
+        
+        def fail(self):
+            raise ValueError("boom")
+        
+        def skipped(self):
+            return None
+    
+    return Service()
+
+class TestMetrics:
+    """Test call counts, statement counts and reporting."""
+    
+    def test_counts_calls_statements_and_rows(self, registry, db):
+        """Test that each method records its own counters."""
+        service = make_service(registry, db)
+        service.add("one")
+        service.add("two")
+        assert service.list() == ["one", "two"]
+        
+        snapshot = registry.snapshot()
+        assert snapshot["add"]["calls"] == 2
+        assert snapshot["add"]["rows"] == 0
+        assert snapshot["list"]["calls"] == 1
+        assert snapshot["list"]["statements"] == 2
+        assert snapshot["list"]["rows"] == 2
+        assert snapshot["list"]["latency"]["p99"] >= snapshot["list"]["latency"]["p50"] > 0
+    
+    def test_errors_and_exclusions(self, registry, db):
+        """Test that failures are counted and excluded methods are untouched."""
+        service = make_service(registry, db)
+        with pytest.raises(ValueError):
+            service.fail()
+        service.skipped()
+        
+        snapshot = registry.snapshot()
+        assert snapshot["fail"]["errors"] == 1
+        assert "skipped" not in snapshot
+    
+    def test_untracked_statements_are_ignored(self, registry, db):
+        """Test that queries outside a tracked call are not attributed."""
+        with db.read_session() as session:
+            session.query(Platform).all()
+        assert registry.snapshot() == {}
+    
+    def test_prometheus_output(self, registry, db):
+        """Test the Prometheus text rendering."""
+        service = make_service(registry, db)
+        service.add("one")
+        text = registry.to_prometheus()
+        
+        assert '# TYPE callisto_api_latency_seconds histogram' in text
+        assert 'callisto_api_calls_total{method="add"} 1' in text
+        assert 'callisto_api_latency_seconds_bucket{method="add",le="+Inf"} 1' in text
+        assert 'callisto_api_latency_seconds_count{method="add"} 1' in text
+    
+    def test_reset(self, registry, db):
+        """Test that reset clears collected metrics."""
+        make_service(registry, db).add("one")
+        registry.reset()
+        assert registry.snapshot() == {}
@@ -0,0 +1,108 @@
+"""Tests for the schema migration runner."""
+import os
+import sqlite3
+import tempfile
+
+import pytest
+from sqlalchemy import inspect
+
+from callisto.db import Database
+from callisto.migrations import SCHEMA_VERSION, get_schema_version, run_migrations
+
+# Schema as created by releases before versioned migrations existed
+LEGACY_SCHEMA = """
+CREATE TABLE users (user_id VARCHAR PRIMARY KEY, name TEXT NOT NULL, created_at INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL, user_metadata TEXT);
+CREATE TABLE platforms (platform_id INTEGER PRIMARY KEY, platform_name TEXT NOT NULL UNIQUE);
+CREATE TABLE knowledge_categories (category_id INTEGER PRIMARY KEY, category_name TEXT NOT NULL UNIQUE,
+    data_type TEXT NOT NULL, is_personal BOOLEAN NOT NULL);
+CREATE TABLE user_knowledge (knowledge_id INTEGER PRIMARY KEY, user_id VARCHAR NOT NULL,
+    category_id INTEGER NOT NULL, value TEXT NOT NULL, confidence FLOAT NOT NULL, source TEXT NOT NULL,
+    created_at INTEGER NOT NULL, updated_at INTEGER NOT NULL);
+CREATE INDEX idx_userknowledge_user_id ON user_knowledge (user_id);
+CREATE INDEX idx_userknowledge_category ON user_knowledge (category_id);
+CREATE TABLE conversations (conversation_id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL,
+    platform_id INTEGER NOT NULL, started_at INTEGER NOT NULL, ended_at INTEGER, extracted BOOLEAN NOT NULL);
+CREATE INDEX idx_conversations_user_id ON conversations (user_id);
+CREATE INDEX idx_conversations_extracted ON conversations (extracted);
+CREATE TABLE messages (message_id INTEGER PRIMARY KEY, conversation_id VARCHAR NOT NULL,
+    is_from_user BOOLEAN NOT NULL, content TEXT NOT NULL, timestamp INTEGER NOT NULL);
+CREATE INDEX idx_messages_conversation ON messages (conversation_id);
+CREATE TABLE extraction_jobs (job_id INTEGER PRIMARY KEY, conversation_id VARCHAR NOT NULL,
+    status TEXT NOT NULL, created_at INTEGER NOT NULL, completed_at INTEGER, error TEXT);
+"""
+
+@pytest.fixture
+def db_path():
+    """Create a temporary database file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield path
+    if os.path.exists(path):
+        os.unlink(path)
+
+def index_names(db, table):
+    """Return the names of all indexes on a table."""
+    return {index["name"] for index in inspect(db.engine).get_indexes(table)}
+
+class TestMigrations:
+    """Test schema versioning and index migrations."""
+    
+    def test_fresh_database_is_current(self, db_path):
+        """Test that a new database is created at the latest version."""
+        db = Database(db_path)
+        db.init_db()
+        
+        with db.engine.connect() as conn:
+            assert get_schema_version(conn) == SCHEMA_VERSION
+            assert run_migrations(conn) == []
+    
+    def test_legacy_database_is_upgraded(self, db_path):
+        """Test that init_db builds the new indexes on an existing database."""
+        conn = sqlite3.connect(db_path)
+        conn.executescript(LEGACY_SCHEMA)
+        # Duplicate knowledge rows the old code could leave behind
+        conn.executemany(
+            "INSERT INTO user_knowledge (user_id, category_id, value, confidence, source, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'user_stated', 0, ?)",
+            [("u1", 1, "low", 0.5, 10), ("u1", 1, "high", 0.9, 5), ("u1", 2, "only", 1.0, 1)]
+        )
+        conn.execute("INSERT INTO conversations (conversation_id, user_id, platform_id, started_at, extracted) "
+                     "VALUES ('c1', 'u1', 1, 0, 0)")
+        conn.execute("INSERT INTO messages (conversation_id, is_from_user, content, timestamp) "
+                     "VALUES ('c1', 1, 'Hello there, internationalization!', 5)")
+        conn.commit()
+        conn.close()
+        
+        db = Database(db_path)
+        db.init_db()
+        
+        with db.engine.connect() as conn:
+            assert get_schema_version(conn) == SCHEMA_VERSION
+            values = [row[0] for row in conn.exec_driver_sql(
+                "SELECT value FROM user_knowledge ORDER BY category_id")]
+        assert values == ["high", "only"]
+        
+        assert "uq_userknowledge_user_category" in index_names(db, "user_knowledge")
+        assert "idx_userknowledge_user_id" not in index_names(db, "user_knowledge")
+        assert index_names(db, "messages") == {"idx_messages_conversation_timestamp"}
+        assert index_names(db, "conversations") == {
+            "idx_conversations_user_started", "idx_conversations_unextracted", "idx_conversations_archive"
+        }
+        assert index_names(db, "extraction_jobs") == {"idx_extractionjobs_status_created"}
+        assert "archived_at" in {column["name"] for column in inspect(db.engine).get_columns("conversations")}
+        
+        # Existing messages are counted by the migration: 1 + 1 + 1 + 4 + 1
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("SELECT token_count FROM messages").scalar() == 8
+            assert conn.exec_driver_sql(
+                "SELECT message_count, last_message_at, last_message_preview FROM conversations"
+            ).first() == (1, 5, "Hello there, internationalization!")
+        
+        # Rebuilt with AUTOINCREMENT, keeping IDs and full-text search
+        with db.engine.connect() as conn:
+            assert "AUTOINCREMENT" in conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages'").scalar()
+            assert conn.exec_driver_sql("SELECT message_id FROM messages").scalar() == 1
+            assert conn.exec_driver_sql(
+                "SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'internationalization'").scalar() == 1
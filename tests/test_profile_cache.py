@@ -0,0 +1,117 @@
+"""Tests for the cache of decoded knowledge profiles."""
+import os
+import tempfile
+
+import pytest
+
+from callisto import reference_cache
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.metrics import metrics
+from callisto.profile_cache import ProfileCache
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    database = Database(os.path.join(directory, "callisto.db"))
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+@pytest.fixture
+def user_id(api):
+    """Create a user with some knowledge."""
+    user = api.create_user("Alice", "discord", "alice")
+    api.store_knowledge(user.user_id, "location", "Lisbon")
+    api.store_knowledge(user.user_id, "likes", ["tea", "chess"])
+    return user.user_id
+
+class TestProfileCache:
+    """Test cached knowledge reads and their invalidation."""
+    
+    def test_reads_are_served_from_the_cache(self, api, user_id):
+        """Test that repeated and filtered reads issue no SQL after the first."""
+        metrics.reset()
+        full = api.get_user_knowledge(user_id)
+        assert api.get_user_knowledge(user_id) == full
+        assert list(api.get_user_knowledge(user_id, "likes")) == ["likes"]
+        assert list(api.get_user_knowledge(user_id, include_personal=False)) == ["likes"]
+        assert api.get_user_knowledge(user_id, since_timestamp=full["likes"]["updated_at"] + 1) == {}
+        
+        assert metrics.snapshot()["get_user_knowledge"]["statements"] == 1
+        assert metrics.cache_snapshot()["knowledge"]["hits"] == 4
+    
+    def test_callers_cannot_change_the_cache(self, api, user_id):
+        """Test that mutating a returned profile leaves the cached one intact."""
+        api.get_user_knowledge(user_id)["likes"]["value"].append("coffee")
+        api.get_user_knowledge(user_id).pop("location")
+        knowledge = api.get_user_knowledge(user_id)
+        assert knowledge["likes"]["value"] == ["tea", "chess"]
+        assert "location" in knowledge
+    
+    def test_knowledge_writes_invalidate(self, api, user_id):
+        """Test that every knowledge write is seen by the next read."""
+        api.get_user_knowledge(user_id)
+        
+        api.store_knowledge(user_id, "location", "Porto")
+        assert api.get_user_knowledge(user_id)["location"]["value"] == "Porto"
+        
+        api.batch_store_knowledge(user_id, [{"category": "occupation", "value": "chef"}])
+        assert api.get_user_knowledge(user_id)["occupation"]["value"] == "chef"
+        
+        api.delete_knowledge(user_id, "occupation")
+        assert "occupation" not in api.get_user_knowledge(user_id)
+        
+        other = api.create_user("Bob", "discord", "bob")
+        api.store_knowledge(other.user_id, "birthday", "1990-01-01")
+        api.merge_knowledge(user_id, other.user_id)
+        assert api.get_user_knowledge(user_id)["birthday"]["value"] == "1990-01-01"
+        
+        api.delete_user(user_id)
+        assert api.get_user_knowledge(user_id) == {}
+    
+    def test_category_changes_invalidate(self, api, user_id):
+        """Test that a category update changes how cached profiles are filtered."""
+        assert "location" not in api.get_user_knowledge(user_id, include_personal=False)
+        api.update_knowledge_category("location", is_personal=False)
+        assert "location" in api.get_user_knowledge(user_id, include_personal=False)
+    
+    def test_transaction_bypasses_cache(self, api, user_id):
+        """Test that knowledge written in a rolled-back transaction is never cached."""
+        with pytest.raises(RuntimeError):
+            with api.transaction(user_id) as tx:
+                tx.store_knowledge(user_id, "location", "Madrid")
+                assert tx.get_user_knowledge(user_id)["location"]["value"] == "Madrid"
+                raise RuntimeError("abort")
+        
+        assert api.get_user_knowledge(user_id)["location"]["value"] == "Lisbon"
+    
+    def test_lru(self):
+        """Test eviction, racing reads and turning the cache off."""
+        cache = ProfileCache(max_users=2)
+        for user in ("a", "b", "c"):
+            cache.put(user, {}, cache.generation, reference_cache.version())
+        assert cache.get("a") is None
+        assert cache.get("c") == {}
+        
+        generation = cache.generation
+        cache.forget("b")
+        cache.put("b", {}, generation, reference_cache.version())
+        assert cache.get("b") is None
+        
+        with pytest.raises(ValueError):
+            cache.configure(max_users=-1)
+        cache.configure(max_users=0)
+        assert len(cache) == 0
@@ -0,0 +1,100 @@
+"""Tests for the immutable records returned by the read APIs."""
+import os
+import pickle
+import tempfile
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.records import (
+    ContextMessageRecord, ConversationRecord, KnowledgeRecord, MessageRecord, UserRecord
+)
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    database = Database(os.path.join(directory, "callisto.db"))
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+class TestRecords:
+    """Test the record types and the read APIs returning them."""
+    
+    def test_record_behaviour(self):
+        """Test attribute and mapping access, immutability and pickling."""
+        message = MessageRecord(1, True, "hello", 100)
+        assert message.content == message["content"] == "hello"
+        assert message == {"message_id": 1, "is_from_user": True, "content": "hello", "timestamp": 100}
+        assert dict(message, message_id=2)["message_id"] == 2
+        assert message._replace(content="bye").content == "bye"
+        assert pickle.loads(pickle.dumps(message)) == message
+        assert not hasattr(message, "__dict__")
+        
+        with pytest.raises(AttributeError):
+            message.content = "changed"
+        with pytest.raises(KeyError):
+            message["snippet"]
+        with pytest.raises(TypeError):
+            MessageRecord(1, True, "hello")
+        
+        window_message = ContextMessageRecord(1, True, "hello", 100, token_count=1)
+        assert list(window_message) == ["message_id", "is_from_user", "content", "timestamp", "token_count"]
+    
+    def test_users_are_records(self, api):
+        """Test that user reads return detached records, not ORM instances."""
+        created = api.create_user("Alice", "discord", "alice", "42")
+        assert isinstance(created, UserRecord)
+        
+        found = api.get_user("discord", "alice")
+        assert isinstance(found, UserRecord)
+        assert found == created
+        assert api.get_user_by_platform_id("discord", "42") == created
+    
+    def test_conversations_and_messages_are_records(self, api):
+        """Test that conversation and history reads return records."""
+        user = api.create_user("Bob", "discord", "bob")
+        conversation_id = api.store_conversation(user.user_id, "discord", [
+            {"content": "hi", "timestamp": 10},
+            {"content": "there", "timestamp": 20, "is_from_user": False},
+        ])
+        
+        conversation = api.conversations.get_conversation(conversation_id)
+        assert isinstance(conversation, ConversationRecord)
+        assert conversation.message_count == 2
+        [recent] = api.get_recent_conversations(user.user_id)
+        assert recent == conversation
+        
+        history = api.get_conversation_history(conversation_id)
+        assert all(isinstance(message, MessageRecord) for message in history)
+        assert [m.content for m in history] == ["hi", "there"]
+        assert history[1].is_from_user is False
+        assert api.get_conversation_history_page(conversation_id, limit=1) == history[1:]
+        assert list(api.iter_conversation_history(conversation_id, batch_size=1)) == history
+        
+        window = api.get_context_window(conversation_id, max_tokens=100)
+        assert all(isinstance(message, ContextMessageRecord) for message in window)
+        assert [m.content for m in window] == ["hi", "there"]
+    
+    def test_knowledge_entries_are_records(self, api):
+        """Test that knowledge reads return a record per category."""
+        user = api.create_user("Carol", "discord", "carol")
+        api.store_knowledge(user.user_id, "likes", ["tea"], source="extracted")
+        
+        entry = api.get_user_knowledge(user.user_id)["likes"]
+        assert isinstance(entry, KnowledgeRecord)
+        assert entry.value == ["tea"]
+        assert api.get_knowledge_by_source(user.user_id, "extracted")["likes"] == entry
@@ -0,0 +1,152 @@
+"""Tests for the in-process cache of platforms and categories."""
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from callisto import reference_cache
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.models import Platform
+from callisto.sharding import ShardRouter
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    database = Database(os.path.join(directory, "callisto.db"))
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+class ReferenceQueries:
+    """Count the statements that read the platforms or categories tables."""
+    
+    def __init__(self, database):
+        self.count = 0
+        for engine in (database.engine, database.read_engine):
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+    
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if "FROM platforms" in statement or "FROM knowledge_categories" in statement:
+            self.count += 1
+
+class TestReferenceCache:
+    """Test lookups, invalidation and concurrent use of the reference cache."""
+    
+    def test_lookups_do_not_query(self, db, api):
+        """Test that repeated lookups are served from memory."""
+        api.create_user("Alice", "discord", "alice")
+        queries = ReferenceQueries(db)
+        
+        for i in range(5):
+            assert api.get_user("discord", "alice") is not None
+            api.store_knowledge(api.get_user("discord", "alice").user_id, "likes", [f"tea {i}"])
+            assert api.get_knowledge_categories()
+        
+        assert queries.count == 0
+    
+    def test_category_writes_invalidate(self, api):
+        """Test that creating, updating and deleting categories is seen at once."""
+        categories = api.categories
+        assert categories.get_category("hobbies") is None
+        
+        assert categories.create_category("hobbies", "list")
+        assert categories.get_category("hobbies")["data_type"] == "list"
+        assert "hobbies" in [c["category_name"] for c in categories.get_categories()]
+        
+        assert categories.update_category("hobbies", data_type="string", is_personal=True)
+        assert categories.get_category("hobbies") == {
+            "category_name": "hobbies", "data_type": "string", "is_personal": True}
+        assert "hobbies" not in [c["category_name"] for c in categories.get_categories(include_personal=False)]
+        
+        assert categories.delete_category("hobbies")
+        assert categories.get_category("hobbies") is None
+    
+    def test_new_platform_is_cached(self, db, api):
+        """Test that a platform created on first use is found afterwards."""
+        api.create_user("Bob", "matrix", "bob")
+        queries = ReferenceQueries(db)
+        
+        assert api.get_user("matrix", "bob").name == "Bob"
+        assert api.get_user("matrix", "nobody") is None
+        assert queries.count == 2  # one reload of both tables after the platform committed
+    
+    def test_rolled_back_platform_is_not_cached(self, db):
+        """Test that a lookup never returns a row whose transaction rolled back."""
+        with pytest.raises(RuntimeError):
+            with db.session() as session:
+                CallistoAPI._get_or_create_platform_id(session, "irc")
+                assert reference_cache.platform_id(session, "irc") is not None
+                raise RuntimeError("abort")
+        
+        with db.read_session() as session:
+            assert reference_cache.platform_id(session, "irc") is None
+            assert session.query(Platform).filter_by(platform_name="irc").count() == 0
+    
+    def test_rows_from_elsewhere_are_found(self, db):
+        """Test that rows written past the cache are found on a miss."""
+        with db.read_session() as session:
+            assert reference_cache.platform_id(session, "slack") is None
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO platforms (platform_name) VALUES ('slack')")
+        
+        with db.read_session() as session:
+            assert reference_cache.platform_id(session, "slack") is not None
+    
+    def test_concurrent_lookups(self, api):
+        """Test that lookups stay correct while categories change in another thread."""
+        errors = []
+        stop = threading.Event()
+        
+        def read():
+            while not stop.is_set():
+                try:
+                    assert api.categories.get_category("likes")["data_type"] == "list"
+                except Exception as e:
+                    errors.append(e)
+                    return
+        
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for i in range(20):
+            api.categories.create_category(f"topic_{i}", "string")
+        stop.set()
+        for thread in readers:
+            thread.join()
+        
+        assert errors == []
+        assert len([c for c in api.categories.get_categories() if c["category_name"].startswith("topic_")]) == 20
+    
+    def test_shards_share_the_global_cache(self):
+        """Test that every shard of a router uses the global database's cache."""
+        directory = tempfile.mkdtemp()
+        router = ShardRouter(directory, shard_count=2)
+        try:
+            router.init_db()
+            router.init_default_data()
+            assert all(shard.reference_cache is router.reference.reference_cache for shard in router.shards)
+            
+            api = CallistoAPI(router)
+            user = api.create_user("Carol", "discord", "carol")
+            api.store_knowledge(user.user_id, "pet", "Rex")
+            assert api.categories.get_category("pet")["data_type"] == "string"
+            assert api.get_user_knowledge(user.user_id)["pet"]["value"] == "Rex"
+        finally:
+            router.dispose()
+            shutil.rmtree(directory)
@@ -0,0 +1,109 @@
+"""Tests for full-text search over messages."""
+import os
+import tempfile
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.compression import RecompressionJob, train_dictionary
+from callisto.db import Database
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database = Database(path)
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database."""
+    return CallistoAPI(db)
+
+def check_index(db):
+    """Fail unless the full-text index matches the messages table exactly."""
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO messages_fts(messages_fts, rank) VALUES ('integrity-check', 1)")
+
+class TestSearch:
+    """Test search_messages and keeping the index in sync."""
+    
+    def test_search_ranks_and_snippets(self, api):
+        """Test that matches come back best first with highlighted snippets."""
+        user = api.create_user("Alice", "discord", "alice")
+        conversation_id = api.start_conversation(user.user_id, "discord")
+        api.add_message(conversation_id, "I had green tea this morning", True)
+        api.add_message(conversation_id, "Coffee is better than tea, tea, tea", False)
+        api.add_message(conversation_id, "Let's talk about chess", True)
+        
+        results = api.search_messages(user.user_id, "tea")
+        
+        assert len(results) == 2
+        assert results[0]["snippet"].count("[tea]") == 3
+        assert results[0]["score"] >= results[1]["score"]
+        assert all(r["conversation_id"] == conversation_id for r in results)
+        assert "[green]" in api.search_messages(user.user_id, "gre*")[0]["snippet"]
+        assert api.search_messages(user.user_id, "green chess") == []
+    
+    def test_search_is_scoped_to_user(self, api):
+        """Test that one user's search never returns another user's messages."""
+        alice = api.create_user("Alice", "discord", "alice")
+        bob = api.create_user("Bob", "discord", "bob")
+        api.store_conversation(alice.user_id, "discord", [{"content": "my cat is called Tom"}])
+        api.store_conversation(bob.user_id, "discord", [{"content": "my cat is called Felix"}])
+        
+        results = api.search_messages(alice.user_id, "cat")
+        assert len(results) == 1
+        assert "Tom" in results[0]["snippet"]
+    
+    def test_since_and_limit(self, api):
+        """Test filtering by timestamp and limiting the result count."""
+        user = api.create_user("Carol", "discord", "carol")
+        api.store_conversation(user.user_id, "discord", [
+            {"content": f"pizza night {i}", "timestamp": 1000 + i} for i in range(10)
+        ])
+        
+        assert len(api.search_messages(user.user_id, "pizza", limit=3)) == 3
+        recent = api.search_messages(user.user_id, "pizza", since=1007)
+        assert sorted(r["timestamp"] for r in recent) == [1007, 1008, 1009]
+    
+    def test_query_syntax_is_not_interpreted(self, api):
+        """Test that quotes and operators in queries are searched as text."""
+        user = api.create_user("Dave", "discord", "dave")
+        api.store_conversation(user.user_id, "discord", [{"content": "I don't like NOT knowing"}])
+        
+        assert len(api.search_messages(user.user_id, "don't")) == 1
+        assert len(api.search_messages(user.user_id, "like) NOT know*")) == 1
+        assert api.search_messages(user.user_id, '"knowing') == []
+        assert api.search_messages(user.user_id, "   ") == []
+        with pytest.raises(ValueError):
+            api.search_messages(user.user_id, "x", limit=0)
+    
+    def test_index_follows_deletes_and_compression(self, db, api):
+        """Test that the index stays in sync as messages are recompressed or deleted."""
+        user = api.create_user("Erin", "discord", "erin")
+        lines = [f"weekend hiking trip number {i} up the mountain with friends" for i in range(50)]
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in lines])
+        check_index(db)
+        
+        train_dictionary(db)
+        RecompressionJob(db, pause=0).run_once()
+        api.store_conversation(user.user_id, "discord", [{"content": "compressed mountain message with friends"}])
+        
+        assert len(api.search_messages(user.user_id, "mountain", limit=100)) == 51
+        assert "[compressed]" in api.search_messages(user.user_id, "compressed")[0]["snippet"]
+        
+        check_index(db)
+        
+        api.delete_user(user.user_id)
+        check_index(db)
+        assert api.search_messages(user.user_id, "mountain") == []
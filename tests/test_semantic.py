@@ -0,0 +1,212 @@
+"""Tests for semantic search over messages and knowledge."""
+import os
+import tempfile
+import time
+
+import pytest
+from sqlalchemy import event
+
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.db import Database
+from callisto.embeddings import HashingEmbedder, SemanticIndex, pack, top_k
+from callisto.models import Embedding, EmbeddingCell, Message
+
+@pytest.fixture
+def db():
+    """Create an initialized database in a temporary file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database = Database(path)
+    database.init_db()
+    database.init_default_data()
+    CategoryManager(database).create_default_categories()
+    yield database
+    database.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+@pytest.fixture
+def api(db):
+    """Create an API over the temporary database, with semantic search on."""
+    api = CallistoAPI(db)
+    api.configure_semantic_search()
+    return api
+
+TOPICS = [
+    "My dog Rex loves chasing tennis balls in the park",
+    "I am learning to play chess on weekends",
+    "We cooked spicy ramen noodles for dinner yesterday",
+    "The football match last night went to penalties",
+    "I planted tomatoes and basil in the garden",
+]
+
+class TestSemanticSearch:
+    """Test the embedder, search results and partitioned search."""
+    
+    def test_embedder_is_deterministic(self):
+        """Test that the same text always gives the same unit vector."""
+        embedder = HashingEmbedder(64)
+        first, second = embedder(["Hello world", "Hello world"])
+        assert list(first) == list(second)
+        assert len(first) == 64
+        assert abs(sum(x * x for x in first) - 1) < 1e-5
+        assert list(embedder([""])[0]) == [0.0] * 64
+        
+        vectors = [pack(v) for v in HashingEmbedder()(["dogs in the park", "a dog", "chess openings"])]
+        assert top_k(vectors[1], [vectors[0], vectors[2]], 1)[0][0] == 0
+    
+    def test_finds_related_message(self, api):
+        """Test that a question finds the message about its topic."""
+        user = api.create_user("Alice", "discord", "alice")
+        conversation_id = api.store_conversation(user.user_id, "discord", [{"content": t} for t in TOPICS])
+        
+        results = api.semantic_search(user.user_id, "what did we talk about regarding their dog?", k=2)
+        
+        assert len(results) == 2
+        assert results[0]["kind"] == "message"
+        assert results[0]["content"] == TOPICS[0]
+        assert results[0]["conversation_id"] == conversation_id
+        assert results[0]["score"] > results[1]["score"]
+        assert api.semantic_search(user.user_id, "garden plants", k=1)[0]["content"] == TOPICS[4]
+    
+    def test_search_is_scoped_to_user(self, api):
+        """Test that one user's search never returns another user's items."""
+        alice = api.create_user("Alice", "discord", "alice")
+        bob = api.create_user("Bob", "discord", "bob")
+        api.store_conversation(alice.user_id, "discord", [{"content": "my cat sleeps all day"}])
+        api.store_conversation(bob.user_id, "discord", [{"content": "my cat is called Felix"}])
+        
+        results = api.semantic_search(alice.user_id, "cat", k=10)
+        assert [r["content"] for r in results] == ["my cat sleeps all day"]
+        
+        with pytest.raises(ValueError):
+            api.semantic_search(alice.user_id, "cat", k=0)
+        with pytest.raises(ValueError):
+            api.semantic_search(alice.user_id, "cat", kinds=("files",))
+    
+    def test_knowledge_is_searched_and_refreshed(self, api):
+        """Test that knowledge is found and re-embedded when its value changes."""
+        user = api.create_user("Carol", "discord", "carol")
+        api.store_conversation(user.user_id, "discord", [{"content": t} for t in TOPICS])
+        api.create_knowledge_category("pet_name", "string")
+        api.store_knowledge(user.user_id, "pet_name", "Biscuit")
+        
+        results = api.semantic_search(user.user_id, "Biscuit", k=1, kinds=("knowledge",))
+        assert results[0]["category"] == "pet_name"
+        assert results[0]["value"] == "Biscuit"
+        
+        api.store_knowledge(user.user_id, "pet_name", "Waffles")
+        result = api.semantic_search(user.user_id, "Waffles", k=1, kinds=("knowledge",))[0]
+        assert result["value"] == "Waffles"
+        assert result["score"] > 0.5
+    
+    def test_deleted_items_are_dropped(self, db, api):
+        """Test that embeddings go away with the messages and user they belong to."""
+        user = api.create_user("Dave", "discord", "dave")
+        api.store_conversation(user.user_id, "discord", [{"content": t} for t in TOPICS])
+        api.store_knowledge(user.user_id, "location", "Lisbon")
+        assert len(api.semantic_search(user.user_id, "anything", k=50)) == len(TOPICS) + 1
+        
+        api.delete_user(user.user_id)
+        
+        with db.read_session() as session:
+            assert session.query(Embedding).count() == 0
+    
+    def test_items_are_embedded_on_write(self, db, api):
+        """Test that writes are searchable at once and that searching never writes."""
+        user = api.create_user("Hana", "discord", "hana")
+        conversation_id = api.start_conversation(user.user_id, "discord")
+        api.add_message(conversation_id, "We adopted a puppy called Mochi", True)
+        api.store_knowledge(user.user_id, "location", "Osaka")
+        writes = []
+        event.listen(db.engine, "begin", lambda conn: writes.append(1))
+        
+        assert api.semantic_search(user.user_id, "puppy", k=1)[0]["content"] == "We adopted a puppy called Mochi"
+        assert api.semantic_search(user.user_id, "Osaka", k=1, kinds=("knowledge",))[0]["value"] == "Osaka"
+        assert writes == []
+        
+        api.delete_knowledge(user.user_id, "location")
+        with db.read_session() as session:
+            assert session.query(Embedding).filter_by(kind="knowledge").count() == 0
+        
+        db.semantic_index = None
+        with pytest.raises(RuntimeError):
+            api.semantic_search(user.user_id, "puppy")
+    
+    def test_outdated_embeddings_never_leak(self, db, api):
+        """Test that an embedding pointing at another user's item is never returned and is dropped."""
+        alice = api.create_user("Alice", "discord", "alice")
+        bob = api.create_user("Bob", "discord", "bob")
+        api.store_conversation(alice.user_id, "discord", [{"content": "my cat sleeps all day"}])
+        bob_conversation = api.store_conversation(bob.user_id, "discord", [{"content": "my cat is called Felix"}])
+        api.store_knowledge(bob.user_id, "location", "Lisbon")
+        
+        # As if Bob's rows had reused the IDs of deleted rows of Alice's
+        with db.session() as session:
+            [(message_id,)] = session.query(Message.message_id).filter_by(conversation_id=bob_conversation)
+            session.query(Embedding).filter(Embedding.user_id == bob.user_id).update(
+                {Embedding.user_id: alice.user_id})
+        
+        assert [r["content"] for r in api.semantic_search(alice.user_id, "cat", k=10)] == [
+            "my cat sleeps all day"]
+        assert api.semantic_search(alice.user_id, "Lisbon", k=10, kinds=("knowledge",)) == []
+        
+        # Re-embedded for their owner
+        assert SemanticIndex(db).sync() == 2
+        with db.read_session() as session:
+            assert dict(session.query(Embedding.item_id, Embedding.user_id).filter_by(kind="message")) == {
+                message_id - 1: alice.user_id, message_id: bob.user_id}
+        assert [r["content"] for r in api.semantic_search(bob.user_id, "cat", kinds=("message",))] == [
+            "my cat is called Felix"]
+    
+    def test_archived_messages_are_dropped(self, db, api):
+        """Test that archiving drops message embeddings and that their IDs are never reused."""
+        user = api.create_user("Gina", "discord", "gina")
+        conversation_id = api.store_conversation(user.user_id, "discord", [{"content": t} for t in TOPICS])
+        api.end_conversation(conversation_id)
+        with db.read_session() as session:
+            archived_ids = {message_id for message_id, in session.query(Message.message_id)}
+        
+        assert db.open_archive(min_age=0).run_once(now=int(time.time()) + 10) == 1
+        with db.read_session() as session:
+            assert session.query(Embedding).count() == 0
+        
+        api.store_conversation(user.user_id, "discord", [{"content": "a new message"}])
+        with db.read_session() as session:
+            [(message_id,)] = session.query(Message.message_id)
+        assert message_id > max(archived_ids)
+        assert [r["content"] for r in api.semantic_search(user.user_id, "dog", k=10)] == ["a new message"]
+    
+    def test_partitioned_search(self, db, api):
+        """Test that searching only the nearest cells still finds close matches."""
+        user = api.create_user("Erin", "discord", "erin")
+        lines = [f"{topic} number {i}" for i in range(10) for topic in TOPICS]
+        api.store_conversation(user.user_id, "discord", [{"content": line} for line in lines])
+        
+        api.configure_semantic_search(nprobe=2)
+        assert api.train_semantic_partitions(cells=5) == 5
+        with db.read_session() as session:
+            assert session.query(EmbeddingCell).count() == 5
+            assert {cell for cell, in session.query(Embedding.cell)} != {0}
+        
+        results = api.semantic_search(user.user_id, "ramen noodles", k=5)
+        assert all("ramen" in r["content"] for r in results)
+        
+        # Items written after training are assigned to the existing cells
+        api.store_conversation(user.user_id, "discord", [{"content": "homemade ramen noodles with egg"}])
+        results = api.semantic_search(user.user_id, "homemade ramen", k=1)
+        assert results[0]["content"] == "homemade ramen noodles with egg"
+    
+    def test_custom_embedder(self, db, api):
+        """Test that switching embedders re-embeds stored items."""
+        user = api.create_user("Finn", "discord", "finn")
+        api.store_conversation(user.user_id, "discord", [{"content": t} for t in TOPICS])
+        api.semantic_search(user.user_id, "dog", k=1)
+        
+        api.configure_semantic_search(embedder=HashingEmbedder(128))
+        assert api.semantic_search(user.user_id, "dog", k=1)[0]["content"] == TOPICS[0]
+        with db.read_session() as session:
+            assert {model for model, in session.query(Embedding.model)} == {"hashing-128"}
+        assert SemanticIndex(db, HashingEmbedder(128)).sync() == 0
@@ -0,0 +1,172 @@
+"""Tests for sharding users across several database files."""
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from callisto.api import CallistoAPI
+from callisto.categories import CategoryManager
+from callisto.models import User
+from callisto.sharding import ShardRouter
+
+@pytest.fixture
+def router():
+    """Create an initialized four-shard store in a temporary directory."""
+    directory = tempfile.mkdtemp()
+    router = ShardRouter(directory, shard_count=4)
+    router.init_db()
+    router.init_default_data()
+    CategoryManager(router).create_default_categories()
+    yield router
+    router.dispose()
+    shutil.rmtree(directory)
+
+@pytest.fixture
+def api(router):
+    """Create an API over the sharded store."""
+    return CallistoAPI(router)
+
+class TestSharding:
+    """Test routing, cross-shard lookups and the shard layout."""
+    
+    def test_users_spread_across_shards(self, router, api):
+        """Test that users are stored in the shard their ID hashes to."""
+        users = [api.create_user(f"User {i}", "discord", f"user{i}") for i in range(40)]
+        
+        for user in users:
+            with router.for_user(user.user_id).read_session() as session:
+                assert session.query(User).filter_by(user_id=user.user_id).count() == 1
+        
+        counts = []
+        for shard in router.shards:
+            with shard.read_session() as session:
+                counts.append(session.query(User).count())
+        assert sum(counts) == 40
+        assert all(count > 0 for count in counts)
+    
+    def test_get_user_through_global_mapping(self, api):
+        """Test that a platform username finds a user on any shard."""
+        user = api.create_user("Alice", "discord", "alice")
+        api.link_platform(user.user_id, "telegram", "alice_tg")
+        
+        assert api.get_user("discord", "alice").user_id == user.user_id
+        assert api.get_user("telegram", "alice_tg").user_id == user.user_id
+        assert api.get_user("discord", "nobody") is None
+    
+    def test_knowledge_and_conversations(self, router, api):
+        """Test that user data and conversations stay on the user's shard."""
+        user = api.create_user("Bob", "discord", "bob")
+        api.store_knowledge(user.user_id, "likes", ["tea"], 0.9)
+        assert api.get_user_knowledge(user.user_id)["likes"]["value"] == ["tea"]
+        
+        conversation_id = api.start_conversation(user.user_id, "discord")
+        assert router.for_conversation(conversation_id) is router.for_user(user.user_id)
+        api.add_message(conversation_id, "Hello", True)
+        api.end_conversation(conversation_id)
+        
+        stored_id = api.store_conversation(user.user_id, "discord", [{"content": "Hi", "is_from_user": True}])
+        assert router.for_conversation(stored_id) is router.for_user(user.user_id)
+        
+        assert [m["content"] for m in api.get_conversation_history(conversation_id)] == ["Hello"]
+        recent = api.get_recent_conversations(user.user_id)
+        assert {c["conversation_id"] for c in recent} == {conversation_id, stored_id}
+    
+    def test_transaction_on_shard(self, api):
+        """Test that a unit of work runs on the user's shard."""
+        user = api.create_user("Carol", "discord", "carol")
+        with api.transaction(user.user_id) as tx:
+            conversation_id = tx.start_conversation(user.user_id, "discord")
+            tx.add_message(conversation_id, "One", True)
+            tx.add_message(conversation_id, "Two", False)
+        
+        assert len(api.get_conversation_history(conversation_id)) == 2
+        
+        with pytest.raises(ValueError):
+            with api.transaction():
+                pass
+    
+    def test_rolled_back_link_releases_identity(self, api):
+        """Test that a platform identity written to the global database is undone with its shard."""
+        user = api.create_user("Dave", "discord", "dave")
+        with pytest.raises(RuntimeError):
+            with api.transaction(user.user_id) as tx:
+                tx.link_platform(user.user_id, "telegram", "dave_tg")
+                raise RuntimeError("abort")
+        
+        assert api.get_user("telegram", "dave_tg") is None
+        api.link_platform(user.user_id, "telegram", "dave_tg")
+        assert api.get_user("telegram", "dave_tg").user_id == user.user_id
+        
+        api.delete_user(user.user_id)
+        assert api.get_user("discord", "dave") is None
+        assert api.get_user("telegram", "dave_tg") is None
+    
+    def test_conversation_id_on_wrong_shard(self, router, api):
+        """Test that a caller-chosen conversation ID must route to the user's shard."""
+        user = api.create_user("Dave", "discord", "dave")
+        other = next(i for i in range(len(router.shards)) if i != router.shard_index(user.user_id))
+        foreign_id = next(cid for cid in (router.new_conversation_id(str(n)) for n in range(1000))
+                          if router.shard_index(cid) == other)
+        
+        with pytest.raises(ValueError):
+            api.store_conversation(user.user_id, "discord", [], conversation_id=foreign_id)
+    
+    def test_parallel_writes_on_different_shards(self, api):
+        """Test that writers on different shards work at the same time."""
+        users = [api.create_user(f"Writer {i}", "discord", f"writer{i}") for i in range(8)]
+        errors = []
+        
+        def write(user_id):
+            try:
+                conversation_id = api.start_conversation(user_id, "discord")
+                for i in range(20):
+                    api.add_message(conversation_id, f"Message {i}", i % 2 == 0)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=write, args=(user.user_id,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert not errors
+        for user in users:
+            conversation = api.get_recent_conversations(user.user_id)[0]
+            assert len(api.get_conversation_history(conversation["conversation_id"])) == 20
+    
+    def test_concurrent_writes_to_global_tables(self, router, api):
+        """Test that writers on every shard can create users, platforms and categories at once."""
+        errors = []
+        
+        def write(worker):
+            for i in range(30):
+                try:
+                    user = api.create_user(f"User {worker}-{i}", f"platform{i % 3}", f"user{worker}_{i}")
+                    api.store_knowledge(user.user_id, f"category_{worker}_{i}", "value")
+                except Exception as e:
+                    errors.append(e)
+        
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert api.get_user("platform2", "user7_29") is not None
+        counts = []
+        for shard in router.shards:
+            with shard.read_session() as session:
+                counts.append(session.query(User).count())
+        assert sum(counts) == 240
+    
+    def test_layout_mismatch(self, router):
+        """Test that a store cannot be reopened with another shard count."""
+        with pytest.raises(ValueError):
+            ShardRouter(router.directory, shard_count=2)
+        
+        reopened = ShardRouter(router.directory, shard_count=4)
+        assert len(reopened.shards) == 4
+        reopened.dispose()
@@ -0,0 +1,234 @@
+"""Tests for the write-behind buffer."""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import pytest
+
+import callisto
+from callisto.db import Database, RetryPolicy, db as global_db
+from callisto.models import Platform
+from callisto.write_buffer import WriteBehindBuffer
+
+@pytest.fixture
+def db_path():
+    """Create a temporary database file."""
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield path
+    for suffix in ("", "-wal", "-shm", ".spill"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+@pytest.fixture
+def db(db_path):
+    """Create a database whose busy writes fail immediately."""
+    database = Database(db_path, retry_policy=RetryPolicy(attempts=1))
+    database.init_db()
+    database.pragmas["busy_timeout"] = 0
+    database.engine.dispose()
+    yield database
+    database.dispose()
+
+def add_platform(session, name):
+    """Write operation used by the tests."""
+    if not name:
+        raise ValueError("Name must not be empty")
+    session.add(Platform(platform_name=name))
+
+def lock(path):
+    """Hold the write lock from another connection, as a long maintenance job would."""
+    holder = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")
+    return holder
+
+def platform_names(db):
+    """Return committed platform names in insertion order."""
+    with db.read_session() as session:
+        return [p.platform_name for p in session.query(Platform).order_by(Platform.platform_id)]
+
+class TestWriteBehindBuffer:
+    """Test buffering, ordered replay and spilling."""
+    
+    def test_writes_pass_through_when_available(self, db):
+        """Test that writes go straight to the database when nothing is buffered."""
+        buffer = WriteBehindBuffer(db, {"platform": add_platform})
+        try:
+            buffer.write("platform", "direct")
+            assert len(buffer) == 0
+            assert platform_names(db) == ["direct"]
+            with pytest.raises(ValueError):
+                buffer.write("platform", "")
+            with pytest.raises(ValueError):
+                buffer.write("unknown")
+        finally:
+            buffer.close()
+    
+    def test_buffers_while_locked_and_replays_in_order(self, db, db_path):
+        """Test that writes made during an outage are kept and replayed in order."""
+        buffer = WriteBehindBuffer(db, {"platform": add_platform}, retry_interval=0.01)
+        holder = lock(db_path)
+        try:
+            for name in ("one", "two", "three"):
+                assert buffer.write("platform", name) is None
+            assert buffer.pending() == [("platform", ["one"]), ("platform", ["two"]), ("platform", ["three"])]
+            assert not buffer.flush(timeout=0.05)
+        finally:
+            holder.rollback()
+            holder.close()
+        
+        assert buffer.flush(timeout=5)
+        buffer.close()
+        assert platform_names(db) == ["one", "two", "three"]
+    
+    def test_busy_writer_does_not_stall_callers(self, db_path):
+        """Test that a write buffers after max_wait instead of waiting out a busy writer."""
+        patient = Database(db_path)
+        patient.init_db()
+        buffer = WriteBehindBuffer(patient, {"platform": add_platform}, retry_interval=0.01, max_wait=0.1)
+        try:
+            # Another thread's transaction holds the writer connection
+            with patient.engine.connect():
+                started = time.monotonic()
+                assert buffer.write("platform", "queued") is None
+                assert 0.1 <= time.monotonic() - started < 1
+            assert buffer.flush(timeout=5)
+            
+            # So does another process's lock, with a long busy timeout
+            holder = lock(db_path)
+            try:
+                started = time.monotonic()
+                assert buffer.write("platform", "locked") is None
+                assert 0.1 <= time.monotonic() - started < 1
+            finally:
+                holder.rollback()
+                holder.close()
+            
+            assert buffer.flush(timeout=5)
+            assert platform_names(patient) == ["queued", "locked"]
+        finally:
+            buffer.close()
+            patient.dispose()
+    
+    def test_short_waits_do_not_buffer(self, db, db_path):
+        """Test that a writer busy for less than max_wait is waited for."""
+        buffer = WriteBehindBuffer(db, {"platform": add_platform}, max_wait=2)
+        try:
+            # Another thread's transaction, then another process's lock
+            connection = db.engine.connect()
+            threading.Timer(0.1, connection.close).start()
+            buffer.write("platform", "after thread")
+            
+            holder = lock(db_path)
+            threading.Timer(0.1, holder.rollback).start()
+            buffer.write("platform", "after process")
+            holder.close()
+            
+            assert len(buffer) == 0
+            assert platform_names(db) == ["after thread", "after process"]
+        finally:
+            buffer.close()
+    
+    def test_waiting_write_keeps_its_place(self, db, db_path):
+        """Test that a write made while an earlier one waits is committed after it."""
+        buffer = WriteBehindBuffer(db, {"platform": add_platform}, max_wait=2)
+        holder = lock(db_path)
+        try:
+            first = threading.Thread(target=buffer.write, args=("platform", "first"))
+            first.start()
+            time.sleep(0.1)
+            threading.Timer(0.1, holder.rollback).start()
+            buffer.write("platform", "second")
+            first.join()
+            
+            assert len(buffer) == 0
+            assert platform_names(db) == ["first", "second"]
+        finally:
+            holder.close()
+            buffer.close()
+    
+    def test_bad_writes_are_dropped(self, db, db_path):
+        """Test that a write that can never succeed does not block the rest."""
+        buffer = WriteBehindBuffer(db, {"platform": add_platform}, retry_interval=0.01)
+        holder = lock(db_path)
+        for name in ("a", "", "b"):
+            buffer.write("platform", name)
+        holder.rollback()
+        holder.close()
+        
+        assert buffer.flush(timeout=5)
+        buffer.close()
+        assert platform_names(db) == ["a", "b"]
+        assert [(kind, args) for kind, args, _ in buffer.failed] == [("platform", [""])]
+    
+    def test_spill_to_disk_survives_restart(self, db, db_path):
+        """Test that overflow goes to the spill file and is replayed after reopening."""
+        spill_path = db_path + ".spill"
+        holder = lock(db_path)
+        buffer = WriteBehindBuffer(db, {"platform": add_platform}, max_entries=2, spill_path=spill_path)
+        for i in range(5):
+            buffer.write("platform", f"p{i}")
+        assert len(buffer) == 5
+        assert [args[0] for _, args in buffer.pending()] == [f"p{i}" for i in range(5)]
+        buffer.close()
+        holder.rollback()
+        holder.close()
+        
+        reopened = WriteBehindBuffer(db, {"platform": add_platform}, max_entries=2,
+                                     spill_path=spill_path, retry_interval=0.01)
+        assert reopened.flush(timeout=5)
+        reopened.close()
+        assert platform_names(db) == [f"p{i}" for i in range(5)]
+    
+    def test_full_without_spill(self, db, db_path):
+        """Test that a full in-memory buffer rejects further writes."""
+        holder = lock(db_path)
+        buffer = WriteBehindBuffer(db, {"platform": add_platform}, max_entries=1)
+        try:
+            buffer.write("platform", "kept")
+            with pytest.raises(RuntimeError):
+                buffer.write("platform", "rejected")
+        finally:
+            buffer.close()
+            holder.rollback()
+            holder.close()
+
+class TestAPIWriteBuffer:
+    """Test that the API serves buffered writes to readers."""
+    
+    def test_reads_see_buffered_writes(self, db_path):
+        """Test buffered messages, conversations and knowledge are readable."""
+        callisto.initialize(db_path)
+        from callisto.api import api
+        user = api.create_user("Buffered", "discord", "buffered")
+        conversation_id = api.start_conversation(user.user_id, "discord")
+        
+        saved_policy = global_db.retry_policy
+        global_db.retry_policy = RetryPolicy(attempts=1)
+        global_db.pragmas["busy_timeout"] = 0
+        global_db.engine.dispose()
+        api.enable_write_buffer(retry_interval=0.01)
+        try:
+            holder = lock(db_path)
+            api.add_message(conversation_id, "while locked", True)
+            stored_id = api.store_conversation(user.user_id, "discord", [{"content": "hi", "is_from_user": True}])
+            api.store_knowledge(user.user_id, "likes", ["tea"])
+            
+            assert [m["content"] for m in api.get_conversation_history(conversation_id)] == ["while locked"]
+            assert [m["content"] for m in api.get_conversation_history(stored_id)] == ["hi"]
+            assert stored_id in [c["conversation_id"] for c in api.get_recent_conversations(user.user_id)]
+            assert api.get_user_knowledge(user.user_id)["likes"]["value"] == ["tea"]
+            
+            holder.rollback()
+            holder.close()
+            assert api.flush_write_buffer(timeout=5)
+            
+            history = api.get_conversation_history(conversation_id)
+            assert [m["content"] for m in history] == ["while locked"]
+            assert history[0]["message_id"] is not None
+            assert api.get_user_knowledge(user.user_id)["likes"]["value"] == ["tea"]
+        finally:
+            api.disable_write_buffer()
+            global_db.retry_policy = saved_policy
@@ -0,0 +1,80 @@
+"""Token counting for context-window budgets.
+
+Every message stores its length in tokens (``Message.token_count``),
+counted when it is inserted, so a context window can be cut off by the
+database instead of by fetching and measuring the whole history. The
+tokenizer is pluggable: call set_tokenizer() with the model's own counter
+for exact budgets. The default is a local approximation that counts words
+and punctuation, with long words counted as one token per six characters,
+which tracks common BPE tokenizers on chat text closely enough for
+budgeting.
+
+Counts are stored, so messages written under a different tokenizer keep
+their old counts until recount_tokens() is run.
+"""
+import html
+import re
+import threading
+from typing import Callable, Optional
+
+from sqlalchemy.engine import Connection
+
+from .compression import decode
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+_lock = threading.Lock()
+
+
+def approximate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text without a model vocabulary."""
+    return sum((len(token) + 5) // 6 for token in _TOKEN.findall(html.unescape(text)))
+
+
+_tokenizer: Callable[[str], int] = approximate_tokens
+
+
+def set_tokenizer(tokenizer: Optional[Callable[[str], int]]) -> None:
+    """Count tokens of new messages with tokenizer (None restores the default)."""
+    global _tokenizer
+    with _lock:
+        _tokenizer = tokenizer if tokenizer is not None else approximate_tokens
+
+
+def count_tokens(text: str) -> int:
+    """Return the stored token count for a message; every message costs at least one."""
+    return max(1, int(_tokenizer(text)))
+
+
+def default_token_count(context) -> int:
+    """Column default for Message.token_count, computed from the inserted content."""
+    return count_tokens(context.get_current_parameters()["content"])
+
+
+def fill_token_counts(conn: Connection, after_id: int = 0, only_missing: bool = True,
+                      batch_size: int = 1000) -> Optional[int]:
+    """Count tokens for one batch of messages after after_id.
+    
+    Returns the last message_id counted, to pass back in for the next
+    batch, or None once there are no more messages.
+    """
+    missing = "AND token_count IS NULL" if only_missing else ""
+    # Raw values: this also runs inside migrations, before any ORM use
+    rows = conn.exec_driver_sql(
+        f"SELECT message_id, content FROM messages WHERE message_id > ? {missing} "
+        "ORDER BY message_id LIMIT ?", (after_id, batch_size)).fetchall()
+    if not rows:
+        return None
+    conn.exec_driver_sql("UPDATE messages SET token_count = ? WHERE message_id = ?",
+                         [(count_tokens(decode(content)), message_id) for message_id, content in rows])
+    return rows[-1][0]
+
+
+def recount_tokens(database) -> None:
+    """Recount every message of a database (or ShardRouter) with the current tokenizer."""
+    for shard in database.shards:
+        last_id = 0
+        while last_id is not None:
+            # One batch per transaction, so foreground writes get the writer in between
+            with shard.session() as session:
+                last_id = fill_token_counts(session.connection(), last_id, only_missing=False)
@@ -0,0 +1,265 @@
+"""Write-behind buffer that keeps writes flowing while the database is unavailable."""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+from .db import Database, RetryPolicy
+
+# SQLite errors meaning the database cannot take writes right now
+UNAVAILABLE_ERRORS = ("unable to open database", "disk i/o error", "database or disk is full")
+
+def is_unavailable(error: Exception) -> bool:
+    """Return True if a write failed because the database is busy or unreachable."""
+    if isinstance(error, PoolTimeoutError):
+        # The writer connection is taken (see Database.session(wait=False))
+        # or was not freed within WRITER_QUEUE_TIMEOUT
+        return True
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error.orig if error.orig is not None else error).lower()
+    return RetryPolicy.is_transient(error) or any(text in message for text in UNAVAILABLE_ERRORS)
+
+def is_busy(error: Exception) -> bool:
+    """Return True if a write failed only because someone else is writing."""
+    return isinstance(error, PoolTimeoutError) or RetryPolicy.is_transient(error)
+
+
+class WriteBehindBuffer:
+    """Holds writes the database could not take and replays them in order.
+    
+    Each write is a named ``operation(session, *args)`` call with JSON
+    serializable arguments. While nothing is buffered, write() runs the call
+    directly, waiting up to ``max_wait`` seconds for the writer connection or
+    a lock held by another process. Once that wait runs out, or the database
+    is unreachable, the call is queued instead, and every later write queues
+    behind it so the original order is kept. A background thread replays the
+    queue, oldest first, as soon as the database accepts writes again.
+    
+    At most ``max_entries`` writes are held in memory. With a ``spill_path``
+    the overflow is appended to that file (one JSON object per line) and the
+    queue is saved there on close, so it also survives a restart; without one
+    write() raises RuntimeError when the buffer is full.
+    """
+    
+    def __init__(self, database: Database, operations: Dict[str, Callable[..., Any]],
+                 max_entries: int = 10000, spill_path: Optional[str] = None,
+                 retry_interval: float = 0.5, max_retry_interval: float = 10.0, batch_size: int = 100,
+                 max_wait: float = 0.5):
+        """Start the background replay thread."""
+        if max_entries < 1 or batch_size < 1:
+            raise ValueError("max_entries and batch_size must be at least 1")
+        if max_wait < 0:
+            raise ValueError("max_wait must not be negative")
+        
+        self.database = database
+        self.operations = operations
+        self.max_entries = max_entries
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        
+        self._memory = deque()
+        self._spilled = 0       # entries in the spill file not yet loaded
+        self._spill_offset = 0  # bytes of the spill file already loaded
+        # Writes that could not be replayed (e.g. their conversation is gone)
+        self.failed = deque(maxlen=1000)
+        
+        self._cond = threading.Condition()
+        self._closed = False
+        if spill_path and os.path.exists(spill_path):
+            with open(spill_path, "rb") as f:
+                self._spilled = sum(1 for line in f if line.strip())
+        
+        self._thread = threading.Thread(target=self._run, name="callisto-write-buffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def __len__(self) -> int:
+        """Return the number of writes waiting to be replayed."""
+        with self._cond:
+            return len(self._memory) + self._spilled
+    
+    def write(self, kind: str, *args) -> Any:
+        """Run a write now, or buffer it if the database cannot take it.
+        
+        Returns the operation's result, or None when the write was buffered.
+        """
+        if kind not in self.operations:
+            raise ValueError(f"Invalid write kind: {kind}")
+        
+        # Held through the direct write, so no write can overtake one buffered meanwhile
+        with self._cond:
+            if not (self._memory or self._spilled):
+                try:
+                    return self._write_now(kind, args)
+                except Exception as e:
+                    if not is_unavailable(e):
+                        raise
+            self._append({"kind": kind, "args": list(args), "queued_at": time.time()})
+        return None
+    
+    def pending(self, kind: Optional[str] = None) -> List[Tuple[str, list]]:
+        """Return buffered writes, oldest first, as (kind, args) pairs."""
+        with self._cond:
+            entries = list(self._memory) + list(self._read_spill(self._spilled, advance=False))
+        return [(e["kind"], e["args"]) for e in entries if kind is None or e["kind"] == kind]
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the buffer is empty; return False if timeout passes first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._memory or self._spilled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if self._closed or (remaining is not None and remaining <= 0):
+                    return False
+                self._cond.wait(remaining)
+        return True
+    
+    def close(self) -> None:
+        """Stop replaying; anything still buffered is saved to the spill file."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        
+        if self.spill_path:
+            with self._cond:
+                entries = list(self._memory) + list(self._read_spill(self._spilled, advance=False))
+                self._rewrite_spill(entries)
+                self._memory.clear()
+                self._spilled = len(entries)
+    
+    def _write_now(self, kind: str, args: tuple) -> Any:
+        """Run a write directly, retrying for up to max_wait while the database is busy."""
+        deadline = time.monotonic() + self.max_wait
+        attempt = 0
+        while True:
+            try:
+                # Polled rather than queued for the writer, so the wait stays bounded
+                with self.database.session(wait=False) as session:
+                    return self.operations[kind](session, *args)
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if not is_busy(e) or remaining <= 0:
+                    raise
+            time.sleep(min(self.database.retry_policy.delay(attempt), remaining))
+            attempt += 1
+    
+    # QUEUE
+    
+    def _append(self, entry: Dict[str, Any]) -> None:
+        """Queue an entry behind everything already buffered."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write buffer is closed")
+            if not self._spilled and len(self._memory) < self.max_entries:
+                self._memory.append(entry)
+            elif self.spill_path:
+                # Once spilling starts, newer entries must follow the spilled ones
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+                self._spilled += 1
+            else:
+                raise RuntimeError("Write buffer is full")
+            self._cond.notify_all()
+    
+    def _read_spill(self, count: int, advance: bool) -> Iterator[Dict[str, Any]]:
+        """Read up to count entries from the unread part of the spill file."""
+        if not count or not self.spill_path:
+            return
+        with open(self.spill_path, "rb") as f:
+            f.seek(self._spill_offset)
+            for _ in range(count):
+                line = f.readline()
+                if not line:
+                    break
+                if advance:
+                    self._spill_offset = f.tell()
+                if line.strip():
+                    yield json.loads(line)
+    
+    def _rewrite_spill(self, entries: List[Dict[str, Any]]) -> None:
+        """Replace the spill file with the given entries."""
+        with open(self.spill_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        self._spill_offset = 0
+    
+    def _refill(self) -> None:
+        """Move spilled entries back into memory once memory has drained."""
+        if self._memory or not self._spilled:
+            return
+        loaded = list(self._read_spill(min(self._spilled, self.max_entries), advance=True))
+        self._memory.extend(loaded)
+        self._spilled -= len(loaded)
+        if not self._spilled:
+            self._rewrite_spill([])
+    
+    # REPLAY
+    
+    def _run(self) -> None:
+        """Replay buffered writes until closed."""
+        delay = self.retry_interval
+        while True:
+            with self._cond:
+                while not self._closed and not (self._memory or self._spilled):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._refill()
+                batch = [self._memory[i] for i in range(min(self.batch_size, len(self._memory)))]
+            
+            if self._replay(batch):
+                delay = self.retry_interval
+                continue
+            
+            # Database still unavailable; back off before trying again
+            with self._cond:
+                self._cond.wait(delay)
+            delay = min(delay * 2, self.max_retry_interval)
+    
+    def _replay(self, batch: List[Dict[str, Any]]) -> bool:
+        """Commit a batch in one transaction; return False if the database is unavailable."""
+        try:
+            with self.database.session() as session:
+                for entry in batch:
+                    self.operations[entry["kind"]](session, *entry["args"])
+        except Exception as e:
+            if is_unavailable(e):
+                return False
+            # Something in the batch is bad; replay one by one to isolate it
+            return all(self._replay_one(entry) for entry in batch)
+        
+        self._done(len(batch))
+        return True
+    
+    def _replay_one(self, entry: Dict[str, Any]) -> bool:
+        """Replay a single entry, dropping it if it can never succeed."""
+        try:
+            with self.database.session() as session:
+                self.operations[entry["kind"]](session, *entry["args"])
+        except Exception as e:
+            if is_unavailable(e):
+                return False
+            self.failed.append((entry["kind"], entry["args"], repr(e)))
+        self._done(1)
+        return True
+    
+    def _done(self, count: int) -> None:
+        """Remove replayed entries from the head of the queue."""
+        with self._cond:
+            for _ in range(count):
+                self._memory.popleft()
+            self._cond.notify_all()